@@ -0,0 +1,161 @@
+"""
+This module reads the core metadata directly from the remote archives,
+without downloading them whole.
+"""
+from __future__ import annotations
+
+import io
+import re
+import tarfile
+import zipfile
+from typing import TYPE_CHECKING
+
+from pyp2spec.utils import Pyp2specError
+
+if TYPE_CHECKING:
+    from requests import Response, Session
+
+
+RANGE_BLOCK_SIZE = 64 * 1024
+WHEEL_METADATA = re.compile(r"^[^/]+\.dist-info/METADATA$")
+# Only the top-level PKG-INFO is the sdist metadata, not e.g. the one in *.egg-info
+SDIST_METADATA = re.compile(r"^(\./)?[^/]+/PKG-INFO$")
+CONTENT_RANGE = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+# The archives are read only partially, the caching session must not download them whole
+STREAM_HEADERS = {"Accept-Encoding": "identity", "Cache-Control": "no-store"}
+
+
+class RangeRequestsNotSupportedError(Pyp2specError):
+    """Raised when the server doesn't allow to download parts of a file"""
+
+
+class MetadataNotInArchiveError(Pyp2specError):
+    """Raised when the archive doesn't contain the core metadata file"""
+
+
+class HTTPRangeFile(io.RawIOBase):
+    """Read-only seekable file downloading only the parts which are read.
+
+    The data are fetched with HTTP Range requests, in blocks of at least
+    `block_size` bytes. The tail of the file is downloaded right away,
+    as that's where zip archives keep their central directory.
+    """
+
+    def __init__(self, url: str, session: Session, block_size: int = RANGE_BLOCK_SIZE) -> None:
+        super().__init__()
+        self.url = url
+        self.session = session
+        self.block_size = block_size
+        self.requests = 0
+        self._position = 0
+        # The downloaded parts of the file: (start offset, data)
+        self._spans: list[tuple[int, bytes]] = []
+        start, data, self.length = self._get_range(f"bytes=-{block_size}")
+        self._spans.append((start, data))
+
+    def _get_range(self, byte_range: str) -> tuple[int, bytes, int]:
+        self.requests += 1
+        headers = {"Range": byte_range, "Accept-Encoding": "identity"}
+        response: Response
+        with self.session.get(self.url, headers=headers, stream=True) as response:
+            if response.status_code != 206:
+                # 200 means the server would send the whole file, don't read it
+                raise RangeRequestsNotSupportedError(f"Partial download of {self.url} is not possible")
+            content_range = CONTENT_RANGE.match(response.headers.get("Content-Range", ""))
+            if content_range is None:
+                raise RangeRequestsNotSupportedError(f"Unexpected Content-Range of {self.url}")
+            return (int(content_range.group(1)), response.content, int(content_range.group(3)))
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.length
+        self._position = max(0, offset)
+        return self._position
+
+    def readinto(self, buffer: bytearray) -> int:  # type: ignore[override]
+        end = min(self._position + len(buffer), self.length)
+        size = end - self._position
+        if size <= 0:
+            return 0
+        data = self._read_span(self._position, end)
+        buffer[:size] = data
+        self._position = end
+        return size
+
+    def _read_span(self, start: int, end: int) -> bytes:
+        for span_start, span_data in self._spans:
+            if span_start <= start and end <= span_start + len(span_data):
+                return span_data[start - span_start:end - span_start]
+        fetch_end = min(max(end, start + self.block_size), self.length)
+        span_start, span_data, _ = self._get_range(f"bytes={start}-{fetch_end - 1}")
+        self._spans.append((span_start, span_data))
+        return span_data[start - span_start:end - span_start]
+
+
+def read_wheel_metadata(url: str, session: Session) -> str:
+    """Return the contents of the METADATA file of the remote wheel.
+
+    Only the central directory of the zip archive and the METADATA file itself
+    are downloaded, which is usually a few kilobytes.
+    """
+
+    with HTTPRangeFile(url, session) as remote_file:
+        try:
+            with zipfile.ZipFile(remote_file) as wheel:  # type: ignore[arg-type]
+                for name in wheel.namelist():
+                    if WHEEL_METADATA.match(name):
+                        return wheel.read(name).decode("utf-8")
+        except zipfile.BadZipFile as exc:
+            raise MetadataNotInArchiveError(f"{url} is not a valid wheel") from exc
+    raise MetadataNotInArchiveError(f"{url} doesn't contain the METADATA file")
+
+
+def _read_tar_sdist_metadata(url: str, session: Session) -> str:
+    with session.get(url, headers=STREAM_HEADERS, stream=True) as response:
+        response.raise_for_status()
+        try:
+            # Stream mode, the archive is decompressed on the fly as it's downloaded
+            with tarfile.open(fileobj=response.raw, mode="r|*") as sdist:
+                for member in sdist:
+                    if member.isfile() and SDIST_METADATA.match(member.name):
+                        # Closing the response stops the download of the rest
+                        return sdist.extractfile(member).read().decode("utf-8")  # type: ignore[union-attr]
+        except tarfile.TarError as exc:
+            raise MetadataNotInArchiveError(f"{url} is not a valid sdist") from exc
+    raise MetadataNotInArchiveError(f"{url} doesn't contain the PKG-INFO file")
+
+
+def _read_zip_sdist_metadata(url: str, session: Session) -> str:
+    with HTTPRangeFile(url, session) as remote_file:
+        try:
+            with zipfile.ZipFile(remote_file) as sdist:  # type: ignore[arg-type]
+                for name in sdist.namelist():
+                    if SDIST_METADATA.match(name):
+                        return sdist.read(name).decode("utf-8")
+        except zipfile.BadZipFile as exc:
+            raise MetadataNotInArchiveError(f"{url} is not a valid sdist") from exc
+    raise MetadataNotInArchiveError(f"{url} doesn't contain the PKG-INFO file")
+
+
+def read_sdist_metadata(url: str, filename: str, session: Session) -> str:
+    """Return the contents of the PKG-INFO file of the remote sdist.
+
+    Tarballs are read as a stream which is closed as soon as PKG-INFO is found,
+    legacy zip sdists are read with Range requests like wheels.
+    The archive is never held in memory whole.
+    """
+
+    if filename.endswith(".zip"):
+        return _read_zip_sdist_metadata(url, session)
+    return _read_tar_sdist_metadata(url, session)
@@ -0,0 +1,491 @@
+"""
+Generate config and spec files for many packages in a single process.
+
+The list of packages is read from a file (or stdin), one package per line:
+
+    click
+    sphinx==7.3.7
+    pytest compat=7
+    pello python-alt-version=3.12
+
+Allowed keys are `version`, `compat` and `python-alt-version`.
+Empty lines and lines starting with `#` are ignored.
+
+With `--recursive`, the missing dependencies of the packages are generated
+as well (see pyp2spec.dependencies), the extras to follow can be given
+as `sphinx[docs,test]`. The results are sorted in the build order.
+
+The data are downloaded by a pool of threads. Once they're cached, the processing
+of the data and the rendering of the files take most of the time, those can be
+spread over a pool of `--processes` processes.
+
+With `--incremental`, the inputs of the generated files are recorded
+in a manifest in the output directory (see pyp2spec.manifest) and the packages
+whose inputs didn't change since the previous run are skipped.
+"""
+from __future__ import annotations
+
+import json
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
+from typing import Any, IO, Iterable, Iterator, TYPE_CHECKING
+
+import click
+from requests import RequestException, Session
+
+from pyp2spec.conf2spec import ConfigFile, bytecode_cache_dir, load_template, save_spec_file, template_option
+from pyp2spec.dependencies import DependencyGraph, read_packaged_names
+from pyp2spec.fetcher import fetch_concurrently, DEFAULT_JOBS, DEFAULT_PER_HOST
+from pyp2spec.http_cache import session_cache
+from pyp2spec.license_processor import FEDORA_LICENSES, PARSED_EXPRESSIONS, get_licensing
+from pyp2spec.license_processor import load_fedora_licenses, load_trove2fedora_map
+from pyp2spec.profiling import collecting, merge_profile, profiling_enabled
+from pyp2spec.profiling import profile_option, profiling, timed
+from pyp2spec.manifest import MANIFEST_FILENAME, Manifest, fetched_inputs, metadata_fingerprint, package_key
+from pyp2spec.pyp2conf import complete_config_contents, gather_package_info
+from pyp2spec.pyp2conf import save_config, session_args, version_source_option
+from pyp2spec.pypi_loaders import PYPI_URL
+from pyp2spec.sessions import revalidating_session, session_from_options
+from pyp2spec.utils import Pyp2specError, create_compat_name
+from pyp2spec.utils import inform, warn, yay
+
+if TYPE_CHECKING:
+    from packaging.metadata import RawMetadata
+
+
+BATCH_KEYS = ("version", "compat", "python-alt-version")
+# The summary files written as JSON Lines, one result per line
+SUMMARY_LINES_SUFFIX = ".jsonl"
+# The threads waiting for the rendering processes merge their parsed expressions
+_parsed_expressions_lock = threading.Lock()
+
+
+class BatchFileError(Pyp2specError):
+    """Raised when a line of the package list can't be parsed"""
+
+
+def parse_package_line(line: str) -> dict[str, str] | None:
+    """Return the options for a single package parsed from the line.
+
+    Return None for the empty and comment lines.
+    """
+
+    line = line.split("#", 1)[0].strip()
+    if not line:
+        return None
+
+    package, *fields = line.split()
+    options = {}
+    if "==" in package:
+        package, options["version"] = package.split("==", 1)
+    if package.endswith("]") and "[" in package:
+        package, extras = package[:-1].split("[", 1)
+        options["extras"] = extras
+    options["package"] = package
+    for field in fields:
+        key, sep, value = field.partition("=")
+        if not sep or key not in BATCH_KEYS or not value:
+            raise BatchFileError(f"Invalid field `{field}` for package `{package}`")
+        options[key.replace("-", "_")] = value
+    return options
+
+
+def read_package_list(lines: Iterable[str]) -> list[dict[str, str]]:
+    """Return the list of options for every package in the list."""
+
+    packages = []
+    for line in lines:
+        if (options := parse_package_line(line)) is not None:
+            packages.append(options)
+    return packages
+
+
+def output_paths(contents: dict[str, Any], output_dir: str) -> tuple[str, str]:
+    """Return the paths of the config and spec file for the package."""
+
+    name = create_compat_name(contents["python_name"], contents.get("compat"))
+    basename = os.path.join(output_dir, name)
+    return (f"{basename}.conf", f"{basename}.spec")
+
+
+def render_package(
+    options: dict[str, Any],
+    core_metadata: RawMetadata | None,
+    pypi_pkg_data: dict[str, Any],
+    session: Session | None = None,
+) -> tuple[str, str, str]:
+    """Create and save the config and spec file from the fetched package data.
+
+    Return the package version and the paths of the config and spec file.
+    """
+
+    pkg_info = gather_package_info(core_metadata, pypi_pkg_data)
+    contents = complete_config_contents(pkg_info, options, session=session)
+    config_output, spec_output = output_paths(contents, options.get("output_dir", "."))
+    save_config(contents, config_output)
+    save_spec_file(ConfigFile(contents), {
+        "spec_output": spec_output,
+        "declarative_buildsystem": options.get("declarative_buildsystem", False),
+        "template": options.get("template"),
+        "cache_dir": options.get("cache_dir"),
+    })
+    return contents["pypi_version"], config_output, spec_output
+
+
+def _init_renderer(
+    options: dict[str, Any],
+    license_index: dict[str, bool],
+    parsed_expressions: dict[str, list[str] | None],
+) -> None:
+    """Load everything the packages share before the rendering process gets the first one."""
+
+    FEDORA_LICENSES.update(license_index)
+    PARSED_EXPRESSIONS.entries.update(parsed_expressions)
+    # Sent back to the main process to be stored for the next runs
+    PARSED_EXPRESSIONS.track_added()
+    load_trove2fedora_map()
+    get_licensing()
+    load_template(options.get("template"), bytecode_cache_dir(options))
+
+
+def _render_in_process(
+    options: dict[str, Any],
+    core_metadata: RawMetadata | None,
+    pypi_pkg_data: dict[str, Any],
+    profile: bool,
+) -> tuple[tuple[str, str, str] | Exception, dict[str, Any] | None, dict[str, list[str] | None]]:
+    """Run `render_package` in the rendering process.
+
+    Return its result (or the error it raised), the data of the profiler if `profile`
+    and the license expressions parsed meanwhile, for the main process to merge.
+    """
+
+    with collecting(profile) as profiler:
+        rendered: tuple[str, str, str] | Exception
+        try:
+            rendered = render_package(options, core_metadata, pypi_pkg_data)
+        except (Pyp2specError, NotImplementedError, RequestException) as exc:
+            rendered = exc
+    return rendered, profiler.export() if profiler else None, PARSED_EXPRESSIONS.take_added()
+
+
+def create_renderer(processes: int, options: dict[str, Any], session: Session) -> ProcessPoolExecutor:
+    """Return the pool of `processes` processes for `render_package`.
+
+    The processes get the license data and the parsed license expressions
+    of this process, the template is compiled here once and the processes
+    load its bytecode from the cache.
+    """
+
+    license_index = load_fedora_licenses(session) if options.get("fedora_compliant") else {}
+    load_template(options.get("template"), bytecode_cache_dir(options))
+    return ProcessPoolExecutor(
+        max_workers=processes,
+        # Forking a process with running threads (the downloads) is not safe
+        mp_context=multiprocessing.get_context("forkserver"),
+        initializer=_init_renderer,
+        initargs=(options, license_index, dict(PARSED_EXPRESSIONS.entries)),
+    )
+
+
+@timed("generate_package")
+def generate_package(
+    options: dict[str, Any],
+    fetched: Future,
+    session: Session | None = None,
+    manifest: Manifest | None = None,
+    inputs: dict[str, str | None] | None = None,
+    renderer: Executor | None = None,
+) -> dict[str, Any]:
+    """Create and save the config and spec file for a single package
+    from the data fetched by `fetch_concurrently`.
+
+    If the `manifest` is given, the package is not generated again
+    when the fetched data and the other `inputs` didn't change since the previous run,
+    otherwise the new inputs are recorded in it.
+    The files are rendered by the `renderer` pool if given, in this process otherwise.
+    Return the summary of the result, errors are reported in it, not raised.
+    """
+
+    result: dict[str, Any] = {"package": options["package"]}
+    key = package_key(options)
+    try:
+        core_metadata, pypi_pkg_data = fetched.result()
+        metadata = metadata_fingerprint(core_metadata, pypi_pkg_data)
+        if inputs is not None:
+            inputs = fetched_inputs(inputs, pypi_pkg_data)
+        if manifest is not None and inputs is not None and manifest.is_unchanged(key, inputs, metadata):
+            manifest.update(key, inputs)
+            return {**result, **manifest.result(key)}
+        if renderer is None:
+            version, config_output, spec_output = render_package(options, core_metadata, pypi_pkg_data, session)
+        else:
+            rendered, profile, parsed_expressions = renderer.submit(
+                _render_in_process, options, core_metadata, pypi_pkg_data, profiling_enabled()
+            ).result()
+            merge_profile(profile)
+            with _parsed_expressions_lock:
+                for expression, identifiers in parsed_expressions.items():
+                    PARSED_EXPRESSIONS.put(expression, identifiers)
+            if isinstance(rendered, Exception):
+                raise rendered
+            version, config_output, spec_output = rendered
+    except (Pyp2specError, NotImplementedError, RequestException) as exc:
+        warn(f"Generating `{options['package']}` failed: {exc}")
+        result.update(status="error", error=str(exc))
+    else:
+        result.update(status="ok", version=version, config=config_output, spec=spec_output)
+        if manifest is not None and inputs is not None:
+            manifest.update(key, inputs, metadata, version=version, config=config_output, spec=spec_output)
+    return result
+
+
+def ordered_results(graph: DependencyGraph, results: dict[int, dict[str, Any]]) -> list[dict[str, Any]]:
+    """Return the results of all the packages of the graph in the build order,
+    with the dependencies of each one under `requires`."""
+
+    order, cycles = graph.build_order()
+    for cycle in cycles:
+        names = [graph.nodes[key]["package"] for key in cycle]
+        warn(f"Dependency cycle {' -> '.join(reversed(names))} was broken for the build order")
+    return [
+        {
+            **results[id(graph.nodes[key])],
+            "requires": sorted(graph.nodes[dependency]["package"] for dependency in graph.edges[key]),
+        }
+        for key in order
+    ]
+
+
+def iter_batch(
+    all_options: list[dict[str, Any]],
+    options: dict[str, Any],
+    session: Session | None = None,
+    graph: DependencyGraph | None = None,
+) -> Iterator[tuple[dict[str, Any], dict[str, Any]]]:
+    """Generate the files for the packages given by `all_options`,
+    the common `options` merged with those of each package.
+
+    The data are downloaded concurrently by `jobs` threads, with at most
+    `per_host` simultaneous connections to a single host. Each package
+    is processed as soon as its data arrive, by one of `processes`
+    processes if there are more than one.
+    With the `incremental` option, only the packages whose inputs changed
+    since the previous run are generated.
+    If the dependency `graph` is given, the dependencies of the packages
+    are added to it and generated as well.
+    Yield the options and the result of each package as soon as it's done,
+    nothing is kept for the packages already yielded.
+    """
+
+    session = session or session_from_options(
+        options,
+        pool_size=options.get("per_host") or DEFAULT_PER_HOST,
+        pool_block=True,
+    )
+    jobs = options.get("jobs") or DEFAULT_JOBS
+    cache = session_cache(session, PYPI_URL)
+    PARSED_EXPRESSIONS.load(cache)
+
+    manifest = None
+    # The inputs by the id of the package options
+    inputs: dict[int, dict[str, str | None]] = {}
+    pending = all_options
+    fetch_session = session
+    if options.get("incremental"):
+        manifest = Manifest.load(os.path.join(options.get("output_dir", "."), MANIFEST_FILENAME))
+        fingerprints = manifest.input_fingerprints(all_options, session, jobs=jobs)
+        pending = []
+        for package_options, package_inputs in zip(all_options, fingerprints):
+            key = package_key(package_options)
+            inputs[id(package_options)] = package_inputs
+            if manifest.is_fresh(key, package_inputs):
+                yield package_options, {"package": package_options["package"], **manifest.result(key)}
+            else:
+                pending.append(package_options)
+        # The cached data of the changed projects may be older than their serials
+        fetch_session = revalidating_session(session)
+
+    if graph is not None:
+        pending = graph.add_roots(pending)
+
+    processes = options.get("processes") or 1
+    with ExitStack() as stack:
+        renderer = waiters = None
+        if processes > 1 and pending:
+            renderer = stack.enter_context(create_renderer(processes, options, session))
+            # The threads waiting for the rendering processes
+            waiters = stack.enter_context(ThreadPoolExecutor(max_workers=processes))
+            # Don't keep the data of more packages in memory than the processes can take
+            slots = threading.BoundedSemaphore(2 * processes)
+        generating: dict[int, tuple[dict[str, Any], Future]] = {}
+        discover = graph.discover if graph is not None else None
+        for package_options, fetched in fetch_concurrently(pending, fetch_session, jobs=jobs, discover=discover):
+            i = id(package_options)
+            if waiters is None:
+                yield package_options, generate_package(package_options, fetched, session, manifest, inputs.get(i))
+                continue
+            slots.acquire()
+            future = waiters.submit(
+                generate_package, package_options, fetched, session, manifest, inputs.get(i), renderer
+            )
+            future.add_done_callback(lambda _: slots.release())
+            generating[i] = (package_options, future)
+            for i in [i for i, (_, future) in generating.items() if future.done()]:
+                package_options, future = generating.pop(i)
+                yield package_options, future.result()
+        for package_options, future in generating.values():
+            yield package_options, future.result()
+    PARSED_EXPRESSIONS.store(cache)
+    if manifest is not None:
+        manifest.store()
+
+
+def run_batch(
+    packages: list[dict[str, str]],
+    options: dict[str, Any],
+    session: Session | None = None,
+    packaged: Iterable[str] = (),
+) -> list[dict[str, Any]]:
+    """Generate the files for all the packages using the common options, see iter_batch().
+
+    With the `recursive` option, the dependencies not listed in `packaged`
+    (normalized names) are generated as well.
+    Return the list of the per-package results, in the order of `packages`,
+    or in the build order of all the generated packages if `recursive`.
+    """
+
+    all_options = [{**options, **package} for package in packages]
+    graph = DependencyGraph(packaged) if options.get("recursive") else None
+    # The results by the id of the package options
+    results = {
+        id(package_options): result
+        for package_options, result in iter_batch(all_options, options, session, graph)
+    }
+    if graph is not None:
+        return ordered_results(graph, results)
+    return [results[id(package_options)] for package_options in all_options]
+
+
+def stream_summary(results: Iterable[dict[str, Any]], output: str) -> Iterator[dict[str, Any]]:
+    """Write each of the results to `output` as a line of JSON as soon as it's available,
+    pass the results through."""
+
+    with open(output, "w", encoding="utf-8") as f:
+        for result in results:
+            f.write(json.dumps(result) + "\n")
+            f.flush()
+            yield result
+
+
+def save_summary(results: list[dict[str, Any]], output: str) -> None:
+    if output.endswith(SUMMARY_LINES_SUFFIX):
+        for _ in stream_summary(results, output):
+            pass
+        return
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+
+@click.command()
+@click.argument("package_list", type=click.File("r"), default="-")
+@click.option(
+    "--output-dir", "-d", default=".",
+    type=click.Path(file_okay=False, writable=True),
+    help="Directory where config and spec files will be saved, default: current directory",
+)
+@click.option(
+    "--summary", "-s",
+    help="Save the per-package results to the given JSON file, "
+         "written progressively as JSON Lines if the name ends with .jsonl",
+)
+@click.option(
+    "--fedora-compliant", is_flag=True,
+    help="Check whether license is compliant with Fedora",
+)
+@click.option(
+    "--automode", "-a", is_flag=True,
+    help="Enable buildability of the generated spec in automated environments",
+)
+@click.option(
+    "--declarative-buildsystem", is_flag=True, default=False,
+    help="Create spec files with pyproject declarative buildsystem (experimental)",
+)
+@template_option
+@version_source_option
+@click.option(
+    "--jobs", "-j", type=int, default=DEFAULT_JOBS,
+    help=f"Number of packages downloaded concurrently, default: {DEFAULT_JOBS}",
+)
+@click.option(
+    "--per-host", type=int, default=DEFAULT_PER_HOST,
+    help=f"Maximum of simultaneous connections to a single host, default: {DEFAULT_PER_HOST}",
+)
+@click.option(
+    "--processes", "-P", type=int, default=1,
+    help="Number of processes processing the data and rendering the files, default: 1",
+)
+@click.option(
+    "--incremental", is_flag=True, envvar="PYP2SPEC_INCREMENTAL",
+    help=f"Skip the packages whose inputs didn't change since the previous run, "
+         f"recorded in {MANIFEST_FILENAME} in the output directory",
+)
+@click.option(
+    "--recursive", "-r", is_flag=True,
+    help="Also generate the dependencies of the packages which are not packaged yet",
+)
+@click.option(
+    "--packaged", type=click.File("r"),
+    help="File listing the already packaged projects (or their Fedora components) "
+         "not generated with --recursive, one per line",
+)
+@session_args
+@profile_option
+def main(package_list: IO[str], **options: dict[str, Any]) -> None:
+    """Generate config and spec files for all packages listed in PACKAGE_LIST.
+
+    Read the list from stdin if PACKAGE_LIST is not given or is "-".
+    """
+    try:
+        if options["automode"] and options["declarative_buildsystem"]:
+            raise Pyp2specError("Declarative buildsystem doesn't work with automode")
+        if options["recursive"] and options["incremental"]:
+            raise Pyp2specError("The incremental mode doesn't work with --recursive")
+        packages = read_package_list(package_list)
+        packaged_list = options.pop("packaged")
+        packaged = read_packaged_names(packaged_list) if packaged_list else set()
+    except Pyp2specError as exc:
+        warn(f"Fatal exception occurred: {exc}")
+        sys.exit(1)
+
+    os.makedirs(options["output_dir"], exist_ok=True)
+    summary = options["summary"]
+    with profiling(options["profile"]):
+        if summary is not None and summary.endswith(SUMMARY_LINES_SUFFIX) and not options["recursive"]:
+            # Written as the packages are done, the build order needs all of them
+            all_options = [{**options, **package} for package in packages]
+            results = list(stream_summary((result for _, result in iter_batch(all_options, options)), summary))
+        else:
+            results = run_batch(packages, options, packaged=packaged)
+            if summary is not None:
+                save_summary(results, summary)
+
+    failed = [r["package"] for r in results if r["status"] == "error"]
+    unchanged = [r["package"] for r in results if r["status"] == "unchanged"]
+    message = f"Generated files for {len(results) - len(failed) - len(unchanged)} of {len(results)} packages"
+    if unchanged:
+        message += f", {len(unchanged)} unchanged"
+    yay(message)
+    if options["recursive"]:
+        inform(f"Build order: {' '.join(r['package'] for r in results if r['status'] != 'error')}")
+    if failed:
+        warn(f"Failed packages: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,10 @@
 from __future__ import annotations
 
+import os
 import sys
 
-from importlib.resources import files
-from typing import Any
+from functools import lru_cache
+from typing import Any, TYPE_CHECKING
 
 import click
 
@@ -12,12 +13,15 @@ try:
 except ImportError:
     import tomli as tomllib  # type: ignore
 
-from jinja2 import Template
-
-from pyp2spec.rpmversion import RpmVersion
-from pyp2spec.utils import Pyp2specError, create_compat_name
+from pyp2spec.profiling import profile_option, profiling, timed
+from pyp2spec.utils import Pyp2specError, create_compat_name, write_if_changed
 from pyp2spec.utils import warn, yay
 
+if TYPE_CHECKING:
+    from jinja2 import Environment, Template
+
+    from pyp2spec.variants import Variant
+
 
 TEMPLATE_FILENAME = "template.spec"
 ADDITIONAL_BUILD_REQUIRES_ARCHFUL = ["gcc"]
@@ -100,6 +104,8 @@ def convert_version_to_rpm_scheme(version: str) -> str:
     Automatic conversion of the LegacyVersions is not feasible, as stated in:
     https://lists.fedoraproject.org/archives/list/python-devel@lists.fedoraproject.org/message/5MGEHMTKOKR5U7ACIMUDRBKMSP6Y5NQD/
     """
+    from pyp2spec.rpmversion import RpmVersion
+
     return str(RpmVersion(version))
 
 
@@ -167,56 +173,153 @@ def pypi_version_or_macro(pypi_version: str) -> str:
     return pypi_version
 
 
-def fill_in_template(config: ConfigFile, declarative_buildsystem: bool) -> str:
-    """Return template rendered with data from config file."""
+@lru_cache(maxsize=None)
+def get_template_environment(
+    template_dir: str | None = None,
+    bytecode_cache_dir: str | None = None,
+) -> Environment:
+    """Return the process-wide Jinja environment loading templates from `template_dir`,
+    or from the pyp2spec package if not given.
+
+    The environment keeps the compiled templates, so each one is compiled
+    only once per process. The compiled bytecode is also stored
+    in `bytecode_cache_dir` (or in the system's temporary directory)
+    and reused by the next processes.
+    """
+
+    # Not needed e.g. for `--help`, jinja2 takes long to import
+    from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, PackageLoader
+
+    if bytecode_cache_dir is not None:
+        os.makedirs(bytecode_cache_dir, exist_ok=True)
+    return Environment(
+        loader=FileSystemLoader(template_dir) if template_dir else PackageLoader("pyp2spec", ""),
+        bytecode_cache=FileSystemBytecodeCache(bytecode_cache_dir),
+    )
+
+
+def load_template(template: str | None = None, bytecode_cache_dir: str | None = None) -> Template:
+    """Return the compiled spec file template.
+
+    `template` is the path to a custom template overriding the one of pyp2spec.
+    """
+
+    if template is None:
+        return get_template_environment(None, bytecode_cache_dir).get_template(TEMPLATE_FILENAME)
+    template_dir, template_name = os.path.split(os.path.abspath(template))
+    return get_template_environment(template_dir, bytecode_cache_dir).get_template(template_name)
 
-    with (files("pyp2spec") / TEMPLATE_FILENAME).open("r", encoding="utf-8") as f:
-        spec_template = Template(f.read())
+
+def shared_template_data(config: ConfigFile) -> dict[str, Any]:
+    """Return the template data computed from the package data,
+    those are the same for all the variants of the package."""
 
     license, license_notice = get_license_string(config)
 
     pypi_version = config.get_string("pypi_version")
 
-    result = spec_template.render(
+    return dict(
         additional_build_requires=list_additional_build_requires(config),
         archful=config.get_bool("archful"),
         archive_name=archive_basename(config, pypi_version),
-        automode=config.get_bool("automode"),
         compat=config.get_string("compat"),
         compat_name=create_compat_name(config.get_string("pypi_name"), config.get_string("compat")),
-        declarative_buildsystem=declarative_buildsystem,
         extras=",".join(config.get_list("extras")),
         license=license,
         license_notice=license_notice,
         mandate_license=config.get_bool("license_files_present"),
         name=config.get_string("pypi_name"),
-        python_compat_name=create_compat_name(config.get_string("python_name"), config.get_string("compat")),
         pypi_version=pypi_version_or_macro(pypi_version),
-        python_alt_version=config.get_string("python_alt_version"),
         source=source(config, pypi_version),
         summary=config.get_string("summary"),
         test_top_level=config.get_bool("test_top_level"),
-        python3_pkgversion=python3_pkgversion_or_3(config),
         url=config.get_string("url"),
         version=convert_version_to_rpm_scheme(pypi_version),
     )
 
+
+def variant_template_data(config: ConfigFile, declarative_buildsystem: bool) -> dict[str, Any]:
+    """Return the template data set by the variant's options."""
+
+    return dict(
+        automode=config.get_bool("automode"),
+        declarative_buildsystem=declarative_buildsystem,
+        python_compat_name=create_compat_name(config.get_string("python_name"), config.get_string("compat")),
+        python_alt_version=config.get_string("python_alt_version"),
+        python3_pkgversion=python3_pkgversion_or_3(config),
+    )
+
+
+@timed("fill_in_template")
+def fill_in_template(
+    config: ConfigFile,
+    declarative_buildsystem: bool,
+    template: str | None = None,
+    bytecode_cache_dir: str | None = None,
+) -> str:
+    """Return template rendered with data from config file."""
+
+    spec_template = load_template(template, bytecode_cache_dir)
+
+    result = spec_template.render(
+        **shared_template_data(config),
+        **variant_template_data(config, declarative_buildsystem),
+    )
+
     return result
 
 
+@timed("fill_in_template")
+def fill_in_template_variants(
+    configs: list[ConfigFile],
+    variants: list[Variant],
+    template: str | None = None,
+    bytecode_cache_dir: str | None = None,
+) -> list[str]:
+    """Return the template rendered for each of the variants of the package.
+
+    `configs` are the variants' config files, created from the same package data,
+    so the data not depending on the variant are computed only once.
+    """
+
+    spec_template = load_template(template, bytecode_cache_dir)
+    shared_data = shared_template_data(configs[0])
+    return [
+        spec_template.render(**shared_data, **variant_template_data(config, variant.declarative_buildsystem))
+        for config, variant in zip(configs, variants)
+    ]
+
+
+def bytecode_cache_dir(options: dict[str, Any]) -> str | None:
+    # The compiled templates are kept next to the downloaded data, if those are cached
+    cache_dir = options.get("cache_dir")
+    return os.path.join(cache_dir, "templates") if cache_dir else None
+
+
+def render_spec(config: ConfigFile, options: dict[str, Any]) -> str:
+    """Return the spec file rendered with the template and cache given in `options`."""
+
+    return fill_in_template(
+        config,
+        options.get("declarative_buildsystem", False),
+        options.get("template"),
+        bytecode_cache_dir(options),
+    )
+
+
 def save_spec_file(config: ConfigFile, options: dict[str, Any]) -> str:
     """Save the spec file in the current directory if custom output is not set.
     Return the saved file name."""
 
-    declarative_buildsystem = options.get("declarative_buildsystem", False)
-    result = fill_in_template(config, declarative_buildsystem)
+    result = render_spec(config, options)
     output = options.get("spec_output")
     if output is None:
         output = create_compat_name(config.get_string("python_name"), config.get_string("compat"))
         output += ".spec"
-    with open(output, "w", encoding="utf-8") as spec_file:
-        spec_file.write(result)
-    yay(f"Spec file was saved successfully to '{output}'")
+    if write_if_changed(output, result.encode("utf-8")):
+        yay(f"Spec file was saved successfully to '{output}'")
+    else:
+        yay(f"Spec file '{output}' is up to date")
     return output
 
 
@@ -226,6 +329,13 @@ def create_spec_file(config_file: str, options: dict[str, Any]) -> str | None:
     return save_spec_file(config, options)
 
 
+def template_option(func):  # noqa
+    return click.option(
+        "--template", type=click.Path(exists=True, dir_okay=False), envvar="PYP2SPEC_TEMPLATE",
+        help="Use a custom spec file template instead of the one provided by pyp2spec",
+    )(func)
+
+
 @click.command()
 @click.argument("config")
 @click.option(
@@ -237,9 +347,12 @@ def create_spec_file(config_file: str, options: dict[str, Any]) -> str | None:
     "--declarative-buildsystem", is_flag=True, default=False,
     help="Create a spec file with pyproject declarative buildsystem (experimental)",
 )
+@template_option
+@profile_option
 def main(config: str, **options: dict[str, Any]) -> None:
     try:
-        create_spec_file(config, options)
+        with profiling(options["profile"]):
+            create_spec_file(config, options)
     except (Pyp2specError, NotImplementedError) as exc:
         warn(f"Fatal exception occurred: {exc}")
         sys.exit(1)
@@ -0,0 +1,183 @@
+"""
+Closure of the runtime dependencies of packages, as declared by `Requires-Dist`.
+
+The requirements are followed with their extras, the environment markers
+are evaluated for the Fedora target (Linux, the interpreter's Python version
+or the alternative one of the package). The packages already available,
+e.g. listed by
+
+    dnf repoquery --qf '%{name}' --whatprovides 'python3dist(*)'
+
+are neither generated nor followed, their names are compared normalized
+with the `python-`/`python3-` prefix stripped.
+
+The dependencies are generated in the latest version available,
+the version specifiers of the requirements are not taken into account.
+"""
+from __future__ import annotations
+
+from concurrent.futures import Future
+from graphlib import CycleError, TopologicalSorter
+from typing import Any, Iterable, Optional, TYPE_CHECKING
+
+from requests import RequestException
+
+from pyp2spec.utils import Pyp2specError, normalize_name, warn
+
+if TYPE_CHECKING:
+    from packaging.requirements import Requirement
+
+
+# The markers of the target platform, the rest comes from the running interpreter
+TARGET_ENVIRONMENT = {"os_name": "posix", "sys_platform": "linux", "platform_system": "Linux"}
+PACKAGED_PREFIXES = ("python3-", "python-")
+# The options given by the package list, the dependencies don't inherit them
+PER_PACKAGE_OPTIONS = ("version", "compat", "extras")
+
+# The normalized name, the compat version and the alternative Python version
+NodeKey = tuple[str, Optional[str], Optional[str]]
+
+
+def marker_environment(python_alt_version: str | None = None) -> dict[str, str]:
+    """Return the environment the markers of the package's requirements are evaluated in."""
+
+    from packaging.markers import default_environment
+
+    environment = {**default_environment(), **TARGET_ENVIRONMENT}
+    if python_alt_version is not None:
+        environment["python_version"] = python_alt_version
+        environment["python_full_version"] = f"{python_alt_version}.0"
+    return environment
+
+
+def required(
+    requires_dist: Iterable[str],
+    extras: Iterable[str],
+    environment: dict[str, str],
+) -> list[Requirement]:
+    """Return the requirements applying to the package installed with `extras`."""
+
+    from packaging.requirements import InvalidRequirement, Requirement
+
+    requirements = []
+    for requirement_string in requires_dist:
+        try:
+            requirement = Requirement(requirement_string)
+        except InvalidRequirement as exc:
+            warn(f"Ignoring invalid requirement `{requirement_string}`: {exc}")
+            continue
+        if requirement.marker is None or any(
+            requirement.marker.evaluate({**environment, "extra": extra}) for extra in ("", *extras)
+        ):
+            requirements.append(requirement)
+    return requirements
+
+
+def read_packaged_names(lines: Iterable[str]) -> set[str]:
+    """Return the normalized names of the packaged projects listed one per line.
+
+    The names may be the Fedora component names, e.g. `python3-requests`.
+    """
+
+    names = set()
+    for line in lines:
+        if (name := line.split("#", 1)[0].strip()):
+            name = normalize_name(name)
+            for prefix in PACKAGED_PREFIXES:
+                name = name.removeprefix(prefix)
+            names.add(name)
+    return names
+
+
+def node_key(options: dict[str, Any]) -> NodeKey:
+    return (normalize_name(options["package"]), options.get("compat"), options.get("python_alt_version"))
+
+
+class DependencyGraph:
+    """The packages to generate and the dependencies among them.
+
+    The nodes are discovered as the data of their dependents are fetched,
+    pass `discover` to `fetch_concurrently`.
+    """
+
+    def __init__(self, packaged: Iterable[str] = ()) -> None:
+        self.packaged = set(packaged)
+        self.nodes: dict[NodeKey, dict[str, Any]] = {}
+        self.edges: dict[NodeKey, set[NodeKey]] = {}
+        # The extras each node is required with and the requirements of the fetched nodes
+        self.extras: dict[NodeKey, set[str]] = {}
+        self.requires_dist: dict[NodeKey, list[str]] = {}
+
+    def add_roots(self, all_options: Iterable[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Add the packages to generate, return them without the duplicates."""
+
+        roots = []
+        for options in all_options:
+            key = node_key(options)
+            extras = set(filter(None, options.get("extras", "").split(",")))
+            if key in self.nodes:
+                self.extras[key] |= extras
+                continue
+            self.nodes[key] = options
+            self.edges[key] = set()
+            self.extras[key] = extras
+            roots.append(options)
+        return roots
+
+    def discover(self, options: dict[str, Any], fetched: Future) -> list[dict[str, Any]]:
+        """Add the dependencies of the fetched package, return the new ones to fetch."""
+
+        try:
+            core_metadata, pypi_pkg_data = fetched.result()
+        except (Pyp2specError, NotImplementedError, RequestException):
+            # Reported when the package is generated
+            return []
+        key = node_key(options)
+        metadata = core_metadata or pypi_pkg_data.get("info") or {}
+        self.requires_dist[key] = metadata.get("requires_dist") or []
+        return self._follow(key)
+
+    def _follow(self, key: NodeKey) -> list[dict[str, Any]]:
+        options = self.nodes[key]
+        environment = marker_environment(options.get("python_alt_version"))
+        new = []
+        for requirement in required(self.requires_dist[key], self.extras[key], environment):
+            name = normalize_name(requirement.name)
+            if name in self.packaged:
+                continue
+            dependency_key = (name, None, options.get("python_alt_version"))
+            # The packages often require their own extras
+            if dependency_key != key:
+                self.edges[key].add(dependency_key)
+            if dependency_key not in self.nodes:
+                dependency = {k: v for k, v in options.items() if k not in PER_PACKAGE_OPTIONS}
+                dependency["package"] = requirement.name
+                self.nodes[dependency_key] = dependency
+                self.edges[dependency_key] = set()
+                self.extras[dependency_key] = set(requirement.extras)
+                new.append(dependency)
+            elif not requirement.extras <= self.extras[dependency_key]:
+                self.extras[dependency_key] |= requirement.extras
+                # Already fetched, only the requirements of the new extras are missing
+                if dependency_key in self.requires_dist:
+                    new.extend(self._follow(dependency_key))
+        return new
+
+    def build_order(self) -> tuple[list[NodeKey], list[list[NodeKey]]]:
+        """Return the nodes sorted so that each one follows its dependencies.
+
+        The dependency cycles are broken, return them as well.
+        """
+
+        edges = {key: set(dependencies) for key, dependencies in self.edges.items()}
+        cycles = []
+        while True:
+            try:
+                # Sorted for a stable order of the independent nodes
+                sorter = TopologicalSorter({key: sorted(edges[key], key=str) for key in sorted(edges, key=str)})
+                return list(sorter.static_order()), cycles
+            except CycleError as exc:
+                # Each node of the cycle is a dependency of the next one
+                cycle = exc.args[1]
+                edges[cycle[1]].discard(cycle[0])
+                cycles.append(cycle[:-1])
@@ -0,0 +1,73 @@
+"""
+Download the data of many packages from PyPI concurrently.
+
+The network round-trips dominate the time needed to generate
+a package, so they're made from a pool of threads while the results
+are consumed (and processed) by the caller as soon as they arrive.
+"""
+from __future__ import annotations
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Iterable, Iterator
+
+from requests import Session
+
+from pyp2spec.pyp2conf import fetch_package_data
+
+
+DEFAULT_JOBS = 8
+DEFAULT_PER_HOST = 4
+
+
+def fetch_concurrently(
+    packages: Iterable[dict[str, Any]],
+    session: Session,
+    jobs: int = DEFAULT_JOBS,
+    discover: Callable[[dict[str, Any], Future[Any]], Iterable[dict[str, Any]]] | None = None,
+) -> Iterator[tuple[dict[str, Any], Future[Any]]]:
+    """Fetch the data for the packages using `jobs` threads.
+
+    Yield the tuples of the package options and the finished future,
+    in the order in which the downloads finish. Calling `result()` on the
+    future returns what `fetch_package_data` returns or raises its exception.
+    No more than `jobs` packages are in flight at once.
+    To limit the number of simultaneous requests to a single host,
+    use a session with blocking connection pools (`pool_block=True`).
+    If `discover` is given, it's called with each finished package
+    and the packages it returns are fetched as well, before the rest of `packages`.
+    """
+
+    packages_iter = iter(packages)
+    discovered: deque[dict[str, Any]] = deque()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        in_flight: dict[Future[Any], dict[str, Any]] = {}
+
+        def submit_next() -> bool:
+            if discovered:
+                package = discovered.popleft()
+            elif (package := next(packages_iter, None)) is None:
+                return False
+            future = executor.submit(
+                fetch_package_data,
+                package["package"],
+                package.get("version"),
+                package.get("compat"),
+                session,
+                package.get("version_source"),
+                package.get("index_url"),
+            )
+            in_flight[future] = package
+            return True
+
+        while len(in_flight) < jobs and submit_next():
+            pass
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                package = in_flight.pop(future)
+                if discover is not None:
+                    discovered.extend(discover(package, future))
+                while len(in_flight) < jobs and submit_next():
+                    pass
+                yield package, future
@@ -0,0 +1,273 @@
+"""
+This module implements a persistent on-disk cache of the HTTP responses
+obtained from PyPI (or any other index) by the loaders.
+
+The response bodies are stored content-addressed (by their sha256 digest),
+the small per-URL entries point to them and keep the validators
+(ETag, Last-Modified) needed to revalidate stale responses.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, IO, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from requests import PreparedRequest, Session
+    from urllib3 import HTTPResponse
+
+
+DEFAULT_TTL = 24 * 60 * 60  # in seconds
+DEFAULT_MAX_SIZE = 1024 ** 3  # in bytes
+CHUNK_SIZE = 64 * 1024
+# The eviction makes room for more than the new data, so that it doesn't run on every store
+EVICTION_TARGET = 0.9
+
+# Release files and the JSON describing a particular release don't change
+# once uploaded, they never need to be revalidated
+IMMUTABLE_URLS = (
+    re.compile(r"/pypi/[^/]+/[^/]+/json$"),
+    re.compile(r"\.metadata$"),
+)
+
+# Only the headers relevant for processing the cached body are kept
+STORED_HEADERS = ("content-type", "etag", "last-modified", "x-pypi-last-serial")
+
+
+def is_immutable(url: str) -> bool:
+    return any(pattern.search(url) for pattern in IMMUTABLE_URLS)
+
+
+class HTTPCache:
+    """Store HTTP response bodies on the disk.
+
+    Responses younger than `ttl` seconds are served without contacting
+    the server, older ones are revalidated using the stored validators.
+    When the total size of stored bodies exceeds `max_size` bytes,
+    the least recently used ones are evicted. The bodies larger
+    than `max_size` are not stored at all.
+    """
+
+    def __init__(
+        self,
+        directory: str | os.PathLike,
+        ttl: float = DEFAULT_TTL,
+        max_size: int = DEFAULT_MAX_SIZE,
+    ) -> None:
+        self.directory = Path(directory)
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries_dir = self.directory / "entries"
+        self.blobs_dir = self.directory / "blobs"
+        # Data computed from the responses, e.g. the version indexes
+        self.derived_dir = self.directory / "derived"
+        self.entries_dir.mkdir(parents=True, exist_ok=True)
+        self.blobs_dir.mkdir(parents=True, exist_ok=True)
+        self.derived_dir.mkdir(parents=True, exist_ok=True)
+        # The running total of the stored sizes, the directories are only scanned
+        # when it exceeds `max_size` (other processes' stores are seen then)
+        self.size: int | None = None
+        self.size_lock = threading.Lock()
+
+    @staticmethod
+    def key(request: PreparedRequest) -> str:
+        # The same URL can be served in different formats (e.g. Simple API)
+        accept = request.headers.get("Accept", "")
+        return hashlib.sha256(f"{request.url}\n{accept}".encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.entries_dir / f"{key}.json"
+
+    def blob_path(self, entry: dict[str, Any]) -> Path:
+        return self.blobs_dir / entry["digest"]
+
+    def lookup(self, request: PreparedRequest) -> dict[str, Any] | None:
+        """Return the stored entry for the request or None if there's none."""
+
+        try:
+            with open(self._entry_path(self.key(request)), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        # The body might have been evicted in the meantime
+        if not self.blob_path(entry).exists():
+            return None
+        return entry
+
+    def is_fresh(self, entry: dict[str, Any]) -> bool:
+        return entry["immutable"] or time.time() - entry["stored"] < self.ttl
+
+    def open_blob(self, entry: dict[str, Any]) -> IO[bytes] | None:
+        """Return the opened body or None if it was evicted in the meantime."""
+
+        try:
+            return open(self.blob_path(entry), "rb")
+        except FileNotFoundError:
+            return None
+
+    def touch(self, entry: dict[str, Any]) -> None:
+        """Mark the body as recently used."""
+
+        try:
+            os.utime(self.blob_path(entry))
+        except FileNotFoundError:
+            pass
+
+    def _write_entry(self, entry: dict[str, Any]) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.entries_dir)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self._entry_path(entry["key"]))
+
+    def refresh(self, entry: dict[str, Any]) -> None:
+        """The server confirmed the stored body is still valid."""
+
+        entry["stored"] = time.time()
+        self._write_entry(entry)
+        self.touch(entry)
+
+    def store(self, request: PreparedRequest, raw: HTTPResponse) -> tuple[dict[str, Any], IO[bytes]]:
+        """Write the (decoded) body of the raw response to the cache.
+
+        The body is streamed to the disk, it's never held in memory whole.
+        Return the new cache entry and the body opened for reading, it stays
+        readable even if another thread evicts it. The bodies larger
+        than `max_size` are only returned, not stored.
+        """
+
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.blobs_dir)
+        body = os.fdopen(fd, "w+b")
+        try:
+            for chunk in raw.stream(CHUNK_SIZE, decode_content=True):
+                digest.update(chunk)
+                body.write(chunk)
+            size = body.tell()
+            body.seek(0)
+        except BaseException:
+            body.close()
+            os.unlink(tmp_path)
+            raise
+
+        entry = {
+            "key": self.key(request),
+            "url": request.url,
+            "digest": digest.hexdigest(),
+            "headers": {k.lower(): v for k, v in raw.headers.items() if k.lower() in STORED_HEADERS},
+            "immutable": is_immutable(request.url or ""),
+            "stored": time.time(),
+        }
+        if size > self.max_size:
+            # Only readable through the open file
+            os.unlink(tmp_path)
+            return entry, body
+        blob_path = self.blob_path(entry)
+        added = 0 if blob_path.exists() else size
+        os.replace(tmp_path, blob_path)
+        self._write_entry(entry)
+        self._added(added, keep=blob_path)
+        return entry, body
+
+    def _derived_path(self, kind: str, key: str, suffix: str = ".json") -> Path:
+        return self.derived_dir / f"{kind}-{key}{suffix}"
+
+    def _write_derived(self, path: Path, data: bytes) -> None:
+        if len(data) > self.max_size:
+            return
+        try:
+            previous_size = path.stat().st_size
+        except FileNotFoundError:
+            previous_size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.derived_dir)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._added(len(data) - previous_size, keep=path)
+
+    def load_derived(self, kind: str, key: str) -> Any:  # noqa: ANN401
+        """Return the stored data of the given kind or None if there are none."""
+
+        path = self._derived_path(kind, key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        os.utime(path)
+        return data
+
+    def store_derived(self, kind: str, key: str, data: object) -> None:
+        """Store JSON-serializable data computed from the cached responses.
+
+        `key` must change whenever the data the derived ones are computed from change.
+        """
+
+        self._write_derived(self._derived_path(kind, key), json.dumps(data).encode("utf-8"))
+
+    def load_derived_bytes(self, kind: str, key: str) -> bytes | None:
+        """Return the stored binary data of the given kind or None if there are none."""
+
+        path = self._derived_path(kind, key, ".bin")
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        os.utime(path)
+        return data
+
+    def store_derived_bytes(self, kind: str, key: str, data: bytes) -> None:
+        """Store binary data, for the derived data which are not worth serializing to JSON."""
+
+        self._write_derived(self._derived_path(kind, key, ".bin"), data)
+
+    def _added(self, size: int, keep: Path) -> None:
+        """Count the newly stored data, evict if the cache doesn't fit in `max_size`."""
+
+        with self.size_lock:
+            if self.size is not None:
+                self.size += size
+                if self.size <= self.max_size:
+                    return
+            self.size = self.evict(keep)
+
+    def evict(self, keep: Path | None = None) -> int:
+        """Remove the least recently used bodies and derived data (except `keep`)
+        if the cache doesn't fit in `max_size`.
+
+        Make room for the next stores as well, return the remaining total size.
+        """
+
+        files = []
+        total_size = 0
+        for path in (*self.blobs_dir.iterdir(), *self.derived_dir.iterdir()):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+            total_size += stat.st_size
+        if total_size <= self.max_size:
+            return total_size
+        # The entries pointing to the evicted bodies are invalidated in `lookup`
+        for _, size, path in sorted(files):
+            if total_size <= self.max_size * EVICTION_TARGET:
+                break
+            if path == keep:
+                continue
+            path.unlink(missing_ok=True)
+            total_size -= size
+        return total_size
+
+
+def session_cache(session: Session | None, url: str) -> HTTPCache | None:
+    """Return the cache used by the session for the given URL, if there's any."""
+
+    if session is None:
+        return None
+    return getattr(session.get_adapter(url), "cache", None)
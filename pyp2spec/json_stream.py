@@ -0,0 +1,115 @@
+"""
+Incremental parsing of the PyPI JSON API project data.
+
+The project data of packages with a long history contain a description
+of every file of every release, which can be tens of megabytes.
+When looking for a compatible version, only the release versions are needed,
+so the document is scanned chunk by chunk and only a single release
+is held in memory at a time.
+"""
+from __future__ import annotations
+
+import codecs
+import json
+import re
+from typing import Any, Iterable
+
+
+# A JSON string (possibly cut off at the end of the buffer) or a structural character,
+# other values (numbers, literals) and the commas are not interesting for us
+_TOKEN = re.compile(r'"(?:[^"\\]+|\\.)*(?P<end>"|\\?\Z)|[{}\[\]:]', re.DOTALL)
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_decoder = json.JSONDecoder()
+
+# The top-level values which are kept whole, they're small
+KEPT_KEYS = ("info", "urls")
+
+
+class ProjectDataScanner:
+    """Extract the `info`, `urls` and release versions from the project data.
+
+    Feed the scanner with the chunks of the document and call `close()`
+    at the end. The memory usage doesn't depend on the number of releases,
+    only on the size of the kept values and of the largest release.
+    """
+
+    def __init__(self) -> None:
+        self.data: dict[str, Any] = {}
+        self.versions: list[str] = []
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._pending = ""
+        self._depth = 0
+        self._top_key: str | None = None
+        self._last_string = ""
+        self._in_release = False
+        # Parts of the currently kept value and the position where it starts in the buffer
+        self._kept_parts: list[str] = []
+        self._kept_start: int | None = None
+
+    def feed(self, chunk: bytes) -> None:
+        buf = self._pending + self._utf8.decode(chunk)
+        self._pending = ""
+        pos = 0
+        while True:
+            if self._in_release:
+                # Skip the description of the release files at once,
+                # the decoded value is thrown away immediately
+                pos = _WHITESPACE.match(buf, pos).end()  # type: ignore[union-attr]
+                try:
+                    _, pos = _decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    # The value continues in the next chunk
+                    self._pending = buf[pos:]
+                    break
+                self._in_release = False
+
+            match = _TOKEN.search(buf, pos)
+            if match is None:
+                break
+            pos = match.end()
+            token = match.group()
+            if token[0] == '"':
+                if match.group("end") != '"':
+                    # The string continues in the next chunk
+                    self._pending = buf[match.start():]
+                    break
+                self._last_string = token
+            elif token == ":":
+                self._on_key(json.loads(self._last_string))
+            elif token in ("{", "["):
+                if self._depth == 1 and self._top_key in KEPT_KEYS:
+                    self._kept_start = match.start()
+                self._depth += 1
+            else:
+                self._depth -= 1
+                if self._depth == 1 and self._kept_start is not None:
+                    self._kept_parts.append(buf[self._kept_start:match.end()])
+                    self.data[self._top_key] = json.loads("".join(self._kept_parts))  # type: ignore[index]
+                    self._kept_parts = []
+                    self._kept_start = None
+
+        if self._kept_start is not None:
+            self._kept_parts.append(buf[self._kept_start:len(buf) - len(self._pending)])
+            # The kept value continues from the start of the next buffer
+            self._kept_start = 0
+
+    def _on_key(self, key: str) -> None:
+        if self._depth == 1:
+            self._top_key = key
+        elif self._depth == 2 and self._top_key == "releases":
+            self.versions.append(key)
+            self._in_release = True
+
+    def close(self) -> None:
+        if self._depth != 0 or self._pending or self._utf8.decode(b"", final=True):
+            raise ValueError("Incomplete JSON document")
+
+
+def scan_project_data(chunks: Iterable[bytes]) -> tuple[dict[str, Any], list[str]]:
+    """Return the project data without the releases and the list of the release versions."""
+
+    scanner = ProjectDataScanner()
+    for chunk in chunks:
+        scanner.feed(chunk)
+    scanner.close()
+    return scanner.data, scanner.versions
@@ -1,25 +1,134 @@
 from __future__ import annotations
-from importlib.resources import files
-from typing import Any
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, TYPE_CHECKING
+import hashlib
 import json
+import marshal
+import os
 
-from packaging.metadata import RawMetadata
-from requests import Session
-from license_expression import get_spdx_licensing, ExpressionError  # type: ignore
-
+from pyp2spec.http_cache import session_cache
+from pyp2spec.profiling import timed
 from pyp2spec.utils import Pyp2specError, filter_license_classifiers
 
+# license_expression is only needed for packages without License-Expression,
+# it's imported on first use like the other slow to import modules
+if TYPE_CHECKING:
+    from license_expression import Licensing  # type: ignore
+    from packaging.metadata import RawMetadata
+    from requests import Session
+
+    from pyp2spec.http_cache import HTTPCache
+
+
+FEDORA_LICENSES_PATH = "/usr/share/fedora-license-data/licenses/fedora-licenses.json"
+FEDORA_LICENSES_URL = "https://gitlab.com/fedora/legal/fedora-license-data/-/jobs/artifacts/main/raw/fedora-licenses.json?job=json"
+# Bump when the structure of the license index changes
+LICENSE_INDEX_FORMAT = 1
+LICENSE_INDEX_KIND = "fedora-licenses"
+
+# Number of parsed license expressions kept in memory by a single process
+MAX_PARSED_EXPRESSIONS = 1024
+PARSED_EXPRESSIONS_KIND = "spdx-expressions"
 
 TROVE2FEDORA_MAP: dict[str, str | None] = {}
-FEDORA_LICENSES: dict[int, Any] = {}
+# Fedora license expressions mapped to whether they're "allowed", see build_license_index
+FEDORA_LICENSES: dict[str, bool] = {}
 
 
 class NoSuchClassifierError(Pyp2specError):
     """Raised when the detected license classifier doesn't exist in pyp2spec's data"""
 
 
+class ParsedExpressions:
+    """Memo of the parsed license expressions and their sorted SPDX identifiers.
+
+    The same few hundred expressions repeat across packages, so each is parsed
+    only once per process. The least recently used ones are dropped
+    when there are more than `max_size` of them.
+    The memo can be loaded from and stored to the HTTP cache, to be shared
+    between runs using the same version of `license-expression`.
+    """
+
+    def __init__(self, max_size: int = MAX_PARSED_EXPRESSIONS) -> None:
+        self.max_size = max_size
+        self.entries: OrderedDict[str, list[str] | None] = OrderedDict()
+        self.changed = False
+        # The expressions parsed since the last `take_added()`, when tracked
+        self.added: dict[str, list[str] | None] | None = None
+
+    def __contains__(self, expression: str) -> bool:
+        return expression in self.entries
+
+    def get(self, expression: str) -> list[str] | None:
+        self.entries.move_to_end(expression)
+        identifiers = self.entries[expression]
+        return None if identifiers is None else list(identifiers)
+
+    def put(self, expression: str, identifiers: list[str] | None) -> None:
+        self.entries[expression] = identifiers
+        self.changed = True
+        if self.added is not None:
+            self.added[expression] = identifiers
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def track_added(self) -> None:
+        """Start collecting the newly parsed expressions, e.g. in a worker process."""
+
+        self.added = {}
+
+    def take_added(self) -> dict[str, list[str] | None]:
+        """Return the expressions parsed since the previous call and forget them."""
+
+        if self.added is None:
+            return {}
+        added, self.added = self.added, {}
+        return added
+
+    @staticmethod
+    def _cache_key() -> str:
+        from importlib.metadata import version as package_version
+
+        # Newer license-expression may know more identifiers
+        return hashlib.sha256(f"license-expression {package_version('license-expression')}".encode()).hexdigest()
+
+    def load(self, cache: HTTPCache | None) -> None:
+        """Add the expressions stored in the `cache` to the memo."""
+
+        if cache is None or (data := cache.load_derived(PARSED_EXPRESSIONS_KIND, self._cache_key())) is None:
+            return
+        for expression, identifiers in data:
+            if expression not in self.entries:
+                self.entries[expression] = identifiers
+                self.entries.move_to_end(expression, last=False)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def store(self, cache: HTTPCache | None) -> None:
+        """Store the memo in the `cache`, if any new expressions were parsed."""
+
+        if cache is not None and self.changed:
+            cache.store_derived(PARSED_EXPRESSIONS_KIND, self._cache_key(), list(self.entries.items()))
+            self.changed = False
+
+
+PARSED_EXPRESSIONS = ParsedExpressions()
+
+
+@lru_cache(maxsize=None)
+def get_licensing() -> Licensing:
+    """Return the process-wide SPDX licensing object, it's expensive to build."""
+
+    from license_expression import get_spdx_licensing  # type: ignore
+
+    return get_spdx_licensing()
+
+
 
 def _load_package_resource(filename: str) -> dict[Any, Any]:
+    from importlib.resources import files
+
     with (files("pyp2spec") / filename).open("r", encoding="utf-8") as f:
         return json.load(f)
 
@@ -29,11 +138,12 @@ def _load_from_drive(source_path: str) -> dict[Any, Any]:
         return json.load(f)
 
 
-def _load_from_url(url: str, session: Session | None=None) -> dict[Any, Any]:
-    s = session or Session()
-    response = s.get(url)
-    response.raise_for_status()
-    return response.json()
+def load_trove2fedora_map() -> dict[str, str | None]:
+    """Return the Python trove classifiers mapped to SPDX identifiers, load them on first use."""
+
+    if not TROVE2FEDORA_MAP:
+        TROVE2FEDORA_MAP.update(_load_package_resource("classifiers_to_fedora.json"))
+    return TROVE2FEDORA_MAP
 
 
 def classifiers_to_spdx_identifiers(classifiers: list) -> list | None:
@@ -43,14 +153,11 @@ def classifiers_to_spdx_identifiers(classifiers: list) -> list | None:
     Raise KeyError if the source data doesn't contain the found classifier.
     """
 
-    if not TROVE2FEDORA_MAP:
-        # Load the file with Python trove classifiers mapped to SPDX identifiers
-        TROVE2FEDORA_MAP.update(_load_package_resource("classifiers_to_fedora.json"))
-
+    trove2fedora_map = load_trove2fedora_map()
     spdx_identifiers = []
     for classifier in classifiers:
         try:
-            fedora_identifier = TROVE2FEDORA_MAP[classifier]
+            fedora_identifier = trove2fedora_map[classifier]
         except KeyError as err:
             err_string = f"{classifier}: Such classifier doesn't exist. " \
             "If you believe that's pyp2spec's error, open an issue at the project's GitHub repo: " \
@@ -90,38 +197,91 @@ def license_keyword_to_spdx_identifiers(license_keyword: str | None) -> list | N
             "and include the details about the package that causes the issue."
             raise NotImplementedError(err_str)
 
-    licensing = get_spdx_licensing()
+    if license_keyword in PARSED_EXPRESSIONS:
+        return PARSED_EXPRESSIONS.get(license_keyword)
+
+    from license_expression import ExpressionError  # type: ignore
+
+    identifiers: list[str] | None
     try:
-        parsed_license = licensing.parse(license_keyword, validate=True)
+        parsed_license = get_licensing().parse(license_keyword, validate=True)
         # The objects are stored in sets, sort and return as a list
-        return sorted(parsed_license.objects)
+        identifiers = sorted(parsed_license.objects)
     except ExpressionError:
         # Don't bubble the error up, the calling function will handle the invalid result
+        identifiers = None
+    PARSED_EXPRESSIONS.put(license_keyword, identifiers)
+    return None if identifiers is None else list(identifiers)
+
+
+def _license_index_key(*source: object) -> str:
+    return hashlib.sha256(repr((LICENSE_INDEX_FORMAT, *source)).encode("utf-8")).hexdigest()
+
+
+def _load_compiled_index(cache: HTTPCache | None, key: str) -> dict[str, bool] | None:
+    if cache is None or (compiled := cache.load_derived_bytes(LICENSE_INDEX_KIND, key)) is None:
         return None
+    try:
+        return marshal.loads(compiled)
+    except (EOFError, ValueError, TypeError):
+        return None
+
 
+def _store_compiled_index(cache: HTTPCache | None, key: str, license_index: dict[str, bool]) -> None:
+    if cache is not None:
+        cache.store_derived_bytes(LICENSE_INDEX_KIND, key, marshal.dumps(license_index))
 
-def _load_fedora_licenses(
+
+def _load_license_index(
     source_path: str | None = None,
-    session: Session | None = None
-) -> dict[Any, Any]:
-    """Load the dictionary of licenses evaluated for Fedora by the Fedora Legal team.
+    session: Session | None = None,
+    url: str = FEDORA_LICENSES_URL,
+) -> dict[str, bool]:
+    """Load the index of licenses evaluated for Fedora by the Fedora Legal team.
 
     Try to get them from the hard drive (installed by `fedora-license-data`).
     Fall back to the resources published by Fedora Legal online when the file isn't found.
+
+    If the session caches the responses, the compiled index is stored in the cache too.
+    It's reused until the source file's mtime or size, or the ETag of the online resource,
+    change, so the full license data don't need to be parsed in every process.
     """
 
-    fedora_licenses_path = source_path or "/usr/share/fedora-license-data/licenses/fedora-licenses.json"
-    try:
-        return _load_from_drive(fedora_licenses_path)
+    from pyp2spec.sessions import get_session
 
+    s = session or get_session()
+    cache = session_cache(s, url)
+    fedora_licenses_path = source_path or FEDORA_LICENSES_PATH
+    try:
+        stat = os.stat(fedora_licenses_path)
     except FileNotFoundError:
-        url = "https://gitlab.com/fedora/legal/fedora-license-data/-/jobs/artifacts/main/raw/fedora-licenses.json?job=json"
-        return _load_from_url(url, session=session)
+        pass
+    else:
+        key = _license_index_key(os.path.abspath(fedora_licenses_path), stat.st_mtime_ns, stat.st_size)
+        if (license_index := _load_compiled_index(cache, key)) is None:
+            license_index = build_license_index(_load_from_drive(fedora_licenses_path))
+            _store_compiled_index(cache, key, license_index)
+        return license_index
 
+    response = s.get(url)
+    response.raise_for_status()
+    if (etag := response.headers.get("ETag")) is None:
+        return build_license_index(response.json())
+    key = _license_index_key(url, etag)
+    if (license_index := _load_compiled_index(cache, key)) is None:
+        license_index = build_license_index(response.json())
+        _store_compiled_index(cache, key, license_index)
+    return license_index
 
-def _is_compliant_with_fedora(identifier: str, fedora_licenses: dict[Any, Any]) -> bool:
-    """Return True if the given identifier is "allowed" for Fedora and False if not.
 
+def _normalize_expression(expression: str) -> str:
+    return " ".join(expression.split())
+
+
+def build_license_index(fedora_licenses: dict[Any, Any]) -> dict[str, bool]:
+    """Return the Fedora licenses keyed by their expression.
+
+    The values tell whether the license is "allowed" for Fedora.
     Fedora allows different types of licenses: "allowed for content", "allowed fonts",
     "allowed firmware", "allowed for documentation" and "allowed" for any use.
     For our purposes, only the generally "allowed" licenses are considered good.
@@ -143,15 +303,45 @@ def _is_compliant_with_fedora(identifier: str, fedora_licenses: dict[Any, Any])
     #     "fedora_name": "Rdisc License",
     #     "spdx_abbrev": "Rdisc"}...}
 
+    license_index: dict[str, bool] = {}
     for entry in fedora_licenses.values():
         license_info = entry.get("license")
         if license_info is not None:
-            if identifier == entry["license"]["expression"]:
-                return "allowed" in entry["license"]["status"]
+            # The first entry wins, as it did when the data were searched linearly
+            license_index.setdefault(
+                _normalize_expression(license_info["expression"]),
+                "allowed" in license_info["status"],
+            )
+    return license_index
+
+
+def _is_compliant_with_fedora(identifier: str, license_index: dict[str, bool]) -> bool:
+    """Return True if the given identifier is "allowed" for Fedora and False if not.
+
+    The identifier may also be a compound expression, e.g. `X WITH Y` or `X OR Y`,
+    as long as Fedora evaluates it as a whole.
+    """
+
     # No such identifier was found, we assume it's not good for Fedora
-    return False
+    return license_index.get(_normalize_expression(identifier), False)
+
+
+def load_fedora_licenses(session: Session | None = None) -> dict[str, bool]:
+    """Return the process-wide index of the Fedora licenses, load it on first use."""
+
+    if not FEDORA_LICENSES:
+        FEDORA_LICENSES.update(_load_license_index(session=session))
+    return FEDORA_LICENSES
+
+
+def license_data_fingerprint(session: Session | None = None) -> str:
+    """Return the hash of the Fedora license data used by `check_compliance`."""
+
+    license_index = load_fedora_licenses(session)
+    return hashlib.sha256(json.dumps(license_index, sort_keys=True).encode("utf-8")).hexdigest()
 
 
+@timed("check_compliance")
 def check_compliance(
     license: str, *,
     licenses_dict: dict[Any, Any] | None = None,
@@ -167,11 +357,8 @@ def check_compliance(
     Otherwise, return (True, checked_identifies).
     """
 
-    # populate FEDORA_LICENSES only if they're still empty and
-    # no other dictionary with licenses was given to be used here
-    if licenses_dict is None and not FEDORA_LICENSES:
-        FEDORA_LICENSES.update(_load_fedora_licenses(session=session))
-    fedora_licenses = licenses_dict or FEDORA_LICENSES
+    # populate FEDORA_LICENSES only if no other dictionary with licenses was given to be used here
+    license_index = load_fedora_licenses(session) if licenses_dict is None else build_license_index(licenses_dict)
 
     checked_identifies: dict[str, list[str]] = {
         "bad": [],
@@ -182,7 +369,7 @@ def check_compliance(
     if not spdx_identifiers:
         return (False, checked_identifies)
     for spdx_identifier in spdx_identifiers:
-        if _is_compliant_with_fedora(spdx_identifier, fedora_licenses):
+        if _is_compliant_with_fedora(spdx_identifier, license_index):
             checked_identifies["good"].append(spdx_identifier)
         else:
             checked_identifies["bad"].append(spdx_identifier)
@@ -222,6 +409,7 @@ def generate_spdx_expression(license_field: str | None, classifiers: list) -> st
     return expression
 
 
+@timed("resolve_license_expression")
 def resolve_license_expression(data: RawMetadata | dict) -> str | None:
     if (expression := data.get("license_expression")):
         return expression
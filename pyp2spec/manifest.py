@@ -0,0 +1,228 @@
+"""
+Manifest of the inputs the files generated by pyp2spec-batch were created from.
+
+For every package, the manifest records the fingerprints of everything
+the generated files depend on:
+
+    upstream   the project's last serial on PyPI (or the ETag of its JSON API data)
+    pyp2spec   the version of pyp2spec
+    template   the hash of the spec file template
+    licenses   the hash of the Fedora license data (with --fedora-compliant)
+    options    the hash of the options given for the package
+    metadata   the hash of the downloaded package data
+
+When all of them but `metadata` match, the package is up to date
+after a single HEAD request. When only `upstream` changed and the downloaded
+data turn out to be the same, the files are not rendered again.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from importlib.metadata import PackageNotFoundError, version as distribution_version
+from typing import Any, TYPE_CHECKING
+
+from pyp2spec.pypi_loaders import PYPI_URL
+
+if TYPE_CHECKING:
+    from packaging.metadata import RawMetadata
+    from requests import Session
+
+
+MANIFEST_FILENAME = ".pyp2spec-manifest.json"
+# Bump when the structure of the manifest or of the fingerprints changes
+MANIFEST_FORMAT = 1
+# The options which change the generated files
+FINGERPRINTED_OPTIONS = (
+    "package", "version", "compat", "python_alt_version", "automode",
+    "declarative_buildsystem", "fedora_compliant", "version_source", "index_url",
+)
+# Changes with every event of the project, not only those affecting the package data
+VOLATILE_KEYS = ("last_serial",)
+
+
+def _sha256(data: object) -> str:
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def package_key(options: dict[str, Any]) -> str:
+    """Return the key of the package in the manifest, e.g. `pytest compat=7`."""
+
+    fields = [options["package"]]
+    for key in ("version", "compat", "python_alt_version"):
+        if options.get(key):
+            fields.append(f"{key.replace('_', '-')}={options[key]}")
+    return " ".join(fields)
+
+
+def template_fingerprint(template: str | None = None) -> str:
+    """Return the hash of the custom spec file template, or of the default one."""
+
+    if template is None:
+        from importlib.resources import files
+
+        from pyp2spec.conf2spec import TEMPLATE_FILENAME
+
+        source = files("pyp2spec").joinpath(TEMPLATE_FILENAME).read_bytes()
+    else:
+        with open(template, "rb") as f:
+            source = f.read()
+    return hashlib.sha256(source).hexdigest()
+
+
+def pyp2spec_version() -> str:
+    try:
+        return distribution_version("pyp2spec")
+    except PackageNotFoundError:
+        return "unknown"
+
+
+def upstream_serial(package: str, session: Session, index_url: str | None = None) -> str | None:
+    """Return the identifier of the project's current state on the index.
+
+    That's the last serial if the index provides it (PyPI does),
+    the ETag of the JSON API data otherwise. Only the headers are requested.
+    Return None if neither is available.
+    """
+
+    from requests import RequestException
+
+    url = f"{(index_url or PYPI_URL).rstrip('/')}/pypi/{package}/json"
+    try:
+        response = session.head(url, allow_redirects=True)
+    except RequestException:
+        return None
+    if not response.ok:
+        return None
+    if (serial := response.headers.get("X-PyPI-Last-Serial")):
+        return f"serial:{serial}"
+    if (etag := response.headers.get("ETag")):
+        return f"etag:{etag}"
+    return None
+
+
+def fetched_inputs(inputs: dict[str, str | None], pypi_pkg_data: dict[str, Any]) -> dict[str, str | None]:
+    """Return the inputs with the upstream serial the fetched data correspond to.
+
+    The data may predate the serial requested before them, e.g. when served
+    from a cache, the serial is only recorded for the data it describes.
+    """
+
+    upstream = inputs["upstream"]
+    data_serial = pypi_pkg_data.get("last_serial")
+    if upstream is None or not upstream.startswith("serial:") or not isinstance(data_serial, int):
+        return inputs
+    if data_serial < int(upstream.removeprefix("serial:")):
+        return {**inputs, "upstream": f"serial:{data_serial}"}
+    return inputs
+
+
+def metadata_fingerprint(core_metadata: RawMetadata | None, pypi_pkg_data: dict[str, Any]) -> str:
+    """Return the hash of the data the files are generated from."""
+
+    stable_data = {key: value for key, value in pypi_pkg_data.items() if key not in VOLATILE_KEYS}
+    return _sha256([core_metadata, stable_data])
+
+
+class Manifest:
+    """The per-package input fingerprints and outputs, stored as JSON in `path`."""
+
+    def __init__(self, path: str, packages: dict[str, dict[str, Any]] | None = None) -> None:
+        self.path = path
+        self.packages = packages or {}
+
+    @classmethod
+    def load(cls, path: str) -> Manifest:
+        """Load the manifest, start from scratch if it doesn't exist or is not valid."""
+
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return cls(path)
+        if not isinstance(data, dict) or data.get("format") != MANIFEST_FORMAT:
+            return cls(path)
+        return cls(path, data.get("packages"))
+
+    def store(self) -> None:
+        # Never leave a half-written manifest behind
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"format": MANIFEST_FORMAT, "packages": self.packages}, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def input_fingerprints(
+        self,
+        all_options: list[dict[str, Any]],
+        session: Session,
+        *,
+        jobs: int,
+    ) -> list[dict[str, str | None]]:
+        """Return the fingerprints of the inputs of all the packages, in the same order.
+
+        The upstream serials are requested concurrently by `jobs` threads.
+        """
+
+        common = {"pyp2spec": pyp2spec_version()}
+        templates = {options.get("template") for options in all_options}
+        template_hashes = {template: template_fingerprint(template) for template in templates}
+        licenses = None
+        if any(options.get("fedora_compliant") for options in all_options):
+            from pyp2spec.license_processor import license_data_fingerprint
+
+            licenses = license_data_fingerprint(session)
+
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            serials = list(executor.map(
+                lambda options: upstream_serial(options["package"], session, options.get("index_url")),
+                all_options,
+            ))
+        return [
+            {
+                **common,
+                "upstream": serial,
+                "template": template_hashes[options.get("template")],
+                "licenses": licenses if options.get("fedora_compliant") else None,
+                "options": _sha256({key: options.get(key) for key in FINGERPRINTED_OPTIONS}),
+            }
+            for options, serial in zip(all_options, serials)
+        ]
+
+    def _outputs_exist(self, entry: dict[str, Any]) -> bool:
+        return all(os.path.exists(entry[output]) for output in ("config", "spec"))
+
+    def is_fresh(self, key: str, inputs: dict[str, str | None]) -> bool:
+        """Return whether the package files were generated from the very same inputs."""
+
+        entry = self.packages.get(key)
+        return (
+            entry is not None
+            and inputs["upstream"] is not None
+            and entry["inputs"] == inputs
+            and self._outputs_exist(entry)
+        )
+
+    def is_unchanged(self, key: str, inputs: dict[str, str | None], metadata: str) -> bool:
+        """Return whether the package files were generated from the same data,
+        even though the upstream project changed since."""
+
+        entry = self.packages.get(key)
+        if entry is None or entry["metadata"] != metadata:
+            return False
+        previous_inputs = {**entry["inputs"], "upstream": inputs["upstream"]}
+        return previous_inputs == inputs and self._outputs_exist(entry)
+
+    def result(self, key: str) -> dict[str, Any]:
+        """Return the batch result of the up to date package."""
+
+        entry = self.packages[key]
+        return {"status": "unchanged", **{k: entry[k] for k in ("version", "config", "spec")}}
+
+    def update(self, key: str, inputs: dict[str, str | None], metadata: str | None = None, **outputs: str) -> None:
+        entry = self.packages.setdefault(key, {})
+        entry["inputs"] = inputs
+        if metadata is not None:
+            entry["metadata"] = metadata
+        entry.update(outputs)
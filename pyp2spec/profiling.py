@@ -0,0 +1,206 @@
+"""
+Opt-in timing of the pipeline stages and counting of the HTTP traffic.
+
+With `--profile <file>` (or `PYP2SPEC_TRACE=<file>`), the commands write
+a JSON report to the file ("-" for stderr):
+
+    {
+      "wall_time": 1.52,
+      "stages": {
+        "load_from_pypi": {"calls": 3, "total": 0.91, "min": 0.2, "p50": 0.3, "p90": 0.41, "p99": 0.41, "max": 0.41},
+        ...
+      },
+      "counters": {"requests": 7, "bytes": 48213, "cache_hits": 2, "cache_misses": 5, ...}
+    }
+
+The times are in seconds. Each stage is timed on every call, so in batch runs
+the percentiles describe the distribution across the packages.
+The transferred bytes are those downloaded to the cache, or declared
+by the Content-Length of the responses when not caching.
+When profiling is not enabled, the instrumentation only costs a global lookup.
+"""
+from __future__ import annotations
+
+import json
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter
+from typing import Any, Callable, Iterator, TypeVar, TYPE_CHECKING
+
+import click
+
+if TYPE_CHECKING:
+    from requests import Response
+
+
+F = TypeVar("F", bound=Callable[..., Any])
+PERCENTILES = (50, 90, 99)
+# The counters of the cache statuses set by sessions.CachingAdapter
+CACHE_COUNTERS = {"hit": "cache_hits", "revalidated": "cache_revalidations", "miss": "cache_misses"}
+
+
+class Profiler:
+    """Collects the durations of the stages and the counters of the events."""
+
+    def __init__(self) -> None:
+        self.started = perf_counter()
+        self.durations: defaultdict[str, list[float]] = defaultdict(list)
+        self.counters: Counter[str] = Counter()
+        # The stages run in the download threads of batch runs
+        self.lock = threading.Lock()
+
+    def record(self, stage: str, duration: float) -> None:
+        with self.lock:
+            self.durations[stage].append(duration)
+
+    def count(self, counter: str, n: int = 1) -> None:
+        with self.lock:
+            self.counters[counter] += n
+
+    def export(self) -> dict[str, Any]:
+        """Return the recorded data to be merged into the profiler of another process."""
+
+        with self.lock:
+            return {"durations": dict(self.durations), "counters": dict(self.counters)}
+
+    def merge(self, data: dict[str, Any]) -> None:
+        with self.lock:
+            for stage, durations in data["durations"].items():
+                self.durations[stage].extend(durations)
+            self.counters.update(data["counters"])
+
+    def report(self) -> dict[str, Any]:
+        with self.lock:
+            stages = {stage: _summarize(durations) for stage, durations in sorted(self.durations.items())}
+            counters = dict(sorted(self.counters.items()))
+        return {"wall_time": perf_counter() - self.started, "stages": stages, "counters": counters}
+
+
+def _percentile(values: list[float], percentile: int) -> float:
+    """Return the nearest-rank percentile of the sorted values."""
+
+    rank = max(1, -(-percentile * len(values) // 100))
+    return values[rank - 1]
+
+
+def _summarize(durations: list[float]) -> dict[str, Any]:
+    values = sorted(durations)
+    summary: dict[str, Any] = {"calls": len(values), "total": sum(values), "min": values[0]}
+    for percentile in PERCENTILES:
+        summary[f"p{percentile}"] = _percentile(values, percentile)
+    summary["max"] = values[-1]
+    return summary
+
+
+# The profiler of the current run, None when profiling is not enabled
+PROFILER: Profiler | None = None
+
+
+def timed(stage: str) -> Callable[[F], F]:
+    """Decorate the function to record its duration as `stage` when profiling."""
+
+    def decorator(func: F) -> F:
+        @wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:  # noqa: ANN401
+            profiler = PROFILER
+            if profiler is None:
+                return func(*args, **kwargs)
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.record(stage, perf_counter() - start)
+        return wrapper  # type: ignore[return-value]
+    return decorator
+
+
+def count(counter: str, n: int = 1) -> None:
+    if PROFILER is not None:
+        PROFILER.count(counter, n)
+
+
+def profiling_enabled() -> bool:
+    return PROFILER is not None
+
+
+def merge_profile(data: dict[str, Any] | None) -> None:
+    """Add the data exported by the profiler of a worker process, see `collecting()`."""
+
+    if data is not None and PROFILER is not None:
+        PROFILER.merge(data)
+
+
+def record_response(response: Response, *args: object, **kwargs: object) -> None:
+    """Count the request and its cache status, used as a response hook of the sessions."""
+
+    profiler = PROFILER
+    if profiler is None:
+        return
+    cache_status = getattr(response, "cache_status", None)
+    if cache_status is not None:
+        profiler.count(CACHE_COUNTERS[cache_status])
+    if cache_status == "hit":
+        return
+    profiler.count("requests")
+    if cache_status != "revalidated":
+        transferred = getattr(response, "transferred", None)
+        if transferred is None:
+            transferred = int(response.headers.get("Content-Length") or 0)
+        profiler.count("bytes", transferred)
+
+
+def write_report(report: dict[str, Any], output: str) -> None:
+    text = json.dumps(report, indent=2)
+    if output == "-":
+        click.echo(text, err=True)
+    else:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+@contextmanager
+def profiling(output: str | None) -> Iterator[Profiler | None]:
+    """Profile the block and write the report to `output`.
+
+    Do nothing if `output` is None.
+    """
+
+    global PROFILER
+
+    if output is None:
+        yield None
+        return
+    profiler = PROFILER = Profiler()
+    try:
+        yield profiler
+    finally:
+        PROFILER = None
+        write_report(profiler.report(), output)
+
+
+@contextmanager
+def collecting(enabled: bool) -> Iterator[Profiler | None]:
+    """Profile the block without writing any report, in the worker processes.
+
+    The data exported by the profiler are merged in the profiled process.
+    """
+
+    global PROFILER
+
+    if not enabled:
+        yield None
+        return
+    profiler = PROFILER = Profiler()
+    try:
+        yield profiler
+    finally:
+        PROFILER = None
+
+
+def profile_option(func):  # noqa
+    return click.option(
+        "--profile", metavar="FILE", envvar="PYP2SPEC_TRACE",
+        help="Write the per-stage timing and HTTP statistics as JSON to FILE, '-' for stderr",
+    )(func)
@@ -1,22 +1,35 @@
 from __future__ import annotations
-from dataclasses import dataclass, asdict, field
+from copy import copy
+from dataclasses import dataclass, field, fields
 from functools import wraps
+from typing import Any, TYPE_CHECKING
+import re
 import sys
 
 import click
-import tomli_w
-from packaging.metadata import RawMetadata
-from requests import Session
 
-from pyp2spec.license_processor import check_compliance, resolve_license_expression
+from pyp2spec.http_cache import DEFAULT_TTL, DEFAULT_MAX_SIZE, session_cache
+from pyp2spec.profiling import profile_option, profiling, timed
+from pyp2spec.license_processor import check_compliance, resolve_license_expression, PARSED_EXPRESSIONS
 from pyp2spec.utils import Pyp2specError, normalize_name, get_extras, get_summary_or_placeholder
 from pyp2spec.utils import prepend_name_with_python, archive_name
-from pyp2spec.utils import is_archful, resolve_url, create_compat_name
+from pyp2spec.utils import is_archful, resolve_url, create_compat_name, write_if_changed
 from pyp2spec.utils import warn, caution, inform, yay
 from pyp2spec.pypi_loaders import load_from_pypi, load_core_metadata_from_pypi, CoreMetadataNotFoundError
+from pyp2spec.pypi_loaders import VERSION_SOURCES, PYPI_URL
 
+# Loaded on first use, see pyp2spec.pypi_loaders
+if TYPE_CHECKING:
+    from packaging.metadata import RawMetadata
+    from pyp2spec.variants import Variant
+    from requests import Session
 
-@dataclass
+
+# Slotted dataclasses need Python 3.10, the instances are then about half the size
+DATACLASS_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+
+@dataclass(**DATACLASS_SLOTS)
 class PackageInfo:
     pypi_name: str
     pypi_version: str
@@ -36,6 +49,18 @@ class PackageInfo:
     compat: str | None = field(default=None)
 
 
+# The config keys, sorted alphabetically for output consistency
+CONFIG_FIELDS = tuple(sorted(f.name for f in fields(PackageInfo)))
+TOML_BARE_KEY = re.compile(r"[A-Za-z0-9_-]+")
+# The escapes of the TOML basic strings, the same tomli_w uses
+TOML_ESCAPES = {
+    **{char: f"\\u{char:04x}" for char in (*range(32), 127) if char != ord("\t")},
+    ord("\b"): "\\b", ord("\n"): "\\n", ord("\f"): "\\f", ord("\r"): "\\r",
+    ord('"'): '\\"', ord("\\"): "\\\\",
+}
+TOML_MULTILINE_ESCAPES = {**TOML_ESCAPES, ord("\n"): "\n"}
+
+
 def is_package_name(package: str) -> bool:
     """Least-effort check whether `package` is a package name or URL.
     Canonical package names can't contain '/'.
@@ -79,18 +104,24 @@ def gather_package_info(core_metadata: RawMetadata | None, pypi_package_data: di
     return pkg
 
 
-def create_package_from_source(
+@timed("fetch_package_data")
+def fetch_package_data(
     package: str,
     version: str | None,
     compat: str | None,
-    session: Session | None
-) -> PackageInfo:
-    """Determine the best source for the given package name and create a PackageInfo instance.
+    session: Session | None,
+    version_source: str | None = None,
+    index_url: str | None = None,
+) -> tuple[RawMetadata | None, dict]:
+    """Download all the data needed to create the PackageInfo instance.
+
+    Return the core metadata (None if not available) and the PyPI package data.
     """
     if is_package_name(package):
         # explicit `session` argument is needed for testing
         pypi_pkg_data = load_from_pypi(package, version=version,
-        compat=compat, session=session)
+        compat=compat, version_source=version_source or "json",
+        index_url=index_url, session=session)
         try:
             core_metadata = load_core_metadata_from_pypi(pypi_pkg_data, session=session)
         # if no core metadata found, we will fall back to PyPI API
@@ -98,6 +129,20 @@ def create_package_from_source(
             core_metadata = None
     else:
         raise NotImplementedError("pyp2spec can't currently handle URLs.")
+    return core_metadata, pypi_pkg_data
+
+
+def create_package_from_source(
+    package: str,
+    version: str | None,
+    compat: str | None,
+    session: Session | None,
+    version_source: str | None = None,
+    index_url: str | None = None,
+) -> PackageInfo:
+    """Determine the best source for the given package name and create a PackageInfo instance.
+    """
+    core_metadata, pypi_pkg_data = fetch_package_data(package, version, compat, session, version_source, index_url)
     # The processed package info is the basis for config contents
     return gather_package_info(core_metadata, pypi_pkg_data)
 
@@ -110,11 +155,51 @@ def create_config_contents(
     Return pkg_info dictionary.
     """
 
-    package = options.get("package")
+    return create_config_variants(options, [None], session)[0]
+
+
+def create_config_variants(
+    options: dict[str, Any],
+    variants: list[Variant | None],
+    session: Session | None = None
+) -> list[dict]:
+    """Create the config contents of all the variants of the package.
+
+    The package data are downloaded and processed only once,
+    None stands for the variant set by the options themselves.
+    """
+
+    from pyp2spec.sessions import session_from_options
+
+    # The same session is used for all the requests made for the package
+    session = session or session_from_options(options)
+
+    # The license expressions parsed in the previous runs
+    cache = session_cache(session, PYPI_URL)
+    PARSED_EXPRESSIONS.load(cache)
+
+    pkg_info = create_package_from_source(
+        options.get("package"), options.get("version"), options.get("compat"), session,
+        options.get("version_source"), options.get("index_url"),
+    )
+    # complete_config_contents() fills in the variant's fields, keep the shared ones intact
+    all_contents = [
+        complete_config_contents(copy(pkg_info), variant.apply(options) if variant else options, session)
+        for variant in variants
+    ]
+    PARSED_EXPRESSIONS.store(cache)
+    return all_contents
+
+
+def complete_config_contents(
+    pkg_info: PackageInfo,
+    options: dict[str, Any],
+    session: Session | None = None
+) -> dict:
+    """Apply the provided options to the package info and return the config contents."""
+
     version = options.get("version")
     compat = options.get("compat")
-    pkg_info = create_package_from_source(package, version, compat, session)
-
     python_alt_version = options.get("python_alt_version")
     pkg_info.python_name = prepend_name_with_python(pkg_info.pypi_name, python_alt_version)
 
@@ -150,10 +235,58 @@ def create_config_contents(
     if options.get("automode"):
         pkg_info.automode = True
 
-    pkg_dict = asdict(pkg_info)
-    # sort the dictionary alphabetically for output consistency
-    # only keep the values that aren't None - TOML can't handle that
-    return {key: pkg_dict[key] for key in sorted(pkg_dict.keys()) if pkg_dict[key] is not None}
+    return config_contents(pkg_info)
+
+
+def config_contents(pkg_info: PackageInfo) -> dict:
+    """Return the config contents of the package info.
+
+    Only keep the values that aren't None - TOML can't handle that.
+    The values are not copied, the extras list is shared with `pkg_info`.
+    """
+
+    return {
+        key: value for key in CONFIG_FIELDS
+        # The fields not set yet are missing in the slotted instances
+        if (value := getattr(pkg_info, key, None)) is not None
+    }
+
+
+def _toml_value(value: object) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, str):
+        if "\n" in value:
+            return '"""\n' + value.replace("\r\n", "\n").translate(TOML_MULTILINE_ESCAPES) + '"""'
+        return '"' + value.translate(TOML_ESCAPES) + '"'
+    if isinstance(value, list) and all(isinstance(item, str) for item in value):
+        if not value:
+            return "[]"
+        return "[\n" + "".join(f"    {_toml_value(item)},\n" for item in value) + "]"
+    raise TypeError(f"Unsupported config value: {value!r}")
+
+
+def dump_config(contents: dict) -> str:
+    """Return the config contents as TOML.
+
+    The flat contents created by pyp2conf are written directly,
+    the same way `tomli_w.dumps(contents, multiline_strings=True)` writes them,
+    anything else is left to tomli_w.
+    """
+
+    try:
+        lines = []
+        for key, value in contents.items():
+            if not TOML_BARE_KEY.fullmatch(key):
+                raise TypeError(f"Unsupported config key: {key!r}")
+            lines.append(f"{key} = {_toml_value(value)}\n")
+        return "".join(lines)
+    except TypeError:
+        import tomli_w
+
+        return tomli_w.dumps(contents, multiline_strings=True)
 
 
 def save_config(contents: dict, output: str | None = None) -> str:
@@ -164,9 +297,11 @@ def save_config(contents: dict, output: str | None = None) -> str:
     if not output:
         package_name = create_compat_name(contents.get("python_name"), contents.get("compat"))
         output = f"{package_name}.conf"
-    with open(output, "wb") as f:
-        tomli_w.dump(contents, f, multiline_strings=True)
-    yay(f"Configuration file was saved successfully to '{output}'")
+
+    if write_if_changed(output, dump_config(contents).encode("utf-8")):
+        yay(f"Configuration file was saved successfully to '{output}'")
+    else:
+        yay(f"Configuration file '{output}' is up to date")
     return output
 
 
@@ -177,6 +312,42 @@ def create_config(options: dict) -> str:
     return save_config(contents, options["config_output"])
 
 
+def version_source_option(func):  # noqa
+    return click.option(
+        "--version-source", type=click.Choice(VERSION_SOURCES), envvar="PYP2SPEC_VERSION_SOURCE",
+        help="Where to look for the versions compatible with compat, "
+        "'simple' uses the smaller Simple API responses, default: json",
+    )(func)
+
+
+def session_args(func):  # noqa
+    @click.option(
+        "--cache-dir", envvar="PYP2SPEC_CACHE_DIR",
+        help="Cache the data downloaded from PyPI in the given directory",
+    )
+    @click.option(
+        "--cache-ttl", type=int, envvar="PYP2SPEC_CACHE_TTL",
+        help=f"Seconds after which the cached PyPI data is revalidated, default: {DEFAULT_TTL}",
+    )
+    @click.option(
+        "--cache-max-size", type=int, envvar="PYP2SPEC_CACHE_MAX_SIZE",
+        help=f"Maximum size of the cache in bytes, default: {DEFAULT_MAX_SIZE}",
+    )
+    @click.option(
+        "--snapshot", envvar="PYP2SPEC_SNAPSHOT",
+        type=click.Path(exists=True),
+        help="Read the PyPI data from the snapshot created by pyp2spec-snapshot, never use the network",
+    )
+    @click.option(
+        "--index-url", envvar="PYP2SPEC_INDEX_URL",
+        help=f"Base URL of the PyPI-compatible package index, default: {PYPI_URL}",
+    )
+    @wraps(func)
+    def wrapper(*args, **kwargs): # noqa
+        return func(*args, **kwargs)
+    return wrapper
+
+
 def pypconf_args(func):  # noqa
     @click.argument("package")
     @click.option(
@@ -203,6 +374,9 @@ def pypconf_args(func):  # noqa
         "--compat",
         help="Create a compat package for a given version",
     )
+    @version_source_option
+    @session_args
+    @profile_option
     @wraps(func)
     def wrapper(*args, **kwargs): # noqa
         return func(*args, **kwargs)
@@ -212,7 +386,8 @@ def pypconf_args(func):  # noqa
 @pypconf_args
 def main(**options):  # noqa
     try:
-        create_config(options)
+        with profiling(options["profile"]):
+            create_config(options)
     except (Pyp2specError, NotImplementedError) as exc:
         warn(f"Fatal exception occurred: {exc}")
         sys.exit(1)
@@ -2,10 +2,44 @@ import sys
 
 import click
 
-from pyp2spec.pyp2conf import create_config, pypconf_args
-from pyp2spec.conf2spec import create_spec_file
-from pyp2spec.utils import Pyp2specError
-from pyp2spec.utils import warn
+from pyp2spec.pyp2conf import create_config, create_config_variants, pypconf_args, save_config
+from pyp2spec.conf2spec import ConfigFile, bytecode_cache_dir, create_spec_file, fill_in_template_variants
+from pyp2spec.conf2spec import template_option
+from pyp2spec.profiling import profiling
+from pyp2spec.utils import Pyp2specError, create_compat_name, write_if_changed
+from pyp2spec.utils import warn, yay
+from pyp2spec.variants import VARIANT_OPTIONS, Variant
+
+
+def create_variants(options: dict) -> list[tuple[str, str]]:
+    """Create and save the config and spec files of all the variants in `options`.
+
+    The package data are downloaded and processed only once.
+    Return the saved file names.
+    """
+
+    if options.get("config_output") or options.get("spec_output"):
+        raise Pyp2specError("The outputs of the variants can't be customized")
+    if overridden := [f"--{name.replace('_', '-')}" for name in VARIANT_OPTIONS if options.get(name)]:
+        raise Pyp2specError(f"{', '.join(overridden)} can't be combined with --variant, set it in the variants")
+    variants = [Variant.parse(variant) for variant in options["variant"]]
+    all_contents = create_config_variants(options, variants)
+    specs = fill_in_template_variants(
+        [ConfigFile(contents) for contents in all_contents], variants,
+        options.get("template"), bytecode_cache_dir(options),
+    )
+
+    outputs = []
+    for contents, variant, spec in zip(all_contents, variants, specs):
+        basename = create_compat_name(contents["python_name"], contents.get("compat")) + variant.suffix
+        config_output = save_config(contents, f"{basename}.conf")
+        spec_output = f"{basename}.spec"
+        if write_if_changed(spec_output, spec.encode("utf-8")):
+            yay(f"Spec file was saved successfully to '{spec_output}'")
+        else:
+            yay(f"Spec file '{spec_output}' is up to date")
+        outputs.append((config_output, spec_output))
+    return outputs
 
 
 @click.command()
@@ -18,12 +52,22 @@ from pyp2spec.utils import warn
     "--declarative-buildsystem", is_flag=True, default=False,
     help="Create a spec file with pyproject declarative buildsystem (experimental)",
 )
+@template_option
+@click.option(
+    "--variant", multiple=True,
+    help="Generate the given variant, e.g. 'default', 'python-alt-version=3.12', "
+         "'declarative-buildsystem' or 'automode', can be repeated",
+)
 def main(**options):  # noqa
     try:
         if options["automode"] and options["declarative_buildsystem"]:
             raise Pyp2specError("Declarative buildsystem doesn't work with automode")
-        config_file = create_config(options)
-        create_spec_file(config_file, options)
+        with profiling(options["profile"]):
+            if options["variant"]:
+                create_variants(options)
+            else:
+                config_file = create_config(options)
+                create_spec_file(config_file, options)
     except (Pyp2specError, NotImplementedError) as exc:
         warn(f"Fatal exception occurred: {exc}")
         sys.exit(1)
@@ -2,13 +2,32 @@
 This module takes care of loading all sorts of data from PyPI APIs.
 """
 from __future__ import annotations
-from typing import Any
+from typing import Any, TYPE_CHECKING
+from urllib.parse import urljoin
 
-from packaging.metadata import parse_email, RawMetadata
-from packaging.version import Version
-from requests import Response, Session
+from pyp2spec.archives import read_sdist_metadata, read_wheel_metadata
+from pyp2spec.archives import MetadataNotInArchiveError, RangeRequestsNotSupportedError
+from pyp2spec.http_cache import session_cache
+from pyp2spec.json_stream import scan_project_data
+from pyp2spec.profiling import timed
+from pyp2spec.utils import Pyp2specError, normalize_name
 
-from pyp2spec.utils import Pyp2specError
+# requests and packaging are imported on first use, they're slow to import
+# and not needed e.g. for `--help`
+if TYPE_CHECKING:
+    from packaging.metadata import RawMetadata
+    from requests import Response, Session
+
+    from pyp2spec.http_cache import HTTPCache
+
+
+PYPI_URL = "https://pypi.org"
+# PEP 691 JSON-based Simple API, `versions` key was added in PEP 700
+SIMPLE_JSON_CONTENT_TYPE = "application/vnd.pypi.simple.v1+json"
+# Where the list of available versions is taken from:
+# "json" - PyPI JSON API project data, "simple" - Simple API
+VERSION_SOURCES = ("json", "simple")
+STREAM_CHUNK_SIZE = 64 * 1024
 
 
 class PackageNotFoundError(Pyp2specError):
@@ -23,78 +42,230 @@ class CompatibleVersionNotFoundError(Pyp2specError):
     """Raised when project doesn't have a version compatible with the requested one"""
 
 
-def _get_from_url(url: str, error_str: str, session: Session | None = None) -> Response:
-    _session = session or Session()
-    response = _session.get(url)
+class SimpleAPIError(Pyp2specError):
+    """Raised when the index doesn't provide the versions via JSON-based Simple API"""
+
+
+def _get_from_url(url: str, error_str: str, session: Session | None = None, stream: bool = False) -> Response:
+    from pyp2spec.sessions import get_session
+
+    _session = session or get_session()
+    response = _session.get(url, stream=stream)
     if not response.ok:
+        # Release the connection of the unread streamed response to the pool
+        response.close()
         raise PackageNotFoundError(error_str)
     return response
 
 
-def _get_pypi_package_project_data(package: str, session: Session | None= None) -> dict[Any, Any]:
-    pkg_index = f"https://pypi.org/pypi/{package}/json"
+def _resolve_file_urls(pypi_pkg_data: dict[Any, Any], base_url: str) -> dict[Any, Any]:
+    """Make the URLs of the distribution files absolute.
+
+    Mirrors and proxies may serve the files relative to the JSON document.
+    """
+    for entry in pypi_pkg_data.get("urls") or []:
+        entry["url"] = urljoin(base_url, entry["url"])
+    return pypi_pkg_data
+
+
+def _get_pypi_package_project_data(
+    package: str,
+    session: Session | None = None, *,
+    index_url: str = PYPI_URL
+) -> dict[Any, Any]:
+    pkg_index = f"{index_url}/pypi/{package}/json"
     error_str = f"Package `{package}` was not found on PyPI"
-    return _get_from_url(pkg_index, error_str, session=session).json()
+    return _resolve_file_urls(_get_from_url(pkg_index, error_str, session=session).json(), pkg_index)
+
+
+def _get_pypi_package_project_versions(
+    package: str,
+    session: Session | None = None, *,
+    index_url: str = PYPI_URL
+) -> tuple[dict[Any, Any], list[str]]:
+    """Return the project data without releases and the list of the release versions.
+
+    The response is parsed incrementally as it's downloaded,
+    the (possibly huge) description of the releases is never held whole in memory.
+    """
+    pkg_index = f"{index_url}/pypi/{package}/json"
+    error_str = f"Package `{package}` was not found on PyPI"
+    response = _get_from_url(pkg_index, error_str, session=session, stream=True)
+    with response:
+        pypi_project_data, versions = scan_project_data(response.iter_content(STREAM_CHUNK_SIZE))
+    return _resolve_file_urls(pypi_project_data, pkg_index), versions
 
 
 def _get_versioned_pypi_package_data(
     package: str,
     version: str, *,
-    session: Session | None = None
+    session: Session | None = None,
+    index_url: str = PYPI_URL
 ) -> dict[Any, Any]:
-    pkg_index = f"https://pypi.org/pypi/{package}/{version}/json"
+    pkg_index = f"{index_url}/pypi/{package}/{version}/json"
     error_str = f"Package `{package}` or version `{version}` was not found on PyPI"
-    return _get_from_url(pkg_index, error_str, session=session).json()
+    return _resolve_file_urls(_get_from_url(pkg_index, error_str, session=session).json(), pkg_index)
+
+
+def _get_simple_project_versions(
+    package: str, *,
+    index_url: str = PYPI_URL,
+    session: Session | None = None
+) -> list[str]:
+    """Return the project versions listed by the JSON-based Simple API.
+
+    The Simple API response is much smaller than the JSON API project data
+    for projects with many releases, as it doesn't describe the releases.
+    """
+    url = f"{index_url}/simple/{normalize_name(package)}/"
+    from pyp2spec.sessions import get_session
+
+    error_str = f"Package `{package}` was not found on the index"
+    _session = session or get_session()
+    response = _session.get(url, headers={"Accept": SIMPLE_JSON_CONTENT_TYPE})
+    if not response.ok:
+        raise PackageNotFoundError(error_str)
+    # Indexes not supporting PEP 691 respond with HTML
+    if not response.headers.get("Content-Type", "").startswith(SIMPLE_JSON_CONTENT_TYPE):
+        raise SimpleAPIError(f"{index_url} doesn't support JSON-based Simple API")
+    try:
+        return response.json()["versions"]
+    except (ValueError, KeyError) as exc:
+        raise SimpleAPIError(f"{index_url} doesn't list the project versions") from exc
+
+
+def _metadata_file_available(entry: dict[Any, Any]) -> bool | None:
+    """Return whether the index advertises the PEP 658 metadata file for the distribution.
+
+    The Simple API (and the indexes mirroring it) announces the file with
+    the `core-metadata` key (PEP 714) or the older `data-dist-info-metadata`,
+    whose value is false if the file is not available.
+    Return None if the index doesn't tell.
+    """
+    for key in ("core-metadata", "core_metadata", "data-dist-info-metadata", "data_dist_info_metadata"):
+        if key in entry:
+            return bool(entry[key])
+    return None
 
 
 def _get_metadata_file(pypi_pkg_data: dict[Any, Any], session: Session | None = None) -> str:
+    from requests import RequestException
+    from pyp2spec.sessions import get_session
+
     error_str = "The metadata file could not be located"
     for entry in pypi_pkg_data["urls"]:
         if entry["packagetype"] == "bdist_wheel":
+            if _metadata_file_available(entry) is not False:
+                try:
+                    response = _get_from_url(entry["url"] + ".metadata", error_str, session=session)
+                    return response.text
+                except PackageNotFoundError:
+                    pass
+            # No standalone metadata file, read it from the wheel itself
+            try:
+                return read_wheel_metadata(entry["url"], session or get_session())
+            except (RequestException, RangeRequestsNotSupportedError, MetadataNotInArchiveError) as exc:
+                raise CoreMetadataNotFoundError(error_str) from exc
+
+    # Projects publishing no wheels have the metadata only in the sdist
+    for entry in pypi_pkg_data["urls"]:
+        if entry["packagetype"] == "sdist":
             try:
-                response = _get_from_url(entry["url"] + ".metadata", error_str, session=session)
-            except PackageNotFoundError as exc:
+                return read_sdist_metadata(entry["url"], entry["filename"], session or get_session())
+            except (RequestException, RangeRequestsNotSupportedError, MetadataNotInArchiveError) as exc:
                 raise CoreMetadataNotFoundError(error_str) from exc
-            return response.text
-    else:
-        raise CoreMetadataNotFoundError(error_str)
+    raise CoreMetadataNotFoundError(error_str)
+
+
+def _find_compatible_version(
+    compat: str,
+    available_versions: list[str],
+    cache: HTTPCache | None = None
+) -> str:
+    """Return the latest of the versions with the release segment starting with `compat`.
+
+    The index of the versions is stored in the `cache`, if given.
+    """
+    from packaging.version import InvalidVersion
+    from pyp2spec.version_index import get_version_index
 
+    error_str = f"There's no version compatible with the requested: `{compat}`"
+    try:
+        compatible_version = get_version_index(available_versions, cache).find_compatible(compat)
+    except InvalidVersion as exc:
+        raise CompatibleVersionNotFoundError(error_str) from exc
+    if compatible_version is None:
+        raise CompatibleVersionNotFoundError(error_str)
+    return compatible_version
 
-def _find_available_versions(project_releases: dict) -> list[str]:
-    available_versions = []
-    for release in project_releases:
-        available_versions.append(release)
-    return available_versions
 
+def _find_simple_compatible_version(
+    compat: str,
+    package: str,
+    session: Session | None = None,
+    index_url: str = PYPI_URL
+) -> str | None:
+    """Find the compatible version using the Simple API.
 
-def _find_compatible_version(compat: str, available_versions: list[str]) -> str | None:
-    compatible_versions = [v for v in available_versions if v.startswith(compat)]
-    if not compatible_versions:
-        raise CompatibleVersionNotFoundError(f"There's no version compatible with the requested: `{compat}`")
-    return max(compatible_versions, key=Version)
+    Return None if the index can't provide the versions,
+    the caller is expected to fall back to the JSON API.
+    """
+    try:
+        available_versions = _get_simple_project_versions(package, index_url=index_url, session=session)
+    except (PackageNotFoundError, SimpleAPIError):
+        return None
+    cache = session_cache(session, index_url)
+    return _find_compatible_version(compat, available_versions, cache=cache)
 
 
+@timed("load_from_pypi")
 def load_from_pypi(
     package: str, *,
     version: str | None = None,
     compat: str | None = None,
+    version_source: str = "json",
+    index_url: str | None = None,
     session: Session | None= None
 ) -> dict[Any, Any]:
+    """Load the PyPI JSON API data of the given package version.
+
+    If no version is given, load the latest one or the latest compatible one
+    with `compat`. The list of available versions for `compat` is taken from
+    the `version_source` (see VERSION_SOURCES), "simple" falls back to "json"
+    if the index doesn't support the JSON-based Simple API.
+    The data are loaded from PyPI, unless another PyPI-compatible `index_url` is given.
+    """
+
+    index_url = (index_url or PYPI_URL).rstrip("/")
+    if version is None and compat is not None and version_source == "simple":
+        version = _find_simple_compatible_version(compat, package, session=session, index_url=index_url)
 
     if version is None:
-        pypi_project_data = _get_pypi_package_project_data(package, session=session)
         # Looking for the latest version
         if compat is None:
+            pypi_project_data = _get_pypi_package_project_data(package, session=session, index_url=index_url)
             version = pypi_project_data["info"]["version"]
         # Looking for the latest version of the compat version line
         else:
-            available_versions = _find_available_versions(pypi_project_data["releases"])
-            version = _find_compatible_version(compat, available_versions)
+            pypi_project_data, available_versions = _get_pypi_package_project_versions(
+                package, session=session, index_url=index_url
+            )
+            cache = session_cache(session, index_url)
+            version = _find_compatible_version(compat, available_versions, cache=cache)
 
-    return _get_versioned_pypi_package_data(package, version=version, session=session)
+        # The project data describe the latest version in the same way
+        # as the versioned data do, don't download them again
+        if version == pypi_project_data["info"]["version"]:
+            pypi_project_data.pop("releases", None)
+            return pypi_project_data
 
+    return _get_versioned_pypi_package_data(package, version=version, session=session, index_url=index_url)
 
+
+@timed("load_core_metadata_from_pypi")
 def load_core_metadata_from_pypi(pypi_pkg_data: dict[Any, Any], session: Session | None = None) -> RawMetadata:
+    from packaging.metadata import parse_email
+
     metadata = _get_metadata_file(pypi_pkg_data, session=session)
     raw, _ = parse_email(metadata)
     # TODO: consider porting to packaging.Metadata instance?
@@ -0,0 +1,238 @@
+"""
+Generate config and spec files in a long-running process.
+
+The server keeps the pooled PyPI session, the license data and the compiled
+template warm between the requests, so the clients don't pay for
+the interpreter start-up and the data loading on every call:
+
+    pyp2spec-serve --port 8642
+    curl -d '{"package": "pytest", "compat": "7", "fedora-compliant": true}' \\
+        http://127.0.0.1:8642/generate
+
+The request body is a JSON object with the same options `pyp2spec` accepts
+(`package`, `version`, `compat`, `python-alt-version`, ...), flags are booleans.
+The response contains the config contents under `config`
+and the rendered spec file under `spec`.
+Errors are reported with the `error` key and a 4xx status.
+"""
+from __future__ import annotations
+
+import json
+import os
+import stat
+import sys
+import threading
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import BaseServer, ThreadingMixIn, UnixStreamServer
+from typing import Any
+
+import click
+from requests import RequestException, Session
+
+from pyp2spec.conf2spec import ConfigFile, render_spec, template_option
+from pyp2spec.http_cache import session_cache
+from pyp2spec.license_processor import PARSED_EXPRESSIONS
+from pyp2spec.pyp2conf import complete_config_contents, fetch_package_data, gather_package_info
+from pyp2spec.pyp2conf import session_args
+from pyp2spec.pyp2spec import main as pyp2spec_main
+from pyp2spec.pypi_loaders import PYPI_URL
+from pyp2spec.sessions import session_from_options
+from pyp2spec.utils import Pyp2specError, inform, warn
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8642
+# The options of pyp2spec which make sense per request,
+# the outputs are not written and the caches, template and index belong to the server
+SERVED_OPTIONS = tuple(
+    param.name for param in pyp2spec_main.params
+    if param.name not in ("package", "config_output", "spec_output", "template",
+                          "cache_dir", "cache_ttl", "cache_max_size", "snapshot", "index_url",
+                          "profile", "variant")
+)
+
+
+class RequestError(Pyp2specError):
+    """Raised when the request doesn't contain valid pyp2spec options"""
+
+
+class ServerError(Pyp2specError):
+    """Raised when the server can't listen on the given address"""
+
+
+def parse_request_options(body: bytes) -> dict[str, Any]:
+    """Return the pyp2spec options given in the JSON request body.
+
+    The options are validated by the very same click parameters
+    as the command line ones.
+    """
+
+    try:
+        data = json.loads(body)
+    except ValueError as exc:
+        raise RequestError("The request body is not valid JSON") from exc
+    if not isinstance(data, dict) or not isinstance(data.get("package"), str):
+        raise RequestError("The request must be a JSON object with the `package` string")
+
+    package = data.pop("package")
+    args = []
+    for key, value in data.items():
+        name = key.replace("-", "_")
+        if name not in SERVED_OPTIONS:
+            raise RequestError(f"Unknown option `{key}`")
+        if value is True:
+            args.append(f"--{name.replace('_', '-')}")
+        elif value is not False and value is not None:
+            args.extend((f"--{name.replace('_', '-')}", str(value)))
+    # The package is never parsed as an option, e.g. `--help`
+    args.extend(("--", package))
+    try:
+        ctx = pyp2spec_main.make_context("pyp2spec", args)
+    except click.ClickException as exc:
+        raise RequestError(exc.format_message()) from exc
+
+    options = ctx.params
+    if options["automode"] and options["declarative_buildsystem"]:
+        raise RequestError("Declarative buildsystem doesn't work with automode")
+    return options
+
+
+class SpecGenerator:
+    """Generate the config contents and spec files with the shared session.
+
+    The data are downloaded by the request threads concurrently,
+    the rest of the work uses the process-wide caches and is serialized.
+    """
+
+    def __init__(self, options: dict[str, Any], session: Session) -> None:
+        # The server-wide options: template and cache settings
+        self.options = options
+        self.session = session
+        self.cache = session_cache(session, PYPI_URL)
+        self.lock = threading.Lock()
+        PARSED_EXPRESSIONS.load(self.cache)
+
+    def generate(self, request_options: dict[str, Any]) -> dict[str, Any]:
+        options = {**request_options, **self.options}
+        core_metadata, pypi_pkg_data = fetch_package_data(
+            options["package"], options.get("version"), options.get("compat"),
+            self.session, options.get("version_source"), options.get("index_url"),
+        )
+        with self.lock:
+            pkg_info = gather_package_info(core_metadata, pypi_pkg_data)
+            contents = complete_config_contents(pkg_info, options, self.session)
+            spec = render_spec(ConfigFile(contents), options)
+            PARSED_EXPRESSIONS.store(self.cache)
+        return {"config": contents, "spec": spec}
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    server: Any
+
+    def address_string(self) -> str:
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def _send_json(self, status: int, data: dict[str, Any]) -> None:
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, {"error": f"No such endpoint: {self.path}"})
+
+    def do_POST(self) -> None:
+        if self.path != "/generate":
+            self._send_json(404, {"error": f"No such endpoint: {self.path}"})
+            return
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        try:
+            result = self.server.generator.generate(parse_request_options(body))
+        except RequestError as exc:
+            self._send_json(400, {"error": str(exc)})
+        except (Pyp2specError, NotImplementedError, RequestException) as exc:
+            self._send_json(422, {"error": str(exc)})
+        except Exception as exc:
+            # Keep serving, the client gets a response and the traceback is logged
+            self.log_error("Generating failed: %r", exc)
+            traceback.print_exc()
+            self._send_json(500, {"error": f"Internal error: {exc}"})
+        else:
+            self._send_json(200, result)
+
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+
+def create_server(
+    generator: SpecGenerator,
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    socket_path: str | None = None,
+) -> BaseServer:
+    """Return the server listening on the Unix socket if `socket_path` is given,
+    on the TCP `host` and `port` otherwise."""
+
+    server: BaseServer
+    if socket_path is not None:
+        # Left over by a previous run, never remove anything else
+        try:
+            mode = os.stat(socket_path).st_mode
+        except FileNotFoundError:
+            pass
+        else:
+            if not stat.S_ISSOCK(mode):
+                raise ServerError(f"'{socket_path}' exists and is not a socket")
+            os.unlink(socket_path)
+        server = ThreadingUnixHTTPServer(socket_path, RequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), RequestHandler)
+    server.generator = generator  # type: ignore[attr-defined]
+    return server
+
+
+@click.command()
+@click.option(
+    "--host", default=DEFAULT_HOST,
+    help=f"Address to listen on, default: {DEFAULT_HOST}",
+)
+@click.option(
+    "--port", type=int, default=DEFAULT_PORT,
+    help=f"Port to listen on, default: {DEFAULT_PORT}",
+)
+@click.option(
+    "--socket", "socket_path", type=click.Path(dir_okay=False),
+    help="Listen on the given Unix socket instead of TCP",
+)
+@template_option
+@session_args
+def main(host: str, port: int, socket_path: str | None, **options: dict[str, Any]) -> None:
+    """Serve the generation of config and spec files over HTTP."""
+
+    session = session_from_options(options)
+    try:
+        server = create_server(SpecGenerator(options, session), host, port, socket_path)
+    except ServerError as exc:
+        warn(f"Fatal exception occurred: {exc}")
+        sys.exit(1)
+    inform(f"Listening on {socket_path or f'http://{host}:{port}'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path is not None and os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+This module provides the HTTP sessions shared by all the loaders.
+
+Reusing one session keeps the connections to PyPI alive between requests,
+so that a single run doesn't pay for several TLS handshakes.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from typing import Any, IO
+
+from requests import PreparedRequest, RequestException, Response, Session
+from requests import exceptions as requests_exceptions
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPResponse
+from urllib3 import exceptions as urllib3_exceptions
+from urllib3.util.retry import Retry
+
+from pyp2spec.http_cache import HTTPCache, DEFAULT_TTL, DEFAULT_MAX_SIZE
+from pyp2spec.profiling import record_response
+
+
+DEFAULT_POOL_SIZE = int(os.environ.get("PYP2SPEC_POOL_SIZE", 10))
+DEFAULT_RETRIES = int(os.environ.get("PYP2SPEC_RETRIES", 3))
+DEFAULT_BACKOFF_FACTOR = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# The requests exceptions raised for the urllib3 errors while reading the body,
+# the same as by Response.iter_content()
+READ_ERRORS: tuple[tuple[type[Exception], type[RequestException]], ...] = (
+    (urllib3_exceptions.ProtocolError, requests_exceptions.ChunkedEncodingError),
+    (urllib3_exceptions.DecodeError, requests_exceptions.ContentDecodingError),
+    (urllib3_exceptions.ReadTimeoutError, requests_exceptions.ConnectionError),
+    (urllib3_exceptions.SSLError, requests_exceptions.SSLError),
+)
+
+SHARED_SESSIONS: dict[tuple, Session] = {}
+_shared_sessions_lock = threading.Lock()
+
+
+class CachingAdapter(HTTPAdapter):
+    """Transport adapter serving GET requests from the HTTPCache when possible."""
+
+    def __init__(self, cache: HTTPCache, **kwargs: object) -> None:
+        super().__init__(**kwargs)
+        self.cache = cache
+
+    def send(self, request: PreparedRequest, **kwargs: object) -> Response:  # type: ignore[override]
+        # Partial responses are not cached, nor the ones the client doesn't want stored
+        if (
+            request.method != "GET"
+            or "Range" in request.headers
+            or "no-store" in request.headers.get("Cache-Control", "")
+        ):
+            return super().send(request, **kwargs)
+
+        entry = self.cache.lookup(request)
+        if entry is not None:
+            # With `no-cache`, the client wants even the fresh responses revalidated
+            if (
+                self.cache.is_fresh(entry)
+                and "no-cache" not in request.headers.get("Cache-Control", "")
+                and (body := self.cache.open_blob(entry)) is not None
+            ):
+                return self._cached_response(request, entry, body, "hit")
+            if (etag := entry["headers"].get("etag")):
+                request.headers["If-None-Match"] = etag
+            if (modified := entry["headers"].get("last-modified")):
+                request.headers["If-Modified-Since"] = modified
+
+        response = super().send(request, **kwargs)
+        if entry is not None and response.status_code == 304:
+            response.close()
+            if (body := self.cache.open_blob(entry)) is not None:
+                self.cache.refresh(entry)
+                return self._cached_response(request, entry, body, "revalidated")
+            # Evicted since the lookup, request the whole body
+            request.headers.pop("If-None-Match", None)
+            request.headers.pop("If-Modified-Since", None)
+            response = super().send(request, **kwargs)
+        if response.status_code == 200:
+            try:
+                entry, body = self.cache.store(request, response.raw)
+            except urllib3_exceptions.HTTPError as exc:
+                response.close()
+                raise _read_error(exc, request) from exc
+            response.close()
+            cached = self._cached_response(request, entry, body, "miss")
+            # The body as received, possibly compressed
+            cached.transferred = response.raw.tell()  # type: ignore[attr-defined]
+            return cached
+        return response
+
+    def _cached_response(
+        self,
+        request: PreparedRequest,
+        entry: dict[str, Any],
+        body: IO[bytes],
+        cache_status: str,
+    ) -> Response:
+        self.cache.touch(entry)
+        raw = HTTPResponse(
+            body=body,
+            headers=entry["headers"],
+            status=200,
+            reason="OK",
+            preload_content=False,
+            decode_content=False,
+            request_url=request.url,
+        )
+        response = self.build_response(request, raw)
+        response.from_cache = True  # type: ignore[attr-defined]
+        response.cache_status = cache_status  # type: ignore[attr-defined]
+        return response
+
+
+def _read_error(exc: urllib3_exceptions.HTTPError, request: PreparedRequest) -> RequestException:
+    for urllib3_error, requests_error in READ_ERRORS:
+        if isinstance(exc, urllib3_error):
+            return requests_error(exc, request=request)
+    return RequestException(exc, request=request)
+
+
+def create_session(
+    *,
+    pool_size: int = DEFAULT_POOL_SIZE,
+    pool_block: bool = False,
+    retries: int = DEFAULT_RETRIES,
+    backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+    cache: HTTPCache | None = None,
+    snapshot: str | None = None,
+) -> Session:
+    """Return a new Session with pooled keep-alive connections.
+
+    Each host gets a pool of `pool_size` connections, if `pool_block` is set,
+    no more than `pool_size` requests are made to a single host at a time.
+    The requests failing with 429 or 5xx status codes are retried `retries` times
+    with an exponential backoff (respecting the server's Retry-After header).
+    If `cache` is given, the responses are stored in it.
+    If `snapshot` is given, the responses are read from the snapshot
+    (see pyp2spec.snapshots) and the network is never used.
+    """
+
+    max_retries = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=("GET", "HEAD"),
+        respect_retry_after_header=True,
+        # Return the last response and let the loaders report the error
+        raise_on_status=False,
+    )
+    adapter_kwargs = {
+        "pool_connections": pool_size,
+        "pool_maxsize": pool_size,
+        "pool_block": pool_block,
+        "max_retries": max_retries,
+    }
+    adapter: HTTPAdapter
+    if snapshot is not None:
+        from pyp2spec.snapshots import SnapshotAdapter, open_snapshot
+
+        adapter = SnapshotAdapter(open_snapshot(snapshot))
+    elif cache is not None:
+        adapter = CachingAdapter(cache, **adapter_kwargs)
+    else:
+        adapter = HTTPAdapter(**adapter_kwargs)
+
+    session = Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.hooks["response"].append(record_response)
+    return session
+
+
+def revalidating_session(session: Session) -> Session:
+    """Return a session sharing the connections and the cache with `session`,
+    the cached responses are always revalidated with the server."""
+
+    revalidating = Session()
+    for prefix, adapter in session.adapters.items():
+        revalidating.mount(prefix, adapter)
+    revalidating.hooks["response"] = list(session.hooks["response"])
+    revalidating.headers.update(session.headers)
+    revalidating.headers["Cache-Control"] = "no-cache"
+    return revalidating
+
+
+def get_session(
+    *,
+    cache_dir: str | None = None,
+    cache_ttl: float | None = None,
+    cache_max_size: int | None = None,
+    pool_size: int = DEFAULT_POOL_SIZE,
+    pool_block: bool = False,
+    retries: int = DEFAULT_RETRIES,
+    snapshot: str | None = None,
+) -> Session:
+    """Return the process-wide session for the given settings.
+
+    The session is created on the first call, the subsequent calls
+    with the same arguments return the very same object.
+    """
+
+    key = (cache_dir, cache_ttl, cache_max_size, pool_size, pool_block, retries, snapshot)
+    with _shared_sessions_lock:
+        if key not in SHARED_SESSIONS:
+            cache = None
+            if cache_dir is not None:
+                cache = HTTPCache(
+                    cache_dir,
+                    ttl=DEFAULT_TTL if cache_ttl is None else cache_ttl,
+                    max_size=cache_max_size or DEFAULT_MAX_SIZE,
+                )
+            SHARED_SESSIONS[key] = create_session(
+                pool_size=pool_size, pool_block=pool_block, retries=retries, cache=cache,
+                snapshot=snapshot,
+            )
+        return SHARED_SESSIONS[key]
+
+
+def session_from_options(options: dict[str, Any], **kwargs: int | bool) -> Session:
+    """Return the process-wide session for the cache and snapshot command line options
+    (see pyp2spec.pyp2conf.session_args), `kwargs` are passed to `get_session`."""
+
+    return get_session(
+        cache_dir=options.get("cache_dir"),
+        cache_ttl=options.get("cache_ttl"),
+        cache_max_size=options.get("cache_max_size"),
+        snapshot=options.get("snapshot"),
+        **kwargs,
+    )
@@ -0,0 +1,330 @@
+"""
+Offline snapshots of the data pyp2spec downloads from PyPI.
+
+A snapshot maps the URL paths to the response bodies, the host is ignored,
+so the layout is the same as of a bandersnatch mirror's `web` directory:
+
+    pypi/<package>/json
+    pypi/<package>/<version>/json
+    packages/<...>/<wheel>.metadata
+
+A snapshot is a directory, a single zip archive or a single SQLite database.
+The sessions created with a snapshot never touch the network,
+the paths missing in the snapshot are reported as 404.
+Use `pyp2spec-snapshot` to record the snapshot for a list of packages.
+"""
+from __future__ import annotations
+
+import io
+import os
+import sqlite3
+import sys
+import threading
+import zipfile
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, IO, Iterable
+from urllib.parse import unquote, urlsplit
+
+import click
+from requests import PreparedRequest, RequestException, Response, Session
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPResponse
+
+from pyp2spec.license_processor import FEDORA_LICENSES_URL
+from pyp2spec.pypi_loaders import SIMPLE_JSON_CONTENT_TYPE
+from pyp2spec.pyp2conf import version_source_option
+from pyp2spec.utils import Pyp2specError, warn, yay
+
+
+SQLITE_SUFFIXES = (".sqlite", ".sqlite3", ".db")
+# The file name of the index pages (URLs ending with a slash), as used by bandersnatch
+INDEX_FILENAME = "index.v1_json"
+# Let SQLite map up to 1 GiB of the database to memory instead of reading it
+SQLITE_MMAP_SIZE = 1024 ** 3
+
+
+class SnapshotError(Pyp2specError):
+    """Raised when the snapshot can't be opened or written"""
+
+
+def url_to_path(url: str) -> str:
+    """Return the path of the URL's response in snapshots."""
+
+    path = unquote(urlsplit(url).path).lstrip("/")
+    if not path or path.endswith("/"):
+        path += INDEX_FILENAME
+    if ".." in path.split("/"):
+        raise SnapshotError(f"Invalid path in URL: {url}")
+    return path
+
+
+def content_type(path: str) -> str:
+    if path.endswith(INDEX_FILENAME):
+        return SIMPLE_JSON_CONTENT_TYPE
+    if path.endswith(("/json", ".json")):
+        return "application/json"
+    return "application/octet-stream"
+
+
+class Snapshot(ABC):
+    """Read-only mapping of the snapshot paths to the stored bodies."""
+
+    @abstractmethod
+    def read(self, path: str) -> bytes | None:
+        """Return the stored body or None if the path isn't in the snapshot."""
+
+    def close(self) -> None:
+        pass
+
+
+class DirectorySnapshot(Snapshot):
+    def __init__(self, root: str | os.PathLike) -> None:
+        self.root = Path(root)
+
+    def read(self, path: str) -> bytes | None:
+        try:
+            return (self.root / path).read_bytes()
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            return None
+
+
+class ZipSnapshot(Snapshot):
+    def __init__(self, filename: str | os.PathLike) -> None:
+        self.archive = zipfile.ZipFile(filename)
+        self.names = set(self.archive.namelist())
+
+    def read(self, path: str) -> bytes | None:
+        if path not in self.names:
+            return None
+        return self.archive.read(path)
+
+    def close(self) -> None:
+        self.archive.close()
+
+
+class SqliteSnapshot(Snapshot):
+    def __init__(self, filename: str | os.PathLike) -> None:
+        # The connection is shared by the threads of the session, guarded by the lock
+        self.connection = sqlite3.connect(f"file:{filename}?mode=ro", uri=True, check_same_thread=False)
+        self.connection.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+        self.lock = threading.Lock()
+
+    def read(self, path: str) -> bytes | None:
+        with self.lock:
+            row = self.connection.execute("SELECT body FROM files WHERE path = ?", (path,)).fetchone()
+        return None if row is None else row[0]
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+class MemorySnapshot(Snapshot):
+    def __init__(self) -> None:
+        self.files: dict[str, bytes] = {}
+
+    def read(self, path: str) -> bytes | None:
+        return self.files.get(path)
+
+
+def _is_sqlite(location: str | os.PathLike) -> bool:
+    if str(location).endswith(SQLITE_SUFFIXES):
+        return True
+    with open(location, "rb") as f:
+        return f.read(16) == b"SQLite format 3\x00"
+
+
+def open_snapshot(location: str | os.PathLike) -> Snapshot:
+    """Open the snapshot directory, zip archive or SQLite database."""
+
+    if os.path.isdir(location):
+        return DirectorySnapshot(location)
+    try:
+        if _is_sqlite(location):
+            return SqliteSnapshot(location)
+        return ZipSnapshot(location)
+    except (OSError, sqlite3.Error, zipfile.BadZipFile) as exc:
+        raise SnapshotError(f"Can't open the snapshot {location}: {exc}") from exc
+
+
+def write_snapshot(location: str | os.PathLike, files: dict[str, bytes]) -> None:
+    """Add the files to the snapshot, create it if it doesn't exist.
+
+    The format is chosen by the suffix: `.zip` for a zip archive,
+    `.sqlite`, `.sqlite3` or `.db` for a SQLite database, a directory otherwise.
+    """
+
+    location = str(location)
+    if location.endswith(".zip"):
+        mode = "a" if os.path.exists(location) else "w"
+        # Stored uncompressed, the bodies are read directly from the archive
+        with zipfile.ZipFile(location, mode) as archive:
+            existing = set(archive.namelist())
+            for path, body in files.items():
+                if path not in existing:
+                    archive.writestr(path, body)
+    elif location.endswith(SQLITE_SUFFIXES):
+        with sqlite3.connect(location) as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, body BLOB)")
+            connection.executemany("INSERT OR REPLACE INTO files VALUES (?, ?)", files.items())
+        connection.close()
+    else:
+        for path, body in files.items():
+            target = Path(location, path)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(body)
+
+
+class SnapshotAdapter(HTTPAdapter):
+    """Transport adapter serving the GET requests from the snapshot.
+
+    Range requests are supported, so that the wheels' metadata can be read
+    from the stored wheels the same way as from the index.
+    """
+
+    def __init__(self, snapshot: Snapshot, **kwargs: object) -> None:
+        super().__init__(**kwargs)
+        self.snapshot = snapshot
+
+    def read(self, request: PreparedRequest, path: str) -> bytes | None:
+        return self.snapshot.read(path)
+
+    def send(self, request: PreparedRequest, **kwargs: object) -> Response:  # type: ignore[override]
+        path = url_to_path(request.url or "")
+        body = self.read(request, path) if request.method in ("GET", "HEAD") else None
+        headers = {"Content-Type": content_type(path)}
+        status, reason = 200, "OK"
+        if body is None:
+            status, reason, body, headers = 404, "Not Found", b"", {}
+        elif (byte_range := request.headers.get("Range")):
+            status, reason = 206, "Partial Content"
+            start, end = _parse_range(byte_range, len(body))
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(body)}"
+            body = body[start:end + 1]
+        if request.method == "HEAD":
+            headers["Content-Length"] = str(len(body))
+            body = b""
+        raw = HTTPResponse(
+            body=io.BytesIO(body),
+            headers=headers,
+            status=status,
+            reason=reason,
+            preload_content=False,
+            decode_content=False,
+            request_url=request.url,
+        )
+        return self.build_response(request, raw)
+
+    def close(self) -> None:
+        super().close()
+        self.snapshot.close()
+
+
+def _parse_range(byte_range: str, length: int) -> tuple[int, int]:
+    start, _, end = byte_range.removeprefix("bytes=").partition("-")
+    if not start:
+        return max(0, length - int(end)), length - 1
+    return int(start), min(int(end or length - 1), length - 1)
+
+
+class RecordingAdapter(SnapshotAdapter):
+    """Transport adapter downloading the whole files with the upstream session
+    and serving the requests from the recorded ones."""
+
+    def __init__(self, upstream: Session, **kwargs: object) -> None:
+        self.recorded = MemorySnapshot()
+        super().__init__(self.recorded, **kwargs)
+        self.upstream = upstream
+
+    def read(self, request: PreparedRequest, path: str) -> bytes | None:
+        if path not in self.recorded.files:
+            headers = {k: v for k, v in request.headers.items() if k.lower() == "accept"}
+            response = self.upstream.get(request.url, headers=headers)
+            if not response.ok:
+                return None
+            # An index not supporting the Simple API serves HTML at the same path
+            if path.endswith(INDEX_FILENAME) and not response.headers.get("Content-Type", "").startswith(content_type(path)):
+                return None
+            self.recorded.files[path] = response.content
+        return self.recorded.files[path]
+
+
+def record_snapshot(
+    packages: Iterable[dict[str, str]],
+    upstream: Session,
+    *,
+    fedora_compliant: bool = False,
+    version_source: str | None = None,
+    index_url: str | None = None,
+) -> tuple[dict[str, bytes], list[str]]:
+    """Download everything needed to generate the packages offline.
+
+    Return the recorded files and the list of packages which failed.
+    """
+
+    from pyp2spec.pyp2conf import fetch_package_data
+
+    adapter = RecordingAdapter(upstream)
+    session = Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    failed = []
+    for package in packages:
+        try:
+            fetch_package_data(
+                package["package"], package.get("version"), package.get("compat"),
+                session, version_source, index_url,
+            )
+        except (Pyp2specError, NotImplementedError, RequestException) as exc:
+            warn(f"Recording `{package['package']}` failed: {exc}")
+            failed.append(package["package"])
+    if fedora_compliant:
+        session.get(FEDORA_LICENSES_URL)
+    return adapter.recorded.files, failed
+
+
+@click.command()
+@click.argument("snapshot")
+@click.argument("package_list", type=click.File("r"), default="-")
+@click.option(
+    "--fedora-compliant", is_flag=True,
+    help="Also record the Fedora license data",
+)
+@version_source_option
+@click.option(
+    "--index-url", envvar="PYP2SPEC_INDEX_URL",
+    help="Base URL of the PyPI-compatible package index to record from",
+)
+def main(snapshot: str, package_list: IO[str], **options: dict[str, Any]) -> None:
+    """Record the PyPI data of all packages listed in PACKAGE_LIST to SNAPSHOT.
+
+    SNAPSHOT is a zip archive (.zip), a SQLite database (.sqlite, .sqlite3, .db)
+    or a directory. Read the list from stdin if PACKAGE_LIST is not given or is "-",
+    the format is the same as of pyp2spec-batch.
+    """
+
+    from pyp2spec.batch import read_package_list
+    from pyp2spec.sessions import get_session
+
+    try:
+        packages = read_package_list(package_list)
+        files, failed = record_snapshot(
+            packages, get_session(),
+            fedora_compliant=options["fedora_compliant"],
+            version_source=options["version_source"],
+            index_url=options["index_url"],
+        )
+        write_snapshot(snapshot, files)
+    except (Pyp2specError, OSError, sqlite3.Error) as exc:
+        warn(f"Fatal exception occurred: {exc}")
+        sys.exit(1)
+
+    yay(f"Recorded {len(files)} files for {len(packages) - len(failed)} of {len(packages)} packages")
+    if failed:
+        warn(f"Failed packages: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
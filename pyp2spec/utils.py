@@ -9,7 +9,7 @@ from functools import partial
 
 import click
 
-from packaging.requirements import Requirement
+from pyp2spec.profiling import count, timed
 
 
 warn = partial(click.secho, fg="red")
@@ -115,6 +115,8 @@ def get_extras(provides_extra: list, requires_dist: list) -> list:
     if provides_extra:
         return sorted(provides_extra)
 
+    from packaging.requirements import Requirement
+
     extra_from_req = re.compile(r'''\bextra\s+==\s+["']([^"']+)["']''')
     extras = set()
     if requires_dist:
@@ -203,3 +205,23 @@ def create_compat_name(name: str, compat: str | None) -> str:
     if name[-1].isdigit():
         return f"{name}_{compat}"
     return f"{name}{compat}"
+
+
+@timed("write_files")
+def write_if_changed(path: str, data: bytes) -> bool:
+    """Write the data to the file unless it already has exactly these contents.
+
+    Unchanged files keep their mtime, so make-like tools don't rebuild them.
+    Return whether the file was written.
+    """
+    try:
+        with open(path, "rb") as f:
+            if f.read() == data:
+                count("files_unchanged")
+                return False
+    except FileNotFoundError:
+        pass
+    with open(path, "wb") as f:
+        f.write(data)
+    count("files_written")
+    return True
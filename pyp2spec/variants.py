@@ -0,0 +1,74 @@
+"""
+Variants of the generated files: several targets from a single package.
+
+A variant sets the options which only change how the package is built,
+the data downloaded from PyPI and the values computed from them are shared:
+
+    default                          python-foo.spec
+    python-alt-version=3.12          python3.12-foo.spec
+    declarative-buildsystem          python-foo-declarative.spec
+    automode                         python-foo-automode.spec
+
+The settings can be combined with commas,
+e.g. `python-alt-version=3.12,declarative-buildsystem`.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any
+
+from pyp2spec.utils import Pyp2specError
+
+
+# The options set by each variant
+VARIANT_OPTIONS = ("python_alt_version", "automode", "declarative_buildsystem")
+
+
+class VariantError(Pyp2specError):
+    """Raised when the variant can't be parsed"""
+
+
+@dataclass(frozen=True)
+class Variant:
+    python_alt_version: str | None = None
+    automode: bool = False
+    declarative_buildsystem: bool = False
+
+    @classmethod
+    def parse(cls, variant: str) -> Variant:
+        """Return the variant described as e.g. `python-alt-version=3.12,automode`."""
+
+        python_alt_version = None
+        flags = set()
+        for setting in filter(None, (s.strip() for s in variant.split(","))):
+            key, has_value, value = setting.partition("=")
+            if key == "python-alt-version" and value:
+                python_alt_version = value
+            elif key in ("automode", "declarative-buildsystem") and not has_value:
+                flags.add(key)
+            elif key != "default" or has_value:
+                raise VariantError(f"Invalid variant setting: `{setting}`")
+        if {"automode", "declarative-buildsystem"} <= flags:
+            raise VariantError("Declarative buildsystem doesn't work with automode")
+        return cls(python_alt_version, "automode" in flags, "declarative-buildsystem" in flags)
+
+    @property
+    def suffix(self) -> str:
+        """The suffix of the output file names telling apart the variants
+        with the same package name."""
+
+        if self.declarative_buildsystem:
+            return "-declarative"
+        if self.automode:
+            return "-automode"
+        return ""
+
+    def apply(self, options: dict[str, Any]) -> dict[str, Any]:
+        """Return the options with those of the variant."""
+
+        return {
+            **options,
+            "python_alt_version": self.python_alt_version,
+            "automode": self.automode,
+            "declarative_buildsystem": self.declarative_buildsystem,
+        }
@@ -0,0 +1,103 @@
+"""
+Sorted index of the project versions used to resolve compat versions.
+
+The versions are parsed only once per project, the index can be stored
+in the HTTP cache, so that repeated runs don't parse them at all.
+"""
+from __future__ import annotations
+
+import hashlib
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Any, Iterable
+
+from packaging.version import InvalidVersion, Version
+
+from pyp2spec.http_cache import HTTPCache
+
+
+# Number of indexes kept in memory by a single process
+MAX_INDEXES = 256
+DERIVED_KIND = "version-index"
+
+VERSION_INDEXES: OrderedDict[str, VersionIndex] = OrderedDict()
+
+
+class VersionIndex:
+    """Versions sorted by their epoch and release segment.
+
+    All the versions sharing a release segment prefix (e.g. 7.1 for 7.1, 7.1.3, 7.1.10rc1,
+    but not 7.10) form a contiguous range in the index, found by binary search.
+    Each version keeps its rank in the PEP 440 ordering, so the latest version
+    of the range can be picked without parsing the versions again.
+    """
+
+    def __init__(self, entries: list[tuple[int, tuple[int, ...], int, str]]) -> None:
+        # (epoch, release, rank, version string), sorted
+        self.entries = entries
+        self.keys = [(epoch, release) for epoch, release, _, _ in entries]
+
+    @classmethod
+    def from_versions(cls, versions: Iterable[str]) -> VersionIndex:
+        parsed = []
+        for version in versions:
+            try:
+                parsed.append((Version(version), version))
+            # Legacy versions can't be compatible with anything
+            except InvalidVersion:
+                continue
+        parsed.sort()
+        entries = [
+            (v.epoch, v.release, rank, version)
+            for rank, (v, version) in enumerate(parsed)
+        ]
+        entries.sort()
+        return cls(entries)
+
+    @classmethod
+    def from_json(cls, data: list[list[Any]]) -> VersionIndex:
+        return cls([(epoch, tuple(release), rank, version) for epoch, release, rank, version in data])
+
+    def to_json(self) -> list[list[Any]]:
+        return [[epoch, list(release), rank, version] for epoch, release, rank, version in self.entries]
+
+    def find_compatible(self, compat: str) -> str | None:
+        """Return the latest version whose release segment starts with the `compat` one.
+
+        Return None if there's no such version.
+        Raise InvalidVersion if `compat` is not a valid version.
+        """
+        parsed_compat = Version(compat)
+        prefix = parsed_compat.release
+        next_prefix = prefix[:-1] + (prefix[-1] + 1,)
+        start = bisect_left(self.keys, (parsed_compat.epoch, prefix))
+        end = bisect_left(self.keys, (parsed_compat.epoch, next_prefix))
+        if start == end:
+            return None
+        return max(self.entries[start:end], key=lambda entry: entry[2])[3]
+
+
+def get_version_index(versions: list[str], cache: HTTPCache | None = None) -> VersionIndex:
+    """Return the index of the given versions.
+
+    The index is looked up in memory first, then in the `cache`,
+    it's only built from scratch if not found in either.
+    """
+
+    key = hashlib.sha256("\n".join(versions).encode("utf-8")).hexdigest()
+    if key in VERSION_INDEXES:
+        VERSION_INDEXES.move_to_end(key)
+        return VERSION_INDEXES[key]
+
+    data = cache.load_derived(DERIVED_KIND, key) if cache is not None else None
+    if data is not None:
+        index = VersionIndex.from_json(data)
+    else:
+        index = VersionIndex.from_versions(versions)
+        if cache is not None:
+            cache.store_derived(DERIVED_KIND, key, index.to_json())
+
+    VERSION_INDEXES[key] = index
+    if len(VERSION_INDEXES) > MAX_INDEXES:
+        VERSION_INDEXES.popitem(last=False)
+    return index
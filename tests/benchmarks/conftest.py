@@ -0,0 +1,101 @@
+"""Data for the benchmarks: the recorded cassettes and a synthetic corpus.
+
+The synthetic corpus is generated from a fixed seed, so it's the same on every run
+and the timings of different revisions are comparable.
+"""
+import random
+
+import pytest
+
+from pyp2spec.license_processor import _load_license_index
+
+
+CORPUS_SIZE = 500
+CORPUS_SEED = 20240501
+
+LICENSE_EXPRESSIONS = [
+    "MIT", "BSD-3-Clause", "Apache-2.0", "MIT OR Apache-2.0", "GPL-2.0-or-later",
+    "LGPL-3.0-only", "MPL-2.0", "ISC", "Apache-2.0 AND BSD-3-Clause",
+    "GPL-3.0-or-later WITH Classpath-exception-2.0", "PSF-2.0", "Unlicense",
+    # Not allowed in Fedora
+    "CC-BY-NC-4.0", "MIT AND LicenseRef-Proprietary",
+]
+# Legacy License fields, resolved with the help of the classifiers
+LEGACY_LICENSES = [
+    ("MIT", ["License :: OSI Approved :: MIT License"]),
+    ("BSD", ["License :: OSI Approved :: BSD License"]),
+    ("", ["License :: OSI Approved :: Apache Software License"]),
+    ("", ["License :: OSI Approved :: GNU General Public License v2 or later (GPLv2+)",
+          "License :: OSI Approved :: MIT License"]),
+    ("Apache 2.0", []),
+    (None, []),
+]
+# Also converted to the RPM scheme by the benchmarks
+VERSIONS = [
+    "1.0", "2.3.1", "0.9.0rc1", "4.0.0b2", "1.2.3.post1", "10.1.dev3", "2024.5.1",
+    "1!2.0", "3.14.0a4", "0.0.1", "7.4.4", "1.0.0.post2.dev1",
+]
+
+
+def _core_metadata(rng, i):
+    name = f"synthetic-package-{i}"
+    version = rng.choice(VERSIONS)
+    extras = sorted(rng.sample(["test", "docs", "cli", "speedups", "typing"], rng.randint(0, 3)))
+    metadata = {
+        "metadata_version": "2.4",
+        "name": name,
+        "version": version,
+        "summary": f"Synthetic package number {i}",
+        "project_urls": {"Homepage": f"https://example.com/{name}", "Source": f"https://git.example.com/{name}"},
+        "provides_extra": extras,
+        "requires_dist": ["requests>=2"] + [f"dep-{extra}; extra == '{extra}'" for extra in extras],
+    }
+    if rng.random() < 0.5:
+        metadata["license_expression"] = rng.choice(LICENSE_EXPRESSIONS)
+        metadata["license_files"] = ["LICENSE"]
+    else:
+        license, classifiers = rng.choice(LEGACY_LICENSES)
+        if license is not None:
+            metadata["license"] = license
+        metadata["classifiers"] = classifiers + ["Programming Language :: Python :: 3"]
+    return metadata
+
+
+def _pypi_package_data(rng, metadata):
+    name, version = metadata["name"], metadata["version"]
+    abi = "cp312" if rng.random() < 0.2 else "none"
+    python = "cp312" if abi != "none" else "py3"
+    wheel = f"{name.replace('-', '_')}-{version}-{python}-{abi}-any.whl"
+    sdist = f"{name.replace('-', '_')}-{version}.tar.gz"
+    return {
+        "info": {key: value for key, value in metadata.items() if key != "metadata_version"},
+        "urls": [
+            {"packagetype": "bdist_wheel", "filename": wheel, "url": f"https://files.example.com/{wheel}"},
+            {"packagetype": "sdist", "filename": sdist, "url": f"https://files.example.com/{sdist}"},
+        ],
+    }
+
+
+@pytest.fixture(scope="session")
+def versions():
+    return VERSIONS
+
+
+@pytest.fixture(scope="session")
+def synthetic_corpus():
+    """Return the list of (core metadata, PyPI package data) of the synthetic packages."""
+
+    rng = random.Random(CORPUS_SEED)
+    corpus = []
+    for i in range(CORPUS_SIZE):
+        metadata = _core_metadata(rng, i)
+        corpus.append((metadata, _pypi_package_data(rng, metadata)))
+    return corpus
+
+
+@pytest.fixture
+def fedora_licenses(cassettes_session, monkeypatch):
+    """Make check_compliance use the full Fedora license data, replayed from the cassettes."""
+
+    license_index = _load_license_index(source_path="/nonexistent", session=cassettes_session)
+    monkeypatch.setattr("pyp2spec.license_processor.FEDORA_LICENSES", license_index)
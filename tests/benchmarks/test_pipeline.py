@@ -0,0 +1,142 @@
+"""Benchmark the stages of the metadata-to-spec pipeline, separately and end-to-end.
+
+The PyPI data are replayed from the recorded betamax cassettes,
+the throughput is measured on a synthetic corpus (see conftest.py).
+Run with `tox -e benchmark` or `pytest tests/benchmarks --benchmark-only`,
+use `--benchmark-autosave` and `--benchmark-compare` to catch regressions.
+"""
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from pyp2spec.conf2spec import ConfigFile, convert_version_to_rpm_scheme, fill_in_template  # noqa: E402
+from pyp2spec.conf2spec import load_config_file, render_spec  # noqa: E402
+from pyp2spec.license_processor import PARSED_EXPRESSIONS, check_compliance  # noqa: E402
+from pyp2spec.license_processor import resolve_license_expression  # noqa: E402
+from pyp2spec.pyp2conf import complete_config_contents, create_config_contents, dump_config  # noqa: E402
+from pyp2spec.pyp2conf import gather_package_info, prepare_package_info  # noqa: E402
+from pyp2spec.pypi_loaders import load_core_metadata_from_pypi, load_from_pypi  # noqa: E402
+
+
+@pytest.mark.benchmark(group="load_from_pypi")
+@pytest.mark.parametrize(
+    ("package", "version", "compat"), [
+        ("click", "8.1.7", None),
+        ("Sphinx", None, None),
+        # The whole project data are streamed and the versions indexed
+        ("pytest", None, "7"),
+    ]
+)
+def test_load_from_pypi(benchmark, cassettes_session, package, version, compat):
+    result = benchmark(load_from_pypi, package, version=version, compat=compat, session=cassettes_session)
+    assert result["info"]["name"].lower() == package.lower()
+
+
+@pytest.mark.benchmark(group="load_from_pypi")
+def test_load_core_metadata(benchmark, cassettes_session):
+    pypi_pkg_data = load_from_pypi("click", version="8.1.7", session=cassettes_session)
+    core_metadata = benchmark(load_core_metadata_from_pypi, pypi_pkg_data, session=cassettes_session)
+    assert core_metadata["name"] == "click"
+
+
+@pytest.mark.benchmark(group="package_info")
+def test_prepare_package_info(benchmark, synthetic_corpus):
+    def prepare_all():
+        return [prepare_package_info(core_metadata) for core_metadata, _ in synthetic_corpus]
+
+    assert len(benchmark(prepare_all)) == len(synthetic_corpus)
+
+
+@pytest.mark.benchmark(group="licenses")
+def test_resolve_license_expression(benchmark, synthetic_corpus):
+    def resolve_all():
+        return [resolve_license_expression(core_metadata) for core_metadata, _ in synthetic_corpus]
+
+    assert any(benchmark(resolve_all))
+
+
+@pytest.mark.benchmark(group="licenses")
+def test_resolve_license_expression_cold(benchmark, synthetic_corpus):
+    # Every round parses the expressions from scratch, as a new process does
+    def resolve_all():
+        return [resolve_license_expression(core_metadata) for core_metadata, _ in synthetic_corpus]
+
+    assert any(benchmark.pedantic(resolve_all, setup=PARSED_EXPRESSIONS.entries.clear, rounds=5))
+
+
+@pytest.mark.benchmark(group="licenses")
+def test_check_compliance(benchmark, synthetic_corpus, fedora_licenses):
+    expressions = [
+        expression for core_metadata, _ in synthetic_corpus
+        if (expression := resolve_license_expression(core_metadata)) is not None
+    ]
+
+    def check_all():
+        return [check_compliance(expression)[0] for expression in expressions]
+
+    results = benchmark(check_all)
+    assert any(results) and not all(results)
+
+
+@pytest.mark.benchmark(group="config")
+def test_complete_and_dump_config(benchmark, synthetic_corpus):
+    all_pkg_info = [gather_package_info(core_metadata, pypi_pkg_data) for core_metadata, pypi_pkg_data in synthetic_corpus]
+
+    def dump_all():
+        return [dump_config(complete_config_contents(pkg_info, {})) for pkg_info in all_pkg_info]
+
+    assert all(config.startswith("archful = ") for config in benchmark(dump_all))
+
+
+@pytest.mark.benchmark(group="rpm_version")
+def test_rpm_version(benchmark, versions):
+    def convert_all():
+        return [convert_version_to_rpm_scheme(version) for version in versions * 100]
+
+    assert benchmark(convert_all)[7] == "1:2.0"
+
+
+@pytest.mark.benchmark(group="fill_in_template")
+@pytest.mark.parametrize(
+    ("conf", "declarative_buildsystem"), [
+        ("default_python-click.conf", False),
+        ("default_python-numpy.conf", False),
+        ("customized_python-sphinx.conf", True),
+    ]
+)
+def test_fill_in_template(benchmark, conf, declarative_buildsystem):
+    config = ConfigFile(load_config_file(f"tests/test_configs/{conf}"))
+    spec = benchmark(fill_in_template, config, declarative_buildsystem)
+    assert spec.startswith("Name:")
+
+
+@pytest.mark.benchmark(group="end_to_end")
+@pytest.mark.parametrize(
+    ("package", "version", "compat"), [
+        ("click", "8.1.7", None),
+        ("pytest", None, "7"),
+    ]
+)
+def test_end_to_end_cassettes(benchmark, cassettes_session, package, version, compat):
+    options = {"package": package, "version": version, "compat": compat}
+
+    def generate():
+        contents = create_config_contents(options, session=cassettes_session)
+        return render_spec(ConfigFile(contents), options)
+
+    assert "%prep" in benchmark(generate)
+
+
+@pytest.mark.benchmark(group="end_to_end")
+def test_end_to_end_corpus(benchmark, synthetic_corpus, fedora_licenses):
+    options = {"fedora_compliant": True}
+
+    def generate_all():
+        specs = []
+        for core_metadata, pypi_pkg_data in synthetic_corpus:
+            pkg_info = gather_package_info(core_metadata, pypi_pkg_data)
+            contents = complete_config_contents(pkg_info, options)
+            specs.append(render_spec(ConfigFile(contents), options))
+        return specs
+
+    assert len(benchmark.pedantic(generate_all, rounds=3)) == len(synthetic_corpus)
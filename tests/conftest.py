@@ -1,7 +1,13 @@
 import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
 
 import betamax  # type: ignore
 import pytest
+from betamax.util import deserialize_response  # type: ignore
+from requests import Response, Session
+from requests.adapters import HTTPAdapter
 
 
 config = betamax.Betamax.configure()
@@ -17,3 +23,171 @@ config.default_cassette_options["record_mode"] = "none"
 def fake_fedora_licenses():
     with open("tests/fedora_license_data.json", "r", encoding="utf-8") as f:
         return json.load(f)
+
+
+class CassettesAdapter(HTTPAdapter):
+    """Replay the interactions recorded in all the cassettes at once.
+
+    Unlike betamax's own fixtures, this allows to test code that processes
+    many packages in one session.
+    Requesting an URL which was never recorded is an error.
+    """
+
+    def __init__(self, cassette_dir):
+        super().__init__()
+        self.interactions = {}
+        for cassette in sorted(Path(cassette_dir).glob("*.json")):
+            with open(cassette, "r", encoding="utf-8") as f:
+                for interaction in json.load(f)["http_interactions"]:
+                    request = interaction["request"]
+                    self.interactions[(request["method"], request["uri"])] = interaction["response"]
+        self.requests = []
+
+    def send(self, request, **kwargs):
+        self.requests.append(request.url)
+        try:
+            serialized = self.interactions[(request.method, request.url)]
+        except KeyError:
+            raise AssertionError(f"No recorded interaction for {request.method} {request.url}")
+        response = deserialize_response(serialized)
+        response.request = request
+        response.connection = self
+        return response
+
+
+@pytest.fixture
+def cassettes_session():
+    session = Session()
+    adapter = CassettesAdapter(config.cassette_library_dir)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class SerialsAdapter(CassettesAdapter):
+    """Answer the HEAD requests for the project data with the `serials` set by the test."""
+
+    def __init__(self, cassette_dir):
+        super().__init__(cassette_dir)
+        self.serials = {}
+
+    def send(self, request, **kwargs):
+        if request.method != "HEAD":
+            return super().send(request, **kwargs)
+        self.requests.append(request.url)
+        response = Response()
+        response.status_code = 200
+        response.headers["X-PyPI-Last-Serial"] = self.serials[request.url]
+        response.request = request
+        return response
+
+
+@pytest.fixture
+def serials_session():
+    session = Session()
+    adapter = SerialsAdapter(config.cassette_library_dir)
+    session.mount("https://", adapter)
+    return session
+
+
+class FakePyPI:
+    """A tiny local stand-in for PyPI-compatible indexes.
+
+    Register the served documents with `add()` and point the tested code
+    to `url`. Every received request is recorded in `requests`
+    as a tuple (method, path, headers).
+    ETag revalidation (If-None-Match) and Range requests
+    (unless `ranges` is set to False) are supported.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.ranges = True
+        self.routes = {}
+        self.failures = {}
+        self.requests = []
+
+    def add(self, path, body, *, headers=None, status=200):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body)
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.routes[path] = (status, body, headers or {})
+
+    def add_json(self, path, data, **kwargs):
+        headers = {"Content-Type": "application/json", **kwargs.pop("headers", {})}
+        self.add(path, data, headers=headers, **kwargs)
+
+    def fail(self, path, status, times=1):
+        """Respond with the error `status` to the next `times` requests for `path`."""
+        self.failures[path] = [status, times]
+
+    def count(self, path=None):
+        return len([r for r in self.requests if path is None or r[1] == path])
+
+
+def _make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _respond(self, with_body):
+            fake.requests.append((self.command, self.path, dict(self.headers)))
+            if (failure := fake.failures.get(self.path)) and failure[1] > 0:
+                failure[1] -= 1
+                self.send_response(failure[0])
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            if self.path not in fake.routes:
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            status, body, headers = fake.routes[self.path]
+            etag = headers.get("ETag")
+            if etag is not None and self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            if (byte_range := self.headers.get("Range")) and fake.ranges:
+                status, body, headers = self._partial(body, byte_range, headers)
+            self.send_response(status)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if with_body:
+                self.wfile.write(body)
+
+        def _partial(self, body, byte_range, headers):
+            start, end = byte_range.removeprefix("bytes=").split("-")
+            if not start:
+                start, end = max(0, len(body) - int(end)), len(body) - 1
+            else:
+                start, end = int(start), min(int(end or len(body) - 1), len(body) - 1)
+            headers = {**headers, "Content-Range": f"bytes {start}-{end}/{len(body)}"}
+            return 206, body[start:end + 1], headers
+
+        def do_GET(self):
+            self._respond(with_body=True)
+
+        def do_HEAD(self):
+            self._respond(with_body=False)
+
+    return Handler
+
+
+@pytest.fixture
+def fake_pypi():
+    """Serve the registered documents on a random localhost port."""
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), None)
+    fake = FakePyPI(f"http://127.0.0.1:{server.server_address[1]}")
+    server.RequestHandlerClass = _make_handler(fake)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield fake
+    server.shutdown()
+    server.server_close()
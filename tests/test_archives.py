@@ -0,0 +1,198 @@
+"""Test reading the core metadata from the remote archives.
+The archives are created on the fly and served by a local fake index.
+"""
+import io
+import os
+import socket
+import tarfile
+import zipfile
+
+import pytest
+
+from pyp2spec.archives import HTTPRangeFile, read_sdist_metadata, read_wheel_metadata
+from pyp2spec.archives import MetadataNotInArchiveError, RangeRequestsNotSupportedError
+from pyp2spec.pypi_loaders import load_core_metadata_from_pypi, CoreMetadataNotFoundError
+from pyp2spec.http_cache import HTTPCache
+from pyp2spec.sessions import create_session
+
+
+METADATA = """\
+Metadata-Version: 2.4
+Name: foo
+Version: 1.0
+License-Expression: MIT
+Provides-Extra: test
+"""
+
+
+def make_wheel(metadata=METADATA, padding=512 * 1024):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as wheel:
+        # Incompressible data making the wheel big
+        wheel.writestr("foo/data.bin", os.urandom(padding))
+        wheel.writestr("foo/__init__.py", "")
+        if metadata is not None:
+            wheel.writestr("foo-1.0.dist-info/METADATA", metadata, compress_type=zipfile.ZIP_DEFLATED)
+        wheel.writestr("foo-1.0.dist-info/RECORD", "")
+    return archive.getvalue()
+
+
+def make_sdist(metadata=METADATA, padding=512 * 1024):
+    archive = io.BytesIO()
+
+    def add(tar, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+
+    with tarfile.open(fileobj=archive, mode="w:gz") as tar:
+        add(tar, "foo-1.0/foo.egg-info/PKG-INFO", b"Metadata-Version: 2.1\nName: wrong\n")
+        if metadata is not None:
+            add(tar, "foo-1.0/PKG-INFO", metadata.encode("utf-8"))
+        add(tar, "foo-1.0/data.bin", os.urandom(padding))
+    return archive.getvalue()
+
+
+def make_zip_sdist(metadata=METADATA):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as sdist:
+        sdist.writestr("foo-1.0/foo.egg-info/PKG-INFO", "Metadata-Version: 2.1\nName: wrong\n")
+        sdist.writestr("foo-1.0/PKG-INFO", metadata)
+        sdist.writestr("foo-1.0/data.bin", os.urandom(512 * 1024))
+    return archive.getvalue()
+
+
+@pytest.fixture
+def session():
+    return create_session(retries=0)
+
+
+def pkg_data(url, **entry_keys):
+    return {"urls": [{
+        "packagetype": "bdist_wheel",
+        "filename": "foo-1.0-py3-none-any.whl",
+        "url": url,
+        **entry_keys,
+    }]}
+
+
+def test_range_file_reads_parts(fake_pypi, session):
+    data = bytes(range(256)) * 1024
+    fake_pypi.add("/file", data)
+    remote_file = HTTPRangeFile(fake_pypi.url + "/file", session, block_size=1024)
+
+    assert remote_file.length == len(data)
+    remote_file.seek(-10, io.SEEK_END)
+    assert remote_file.read() == data[-10:]
+    assert remote_file.requests == 1
+    remote_file.seek(5000)
+    assert remote_file.read(100) == data[5000:5100]
+    assert remote_file.read(100) == data[5100:5200]
+    assert remote_file.requests == 2
+
+
+def test_read_wheel_metadata(fake_pypi, session):
+    wheel = make_wheel()
+    fake_pypi.add("/foo-1.0-py3-none-any.whl", wheel)
+
+    assert read_wheel_metadata(fake_pypi.url + "/foo-1.0-py3-none-any.whl", session) == METADATA
+    # The big file wasn't downloaded
+    assert fake_pypi.count() <= 3
+
+
+def test_wheel_without_metadata(fake_pypi, session):
+    fake_pypi.add("/foo-1.0-py3-none-any.whl", make_wheel(metadata=None))
+    with pytest.raises(MetadataNotInArchiveError):
+        read_wheel_metadata(fake_pypi.url + "/foo-1.0-py3-none-any.whl", session)
+
+
+def test_range_requests_not_supported(fake_pypi, session):
+    fake_pypi.ranges = False
+    fake_pypi.add("/foo-1.0-py3-none-any.whl", make_wheel())
+    with pytest.raises(RangeRequestsNotSupportedError):
+        read_wheel_metadata(fake_pypi.url + "/foo-1.0-py3-none-any.whl", session)
+
+
+def test_core_metadata_read_from_wheel_without_metadata_file(fake_pypi, session):
+    fake_pypi.add("/foo-1.0-py3-none-any.whl", make_wheel())
+    data = pkg_data(fake_pypi.url + "/foo-1.0-py3-none-any.whl")
+
+    result = load_core_metadata_from_pypi(data, session=session)
+    assert result["name"] == "foo"
+    assert result["provides_extra"] == ["test"]
+    assert fake_pypi.count("/foo-1.0-py3-none-any.whl.metadata") == 1
+
+
+def test_metadata_file_is_not_requested_when_not_advertised(fake_pypi, session):
+    fake_pypi.add("/foo-1.0-py3-none-any.whl", make_wheel())
+    data = pkg_data(fake_pypi.url + "/foo-1.0-py3-none-any.whl", **{"core-metadata": False})
+
+    assert load_core_metadata_from_pypi(data, session=session)["name"] == "foo"
+    assert fake_pypi.count("/foo-1.0-py3-none-any.whl.metadata") == 0
+
+
+def test_metadata_file_is_preferred(fake_pypi, session):
+    fake_pypi.add("/foo-1.0-py3-none-any.whl", make_wheel())
+    fake_pypi.add("/foo-1.0-py3-none-any.whl.metadata", METADATA.replace("foo", "bar"))
+    data = pkg_data(fake_pypi.url + "/foo-1.0-py3-none-any.whl", **{"core-metadata": {"sha256": "..."}})
+
+    assert load_core_metadata_from_pypi(data, session=session)["name"] == "bar"
+    assert fake_pypi.count("/foo-1.0-py3-none-any.whl") == 0
+
+
+def test_no_core_metadata_available(fake_pypi, session):
+    fake_pypi.ranges = False
+    fake_pypi.add("/foo-1.0-py3-none-any.whl", make_wheel())
+    with pytest.raises(CoreMetadataNotFoundError):
+        load_core_metadata_from_pypi(pkg_data(fake_pypi.url + "/foo-1.0-py3-none-any.whl"), session=session)
+
+
+def test_wheel_download_error(session):
+    # Nothing listens on the port any more
+    with socket.socket() as listener:
+        listener.bind(("127.0.0.1", 0))
+        url = f"http://127.0.0.1:{listener.getsockname()[1]}/foo-1.0-py3-none-any.whl"
+    data = pkg_data(url, **{"core-metadata": False})
+    with pytest.raises(CoreMetadataNotFoundError):
+        load_core_metadata_from_pypi(data, session=session)
+
+
+def test_read_sdist_metadata(fake_pypi, session):
+    fake_pypi.add("/foo-1.0.tar.gz", make_sdist())
+    assert read_sdist_metadata(fake_pypi.url + "/foo-1.0.tar.gz", "foo-1.0.tar.gz", session) == METADATA
+
+
+def test_sdist_is_not_cached(fake_pypi, tmp_path):
+    fake_pypi.add("/foo-1.0.tar.gz", make_sdist(padding=4 * 1024 * 1024))
+    cache = HTTPCache(tmp_path)
+    session = create_session(retries=0, cache=cache)
+
+    assert read_sdist_metadata(fake_pypi.url + "/foo-1.0.tar.gz", "foo-1.0.tar.gz", session) == METADATA
+    assert not list(cache.blobs_dir.iterdir())
+
+
+def test_read_zip_sdist_metadata(fake_pypi, session):
+    fake_pypi.add("/foo-1.0.zip", make_zip_sdist())
+    assert read_sdist_metadata(fake_pypi.url + "/foo-1.0.zip", "foo-1.0.zip", session) == METADATA
+    assert fake_pypi.count() <= 3
+
+
+@pytest.mark.parametrize("body", [make_sdist(metadata=None), b"not a tarball"])
+def test_sdist_without_metadata(fake_pypi, session, body):
+    fake_pypi.add("/foo-1.0.tar.gz", body)
+    with pytest.raises(MetadataNotInArchiveError):
+        read_sdist_metadata(fake_pypi.url + "/foo-1.0.tar.gz", "foo-1.0.tar.gz", session)
+
+
+def test_core_metadata_read_from_sdist_only_project(fake_pypi, session):
+    fake_pypi.add("/foo-1.0.tar.gz", make_sdist())
+    data = {"urls": [{
+        "packagetype": "sdist",
+        "filename": "foo-1.0.tar.gz",
+        "url": fake_pypi.url + "/foo-1.0.tar.gz",
+    }]}
+
+    result = load_core_metadata_from_pypi(data, session=session)
+    assert result["name"] == "foo"
+    assert result["license_expression"] == "MIT"
+    assert result["provides_extra"] == ["test"]
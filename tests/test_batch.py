@@ -0,0 +1,247 @@
+"""Test generating files for multiple packages in one process.
+The data are replayed from the recorded betamax cassettes.
+"""
+import io
+import json
+import os
+from concurrent.futures import Future
+
+import pytest
+
+try:
+    import tomllib
+except ImportError:
+    import tomli as tomllib
+
+from pyp2spec.batch import BatchFileError, parse_package_line, read_package_list, run_batch
+from pyp2spec.batch import create_renderer, generate_package, iter_batch, stream_summary
+from pyp2spec import batch, fetcher
+from pyp2spec.license_processor import ParsedExpressions
+from pyp2spec.pypi_loaders import PackageNotFoundError
+
+
+@pytest.mark.parametrize(
+    ("line", "expected"), [
+        ("click", {"package": "click"}),
+        ("sphinx==7.3.7", {"package": "sphinx", "version": "7.3.7"}),
+        ("  pytest   compat=7  ", {"package": "pytest", "compat": "7"}),
+        ("pello python-alt-version=3.12 version=1.0.4",
+            {"package": "pello", "python_alt_version": "3.12", "version": "1.0.4"}),
+        ("click  # comment", {"package": "click"}),
+        ("sphinx[docs,test]==7.3.7", {"package": "sphinx", "version": "7.3.7", "extras": "docs,test"}),
+        ("# comment", None),
+        ("", None),
+    ]
+)
+def test_parse_package_line(line, expected):
+    assert parse_package_line(line) == expected
+
+
+@pytest.mark.parametrize("line", ["foo bar", "foo unknown=1", "foo version="])
+def test_invalid_package_line(line):
+    with pytest.raises(BatchFileError):
+        parse_package_line(line)
+
+
+def test_read_package_list():
+    package_list = io.StringIO("click==8.1.7\n\n# numpy\naionotion==2.0.3\n")
+    assert read_package_list(package_list) == [
+        {"package": "click", "version": "8.1.7"},
+        {"package": "aionotion", "version": "2.0.3"},
+    ]
+
+
+def test_batch_generates_all_packages(cassettes_session, tmp_path):
+    packages = [
+        {"package": "click", "version": "8.1.7"},
+        {"package": "aionotion", "version": "2.0.3"},
+        {"package": "Pello", "version": "1.0.4", "python_alt_version": "3.9"},
+        {"package": "pytest", "compat": "7.2", "version": "7.2.1"},
+        {"package": "definitely-nonexisting-package-name"},
+    ]
+    results = run_batch(packages, {"output_dir": str(tmp_path)}, session=cassettes_session)
+
+    assert [r["status"] for r in results] == ["ok", "ok", "ok", "ok", "error"]
+    assert results[2]["spec"] == str(tmp_path / "python3.9-pello.spec")
+    for name in ("python-click", "python-aionotion", "python3.9-pello", "python-pytest7.2"):
+        with open(tmp_path / f"{name}.conf", "rb") as config_file:
+            generated = tomllib.load(config_file)
+        with open(f"tests/test_configs/default_{name}.conf", "rb") as config_file:
+            assert generated == tomllib.load(config_file)
+        assert (tmp_path / f"{name}.spec").exists()
+    # the results can be stored as JSON
+    json.dumps(results)
+
+
+def test_incremental_batch(serials_session, tmp_path):
+    adapter = serials_session.get_adapter("https://pypi.org")
+    adapter.serials = {
+        "https://pypi.org/pypi/click/json": "1",
+        "https://pypi.org/pypi/aionotion/json": "1",
+    }
+    packages = [
+        {"package": "click", "version": "8.1.7"},
+        {"package": "aionotion", "version": "2.0.3"},
+    ]
+    options = {"output_dir": str(tmp_path), "incremental": True}
+    results = run_batch(packages, options, session=serials_session)
+    assert [r["status"] for r in results] == ["ok", "ok"]
+    assert (tmp_path / ".pyp2spec-manifest.json").exists()
+    os.utime(tmp_path / "python-click.spec", (0, 0))
+
+    # Nothing changed, only the serials are checked
+    adapter.requests.clear()
+    results = run_batch(packages, options, session=serials_session)
+    assert [r["status"] for r in results] == ["unchanged", "unchanged"]
+    assert results[0] == {
+        "package": "click", "status": "unchanged", "version": "8.1.7",
+        "config": str(tmp_path / "python-click.conf"), "spec": str(tmp_path / "python-click.spec"),
+    }
+    assert sorted(adapter.requests) == sorted(adapter.serials)
+
+    # A new serial, but the same data, nothing is rendered nor rewritten
+    adapter.serials["https://pypi.org/pypi/click/json"] = "2"
+    adapter.requests.clear()
+    results = run_batch(packages, options, session=serials_session)
+    assert [r["status"] for r in results] == ["unchanged", "unchanged"]
+    assert "https://pypi.org/pypi/click/8.1.7/json" in adapter.requests
+    assert os.stat(tmp_path / "python-click.spec").st_mtime == 0
+
+    # Different options, the packages are generated again
+    options["automode"] = True
+    results = run_batch(packages, options, session=serials_session)
+    assert [r["status"] for r in results] == ["ok", "ok"]
+
+    # Removed outputs are generated again
+    os.unlink(tmp_path / "python-aionotion.spec")
+    results = run_batch(packages, options, session=serials_session)
+    assert [r["status"] for r in results] == ["unchanged", "ok"]
+    assert (tmp_path / "python-aionotion.spec").exists()
+
+
+def publish(fake_pypi, version, serial):
+    fake_pypi.add_json(
+        "/pypi/foo/json",
+        {
+            "info": {"name": "foo", "version": version, "summary": "Foo", "license": "MIT"},
+            "urls": [{
+                "packagetype": "sdist",
+                "filename": f"foo-{version}.tar.gz",
+                "url": f"{fake_pypi.url}/foo-{version}.tar.gz",
+            }],
+            "last_serial": serial,
+        },
+        headers={"X-PyPI-Last-Serial": str(serial), "ETag": f'"{serial}"'},
+    )
+
+
+def test_incremental_batch_with_cache(fake_pypi, tmp_path):
+    options = {
+        "output_dir": str(tmp_path), "incremental": True,
+        "cache_dir": str(tmp_path / "cache"), "index_url": fake_pypi.url,
+    }
+    publish(fake_pypi, "1.0", 1)
+    assert run_batch([{"package": "foo"}], options)[0]["version"] == "1.0"
+
+    # The cached project data are still fresh, but the serial tells they changed
+    publish(fake_pypi, "2.0", 2)
+    results = run_batch([{"package": "foo"}], options)
+    assert (results[0]["status"], results[0]["version"]) == ("ok", "2.0")
+
+    fake_pypi.requests.clear()
+    results = run_batch([{"package": "foo"}], options)
+    assert (results[0]["status"], results[0]["version"]) == ("unchanged", "2.0")
+    assert [method for method, _, _ in fake_pypi.requests] == ["HEAD"]
+
+
+def test_unchanged_files_are_not_rewritten(cassettes_session, tmp_path):
+    packages = [{"package": "click", "version": "8.1.7"}]
+    run_batch(packages, {"output_dir": str(tmp_path)}, session=cassettes_session)
+    for name in ("python-click.conf", "python-click.spec"):
+        os.utime(tmp_path / name, (0, 0))
+    run_batch(packages, {"output_dir": str(tmp_path)}, session=cassettes_session)
+    for name in ("python-click.conf", "python-click.spec"):
+        assert os.stat(tmp_path / name).st_mtime == 0
+
+
+def test_batch_with_processes(cassettes_session, tmp_path):
+    packages = [
+        {"package": "click", "version": "8.1.7"},
+        {"package": "aionotion", "version": "2.0.3"},
+        {"package": "Pello", "version": "1.0.4", "python_alt_version": "3.9"},
+        {"package": "pytest", "compat": "7.2", "version": "7.2.1"},
+        {"package": "definitely-nonexisting-package-name"},
+    ]
+    in_process, in_processes = tmp_path / "in_process", tmp_path / "in_processes"
+    in_process.mkdir()
+    in_processes.mkdir()
+    expected = run_batch(packages, {"output_dir": str(in_process)}, session=cassettes_session)
+    results = run_batch(packages, {"output_dir": str(in_processes), "processes": 2}, session=cassettes_session)
+
+    assert [r["status"] for r in results] == [r["status"] for r in expected]
+    assert [r.get("version") for r in results] == [r.get("version") for r in expected]
+    for name in ("python-click", "python-aionotion", "python3.9-pello", "python-pytest7.2"):
+        for suffix in (".conf", ".spec"):
+            assert (in_processes / f"{name}{suffix}").read_text() == (in_process / f"{name}{suffix}").read_text()
+
+
+def test_expressions_parsed_in_processes_are_merged(cassettes_session, tmp_path, monkeypatch):
+    expressions = ParsedExpressions()
+    monkeypatch.setattr(batch, "PARSED_EXPRESSIONS", expressions)
+    packages = [{"package": "click", "version": "8.1.7"}]
+    run_batch(packages, {"output_dir": str(tmp_path), "processes": 2}, session=cassettes_session)
+    assert expressions.changed
+    assert expressions.get("BSD-3-Clause") == ["BSD-3-Clause"]
+
+
+def test_rendering_errors_are_reported_from_processes(tmp_path):
+    fetched = Future()
+    fetched.set_result((None, {"info": {"name": "foo", "version": "1.0", "summary": "Foo"}, "urls": []}))
+    with create_renderer(1, {}, None) as renderer:
+        result = generate_package({"package": "foo", "output_dir": str(tmp_path)}, fetched, renderer=renderer)
+    assert result["status"] == "error"
+    assert result["error"] == "Sdist not found, valid spec file cannot be produced"
+
+
+def test_recursive_batch(monkeypatch, tmp_path):
+    requires_dist = {
+        "foo": ["bar>=1", 'baz[extra]; python_version >= "3"', 'pytest; extra == "test"', "requests"],
+        "bar": ["baz"],
+        "baz": ['qux; extra == "extra"'],
+        "qux": [],
+    }
+
+    def fake_fetch(package, version, compat, session, version_source, index_url):
+        if package not in requires_dist:
+            raise PackageNotFoundError(f"Package `{package}` was not found on PyPI")
+        core_metadata = {"name": package, "version": "1.0", "summary": "Summary", "requires_dist": requires_dist[package]}
+        return core_metadata, {"urls": [{"packagetype": "sdist", "filename": f"{package}-1.0.tar.gz"}]}
+
+    monkeypatch.setattr(fetcher, "fetch_package_data", fake_fetch)
+    packages = [{"package": "foo"}, {"package": "bar"}]
+    results = run_batch(packages, {"output_dir": str(tmp_path), "recursive": True}, packaged={"requests"})
+
+    assert [(r["package"], r["status"], r["requires"]) for r in results] == [
+        ("qux", "ok", []),
+        ("baz", "ok", ["qux"]),
+        ("bar", "ok", ["baz"]),
+        ("foo", "ok", ["bar", "baz"]),
+    ]
+    for name in ("foo", "bar", "baz", "qux"):
+        assert (tmp_path / f"python-{name}.spec").exists()
+
+
+def test_summary_is_streamed(cassettes_session, tmp_path):
+    packages = [{"package": "click", "version": "8.1.7"}, {"package": "definitely-nonexisting-package-name"}]
+    options = {"output_dir": str(tmp_path)}
+    all_options = [{**options, **package} for package in packages]
+    summary = tmp_path / "summary.jsonl"
+    results = stream_summary((r for _, r in iter_batch(all_options, options, cassettes_session)), str(summary))
+
+    first = next(results)
+    # Written before the next package is generated
+    assert json.loads(summary.read_text()) == first
+    rest = list(results)
+    lines = summary.read_text().splitlines()
+    assert [json.loads(line) for line in lines] == [first, *rest]
+    assert sorted(r["status"] for r in [first, *rest]) == ["error", "ok"]
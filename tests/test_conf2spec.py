@@ -4,11 +4,13 @@ The tests test both the automatically generated files and the custom
 configurations.
 """
 
+import os
 from pathlib import Path
 
 import pytest
 
 from pyp2spec import conf2spec
+from pyp2spec.variants import Variant
 
 
 @pytest.fixture
@@ -157,3 +159,43 @@ def test_source(version, extension, expected):
 )
 def test_pypi_version_or_macro(version, expected):
     assert conf2spec.pypi_version_or_macro(version) == expected
+
+
+def test_template_is_compiled_once(tmp_path, config_dir):
+    config = conf2spec.ConfigFile(conf2spec.load_config_file(config_dir + "default_python-click.conf"))
+    first = conf2spec.load_template(bytecode_cache_dir=str(tmp_path))
+    assert conf2spec.load_template(bytecode_cache_dir=str(tmp_path)) is first
+    assert conf2spec.fill_in_template(config, False, bytecode_cache_dir=str(tmp_path)).startswith("Name:")
+    # The bytecode is stored for the next processes
+    assert list(tmp_path.iterdir())
+
+
+def test_custom_template(tmp_path, config_dir):
+    template = tmp_path / "custom.spec"
+    template.write_text("Name: {{ python_compat_name }}\nVersion: {{ version }}\n")
+    config = conf2spec.ConfigFile(conf2spec.load_config_file(config_dir + "default_python-click.conf"))
+
+    rendered = conf2spec.fill_in_template(config, False, template=str(template))
+    assert rendered == "Name: python-click\nVersion: 8.1.7"
+
+    # Changes of the template are picked up
+    template.write_text("Name: {{ python_compat_name }}\n")
+    os.utime(template, (0, 0))
+    assert conf2spec.fill_in_template(config, False, template=str(template)) == "Name: python-click"
+
+
+def test_variants_are_rendered_as_if_separately(config_dir):
+    default = conf2spec.load_config_file(config_dir + "default_python-click.conf")
+    configs = [
+        conf2spec.ConfigFile(default),
+        conf2spec.ConfigFile({**default, "python_name": "python3.12-click", "python_alt_version": "3.12"}),
+        conf2spec.ConfigFile(default),
+    ]
+    variants = [Variant(), Variant(python_alt_version="3.12"), Variant(declarative_buildsystem=True)]
+
+    rendered = conf2spec.fill_in_template_variants(configs, variants)
+    assert rendered == [
+        conf2spec.fill_in_template(config, variant.declarative_buildsystem)
+        for config, variant in zip(configs, variants)
+    ]
+    assert len(set(rendered)) == 3
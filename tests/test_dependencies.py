@@ -0,0 +1,74 @@
+from concurrent.futures import Future
+
+import pytest
+
+from pyp2spec.dependencies import DependencyGraph, marker_environment, read_packaged_names, required
+from pyp2spec.pypi_loaders import PackageNotFoundError
+
+
+def fetched(requires_dist):
+    future = Future()
+    future.set_result(({"requires_dist": requires_dist}, {}))
+    return future
+
+
+@pytest.mark.parametrize(
+    ("extras", "python_alt_version", "expected"), [
+        ((), None, ["requests", "tomli"]),
+        (("test",), None, ["requests", "tomli", "pytest"]),
+        ((), "3.11", ["requests"]),
+    ]
+)
+def test_required(extras, python_alt_version, expected):
+    requires_dist = [
+        "requests>=2",
+        'tomli; python_version < "3.11"',
+        'pywin32; sys_platform == "win32"',
+        'pytest; extra == "test"',
+    ]
+    requirements = required(requires_dist, extras, marker_environment(python_alt_version or "3.10"))
+    assert [requirement.name for requirement in requirements] == expected
+
+
+def test_read_packaged_names():
+    lines = ["python3-requests\n", "python-Jinja2  # comment\n", "\n", "typing_extensions\n"]
+    assert read_packaged_names(lines) == {"requests", "jinja2", "typing-extensions"}
+
+
+def test_dependencies_are_discovered_once():
+    graph = DependencyGraph(packaged={"requests"})
+    roots = graph.add_roots([{"package": "foo", "version": "1.0"}, {"package": "Foo", "version": "1.0"}])
+    assert roots == [{"package": "foo", "version": "1.0"}]
+
+    new = graph.discover(roots[0], fetched(["bar", "baz[fast]", "requests"]))
+    assert new == [{"package": "bar"}, {"package": "baz"}]
+    assert graph.discover(new[0], fetched(["baz", "Foo"])) == []
+    # The extra is followed as soon as it's required
+    assert graph.discover(new[1], fetched(['qux; extra == "fast"', 'bar; extra == "slow"'])) == [{"package": "qux"}]
+    graph.discover({"package": "qux"}, fetched([]))
+
+    order, cycles = graph.build_order()
+    names = [name for name, _, _ in order]
+    assert names[:2] == ["qux", "baz"] and set(names[2:]) == {"foo", "bar"}
+    # foo and bar require each other
+    assert [set(cycle) for cycle in cycles] == [{("foo", None, None), ("bar", None, None)}]
+
+
+def test_new_extras_of_fetched_dependencies_are_followed():
+    graph = DependencyGraph()
+    [foo] = graph.add_roots([{"package": "foo", "python_alt_version": "3.12"}])
+    [bar] = graph.discover(foo, fetched(["bar"]))
+    assert bar == {"package": "bar", "python_alt_version": "3.12"}
+    assert graph.discover(bar, fetched(['baz; extra == "all"', "bar[all]"])) == [
+        {"package": "baz", "python_alt_version": "3.12"},
+    ]
+    assert graph.edges[("bar", None, "3.12")] == {("baz", None, "3.12")}
+
+
+def test_failed_packages_have_no_dependencies():
+    graph = DependencyGraph()
+    [foo] = graph.add_roots([{"package": "foo"}])
+    future = Future()
+    future.set_exception(PackageNotFoundError("Package `foo` was not found on PyPI"))
+    assert graph.discover(foo, future) == []
+    assert graph.build_order() == ([("foo", None, None)], [])
@@ -0,0 +1,47 @@
+import threading
+import time
+
+import pytest
+
+from pyp2spec import fetcher
+from pyp2spec.fetcher import fetch_concurrently
+from pyp2spec.pypi_loaders import PackageNotFoundError
+
+
+def test_fetch_concurrently(cassettes_session):
+    packages = [
+        {"package": "click", "version": "8.1.7"},
+        {"package": "pytest", "compat": "7"},
+        {"package": "definitely-nonexisting-package-name"},
+    ]
+    results = {p["package"]: f for p, f in fetch_concurrently(packages, cassettes_session, jobs=2)}
+
+    assert results.keys() == {"click", "pytest", "definitely-nonexisting-package-name"}
+    core_metadata, pypi_pkg_data = results["click"].result()
+    assert core_metadata["version"] == "8.1.7"
+    assert pypi_pkg_data["info"]["name"] == "click"
+    assert results["pytest"].result()[0]["version"] == "7.4.4"
+    with pytest.raises(PackageNotFoundError):
+        results["definitely-nonexisting-package-name"].result()
+
+
+def test_number_of_packages_in_flight_is_bounded(monkeypatch):
+    lock = threading.Lock()
+    in_flight = []
+    max_in_flight = []
+
+    def fake_fetch(package, version, compat, session, version_source, index_url):
+        with lock:
+            in_flight.append(package)
+            max_in_flight.append(len(in_flight))
+        time.sleep(0.01)
+        with lock:
+            in_flight.remove(package)
+        return None, {"package": package}
+
+    monkeypatch.setattr(fetcher, "fetch_package_data", fake_fetch)
+    packages = [{"package": f"pkg{i}"} for i in range(20)]
+    results = [f.result()[1]["package"] for _, f in fetch_concurrently(packages, None, jobs=3)]
+
+    assert sorted(results) == sorted(p["package"] for p in packages)
+    assert max(max_in_flight) <= 3
@@ -0,0 +1,162 @@
+"""Test the on-disk cache of the HTTP responses.
+The responses are served by a local fake index.
+"""
+
+import socket
+import threading
+
+import pytest
+from requests.exceptions import ChunkedEncodingError
+
+from pyp2spec.http_cache import HTTPCache, is_immutable
+from pyp2spec.sessions import create_session, revalidating_session
+
+
+def cached_session(directory, **kwargs):
+    return create_session(cache=HTTPCache(directory, **kwargs))
+
+
+@pytest.mark.parametrize(
+    ("url", "expected"), [
+        ("https://pypi.org/pypi/foo/1.0/json", True),
+        ("https://files.pythonhosted.org/packages/00/foo-1.0-py3-none-any.whl.metadata", True),
+        ("https://pypi.org/pypi/foo/json", False),
+        ("https://pypi.org/simple/foo/", False),
+    ]
+)
+def test_is_immutable(url, expected):
+    assert is_immutable(url) is expected
+
+
+def test_immutable_response_is_served_from_cache(fake_pypi, tmp_path):
+    fake_pypi.add_json("/pypi/foo/1.0/json", {"info": {"version": "1.0"}})
+    session = cached_session(tmp_path, ttl=0)
+    url = fake_pypi.url + "/pypi/foo/1.0/json"
+
+    assert session.get(url).json() == {"info": {"version": "1.0"}}
+    response = session.get(url)
+    assert response.json() == {"info": {"version": "1.0"}}
+    assert response.from_cache
+    assert fake_pypi.count() == 1
+
+
+def test_fresh_response_is_not_revalidated(fake_pypi, tmp_path):
+    fake_pypi.add_json("/pypi/foo/json", {"info": {"version": "2.0"}}, headers={"ETag": '"v1"'})
+    session = cached_session(tmp_path, ttl=3600)
+    url = fake_pypi.url + "/pypi/foo/json"
+
+    session.get(url)
+    assert session.get(url).json() == {"info": {"version": "2.0"}}
+    assert fake_pypi.count() == 1
+
+
+def test_revalidating_session(fake_pypi, tmp_path):
+    fake_pypi.add_json("/pypi/foo/json", {"info": {"version": "2.0"}}, headers={"ETag": '"v1"'})
+    session = cached_session(tmp_path, ttl=3600)
+    url = fake_pypi.url + "/pypi/foo/json"
+
+    session.get(url)
+    response = revalidating_session(session).get(url)
+    assert response.cache_status == "revalidated"
+    assert fake_pypi.requests[1][2]["If-None-Match"] == '"v1"'
+
+
+def test_stale_response_is_revalidated(fake_pypi, tmp_path):
+    fake_pypi.add_json("/pypi/foo/json", {"info": {"version": "2.0"}}, headers={"ETag": '"v1"'})
+    session = cached_session(tmp_path, ttl=0)
+    url = fake_pypi.url + "/pypi/foo/json"
+
+    session.get(url)
+    response = session.get(url)
+    assert response.status_code == 200
+    assert response.json() == {"info": {"version": "2.0"}}
+    assert fake_pypi.requests[1][2]["If-None-Match"] == '"v1"'
+
+    # The upstream document changed, a new one is stored
+    fake_pypi.add_json("/pypi/foo/json", {"info": {"version": "3.0"}}, headers={"ETag": '"v2"'})
+    assert session.get(url).json() == {"info": {"version": "3.0"}}
+    assert session.get(url).json() == {"info": {"version": "3.0"}}
+
+
+def test_errors_are_not_cached(fake_pypi, tmp_path):
+    session = cached_session(tmp_path)
+    url = fake_pypi.url + "/pypi/nonexistent/json"
+
+    assert session.get(url).status_code == 404
+    assert session.get(url).status_code == 404
+    assert fake_pypi.count() == 2
+
+
+def test_least_recently_used_bodies_are_evicted(fake_pypi, tmp_path):
+    for version in ("1.0", "2.0", "3.0"):
+        fake_pypi.add(f"/pypi/foo/{version}/json", version * 25)
+    session = cached_session(tmp_path, max_size=170)
+
+    for version in ("1.0", "2.0", "3.0"):
+        session.get(f"{fake_pypi.url}/pypi/foo/{version}/json")
+
+    cache = HTTPCache(tmp_path)
+    assert len(list(cache.blobs_dir.iterdir())) == 2
+    session.get(f"{fake_pypi.url}/pypi/foo/1.0/json")
+    assert fake_pypi.count("/pypi/foo/1.0/json") == 2
+
+
+def test_bodies_larger_than_the_cache_are_not_stored(fake_pypi, tmp_path):
+    fake_pypi.add("/pypi/foo/json", "x" * 5000)
+    session = cached_session(tmp_path, max_size=1000)
+    url = fake_pypi.url + "/pypi/foo/json"
+
+    assert session.get(url).text == "x" * 5000
+    assert session.get(url).text == "x" * 5000
+    assert not list(HTTPCache(tmp_path).blobs_dir.iterdir())
+    assert fake_pypi.count() == 2
+
+
+def test_body_evicted_after_the_lookup_is_requested_again(fake_pypi, tmp_path, monkeypatch):
+    fake_pypi.add_json("/pypi/foo/json", {"info": {"version": "2.0"}}, headers={"ETag": '"v1"'})
+    session = cached_session(tmp_path, ttl=0)
+    url = fake_pypi.url + "/pypi/foo/json"
+    session.get(url)
+
+    # Another thread evicts the body between the lookup and the response
+    cache = session.get_adapter(url).cache
+    monkeypatch.setattr(cache, "open_blob", lambda entry: None)
+    response = session.get(url)
+    assert response.json() == {"info": {"version": "2.0"}}
+    assert "If-None-Match" not in fake_pypi.requests[-1][2]
+
+
+def test_cache_is_scanned_only_when_over_budget(fake_pypi, tmp_path, monkeypatch):
+    for version in range(20):
+        fake_pypi.add(f"/pypi/foo/{version}/json", f"{version:04}" * 25)
+    cache = HTTPCache(tmp_path, max_size=1000)
+    session = create_session(cache=cache)
+    scans = []
+    evict = cache.evict
+    monkeypatch.setattr(cache, "evict", lambda keep=None: scans.append(keep) or evict(keep))
+
+    for version in range(20):
+        session.get(f"{fake_pypi.url}/pypi/foo/{version}/json")
+    # The initial total at the 1st store, then at the 11th one exceeding the budget,
+    # the eviction leaves 900 bytes, so every second store exceeds it again
+    assert len(scans) == 6
+    assert sum(path.stat().st_size for path in cache.blobs_dir.iterdir()) <= 1000
+
+
+def test_truncated_body_raises_requests_exception(tmp_path):
+    # Closes the connection before sending the whole announced body
+    listener = socket.create_server(("127.0.0.1", 0))
+
+    def serve():
+        connection, _ = listener.accept()
+        with connection:
+            connection.recv(65536)
+            connection.sendall(b"HTTP/1.1 200 OK\r\nContent-Length: 100\r\n\r\ntruncated")
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    session = cached_session(tmp_path)
+    with listener, pytest.raises(ChunkedEncodingError):
+        session.get(f"http://127.0.0.1:{listener.getsockname()[1]}/pypi/foo/json")
+    thread.join(10)
+    assert not list((tmp_path / "blobs").iterdir())
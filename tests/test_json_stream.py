@@ -0,0 +1,52 @@
+import base64
+import gzip
+import json
+
+import pytest
+
+from pyp2spec.json_stream import scan_project_data
+
+
+@pytest.fixture(scope="module")
+def pytest_project_data():
+    """The project data of pytest recorded in a cassette."""
+    cassette = "tests/fixtures/cassettes/" \
+        "test_pyp2conf.test_automatically_generated_compat_config_is_valid[pytest-7-None].json"
+    with open(cassette, "r", encoding="utf-8") as f:
+        response = json.load(f)["http_interactions"][0]["response"]
+    return gzip.decompress(base64.b64decode(response["body"]["base64_string"]))
+
+
+def chunked(data, size):
+    return (data[i:i + size] for i in range(0, len(data), size))
+
+
+@pytest.mark.parametrize("chunk_size", [13, 1024, 64 * 1024])
+def test_scan_project_data(pytest_project_data, chunk_size):
+    expected = json.loads(pytest_project_data)
+    data, versions = scan_project_data(chunked(pytest_project_data, chunk_size))
+    assert versions == list(expected["releases"])
+    assert data == {"info": expected["info"], "urls": expected["urls"]}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 1024])
+def test_scan_project_data_with_tricky_strings(chunk_size):
+    document = {
+        "info": {"summary": 'Žluťoučký kůň {"not": ["a", "key"]} \\', "version": "1.0"},
+        "last_serial": 42,
+        "releases": {
+            "0.1": [],
+            "1.0": [{"filename": "foo-1.0.tar.gz", "comment_text": "]}\\"}],
+            "2.0é": [{"yanked": True, "size": 12.5, "digests": {}}],
+        },
+        "urls": [{"filename": "foo-1.0.tar.gz"}],
+    }
+    raw = json.dumps(document, ensure_ascii=False, indent=2).encode("utf-8")
+    data, versions = scan_project_data(chunked(raw, chunk_size))
+    assert versions == ["0.1", "1.0", "2.0é"]
+    assert data == {"info": document["info"], "urls": document["urls"]}
+
+
+def test_incomplete_document_is_an_error(pytest_project_data):
+    with pytest.raises(ValueError):
+        scan_project_data(chunked(pytest_project_data[:-100], 1024))
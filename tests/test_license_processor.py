@@ -1,8 +1,15 @@
+import os
+import shutil
+
 import pytest
 
+from pyp2spec import license_processor
+from pyp2spec.http_cache import HTTPCache
 from pyp2spec.license_processor import classifiers_to_spdx_identifiers, license_keyword_to_spdx_identifiers
-from pyp2spec.license_processor import _is_compliant_with_fedora
+from pyp2spec.license_processor import _is_compliant_with_fedora, _load_license_index, build_license_index
+from pyp2spec.license_processor import ParsedExpressions
 from pyp2spec.license_processor import NoSuchClassifierError, check_compliance, generate_spdx_expression
+from pyp2spec.sessions import create_session
 
 
 @pytest.mark.parametrize(
@@ -79,7 +86,15 @@ def test_invalid_expressions_return_None(expression):
     )
 )
 def test_compliance_check_with_fedora(identifier, expected, fake_fedora_licenses):
-    assert _is_compliant_with_fedora(identifier, fake_fedora_licenses) is expected
+    assert _is_compliant_with_fedora(identifier, build_license_index(fake_fedora_licenses)) is expected
+
+
+def test_license_index(fake_fedora_licenses):
+    license_index = build_license_index(fake_fedora_licenses)
+    assert license_index["CECILL-C"] is True
+    assert license_index["CC0-1.0"] is False
+    # Compound expressions are looked up as a whole, regardless of the whitespace
+    assert _is_compliant_with_fedora("GPL-3.0-or-later  WITH\tClasspath-exception-2.0", license_index)
 
 
 def test_no_license_classifiers_and_no_license_keyword():
@@ -147,3 +162,83 @@ def test_check_compliance(license, good, bad, expected, fake_fedora_licenses):
     assert result is expected
     assert identifiers["good"] == good
     assert identifiers["bad"] == bad
+
+
+@pytest.fixture
+def no_index_building(monkeypatch):
+    """Fail if the license index is built from the full license data."""
+
+    def fail(fedora_licenses):
+        raise AssertionError("The license index was not loaded from the cache")
+
+    return lambda: monkeypatch.setattr(license_processor, "build_license_index", fail)
+
+
+def test_compiled_license_index_from_drive(tmp_path, no_index_building):
+    source = tmp_path / "fedora-licenses.json"
+    shutil.copy("tests/fedora_license_data.json", source)
+    session = create_session(cache=HTTPCache(tmp_path / "cache"))
+
+    license_index = _load_license_index(str(source), session=session)
+    assert license_index["CECILL-C"] is True
+    no_index_building()
+    assert _load_license_index(str(source), session=session) == license_index
+
+    # The compiled index is invalidated when the source changes
+    os.utime(source, ns=(0, 0))
+    with pytest.raises(AssertionError):
+        _load_license_index(str(source), session=session)
+
+
+def test_compiled_license_index_from_url(tmp_path, fake_pypi, fake_fedora_licenses, no_index_building):
+    fake_pypi.add_json("/fedora-licenses.json", fake_fedora_licenses, headers={"ETag": '"1"'})
+    url = fake_pypi.url + "/fedora-licenses.json"
+    session = create_session(cache=HTTPCache(tmp_path / "cache", ttl=0))
+    missing = str(tmp_path / "missing.json")
+
+    license_index = _load_license_index(missing, session=session, url=url)
+    assert license_index["CC0-1.0"] is False
+    no_index_building()
+    assert _load_license_index(missing, session=session, url=url) == license_index
+
+    fake_pypi.add_json("/fedora-licenses.json", fake_fedora_licenses, headers={"ETag": '"2"'})
+    with pytest.raises(AssertionError):
+        _load_license_index(missing, session=session, url=url)
+
+
+def test_parsed_expressions_are_memoized(monkeypatch):
+    monkeypatch.setattr(license_processor, "PARSED_EXPRESSIONS", ParsedExpressions())
+    assert license_keyword_to_spdx_identifiers("MIT OR Apache-2.0") == ["Apache-2.0", "MIT"]
+    assert license_keyword_to_spdx_identifiers("Fake-identifier") is None
+
+    monkeypatch.setattr(license_processor, "get_licensing", lambda: pytest.fail("Parsed again"))
+    identifiers = license_keyword_to_spdx_identifiers("MIT OR Apache-2.0")
+    assert identifiers == ["Apache-2.0", "MIT"]
+    # The memoized list can't be modified by the callers
+    identifiers.append("BSD-3-Clause")
+    assert license_keyword_to_spdx_identifiers("MIT OR Apache-2.0") == ["Apache-2.0", "MIT"]
+    assert license_keyword_to_spdx_identifiers("Fake-identifier") is None
+
+
+def test_parsed_expressions_memo_is_bounded():
+    memo = ParsedExpressions(max_size=2)
+    memo.put("MIT", ["MIT"])
+    memo.put("BSD-3-Clause", ["BSD-3-Clause"])
+    memo.get("MIT")
+    memo.put("ISC", ["ISC"])
+    assert list(memo.entries) == ["MIT", "ISC"]
+
+
+def test_parsed_expressions_are_persisted(tmp_path):
+    cache = HTTPCache(tmp_path)
+    memo = ParsedExpressions()
+    memo.put("MIT", ["MIT"])
+    memo.put("Fake-identifier", None)
+    memo.store(cache)
+
+    loaded = ParsedExpressions()
+    loaded.load(cache)
+    assert loaded.get("MIT") == ["MIT"]
+    assert "Fake-identifier" in loaded
+    assert loaded.get("Fake-identifier") is None
+    assert not loaded.changed
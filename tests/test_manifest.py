@@ -0,0 +1,110 @@
+"""Test the manifest of inputs used for the incremental regeneration."""
+import pytest
+from requests import Session
+
+from pyp2spec.manifest import MANIFEST_FORMAT, Manifest, metadata_fingerprint, package_key
+from pyp2spec.manifest import fetched_inputs, template_fingerprint, upstream_serial
+
+
+@pytest.mark.parametrize(
+    ("options", "expected"), [
+        ({"package": "click"}, "click"),
+        ({"package": "pytest", "compat": "7", "version": None}, "pytest compat=7"),
+        ({"package": "pello", "version": "1.0.4", "python_alt_version": "3.12"},
+            "pello version=1.0.4 python-alt-version=3.12"),
+    ]
+)
+def test_package_key(options, expected):
+    assert package_key(options) == expected
+
+
+@pytest.mark.parametrize(
+    ("headers", "expected"), [
+        ({"X-PyPI-Last-Serial": "123", "ETag": '"abc"'}, "serial:123"),
+        ({"ETag": '"abc"'}, 'etag:"abc"'),
+        ({}, None),
+    ]
+)
+def test_upstream_serial(fake_pypi, headers, expected):
+    fake_pypi.add("/pypi/foo/json", {}, headers=headers)
+    assert upstream_serial("foo", Session(), fake_pypi.url) == expected
+    assert fake_pypi.requests[0][0] == "HEAD"
+
+
+def test_upstream_serial_not_found(fake_pypi):
+    assert upstream_serial("foo", Session(), fake_pypi.url) is None
+
+
+def test_metadata_fingerprint_ignores_last_serial():
+    core_metadata = {"name": "foo"}
+    assert (
+        metadata_fingerprint(core_metadata, {"info": {"version": "1.0"}, "last_serial": 1})
+        == metadata_fingerprint(core_metadata, {"info": {"version": "1.0"}, "last_serial": 2})
+        != metadata_fingerprint(core_metadata, {"info": {"version": "1.1"}, "last_serial": 2})
+    )
+
+
+@pytest.mark.parametrize(
+    ("upstream", "pypi_pkg_data", "expected"), [
+        ("serial:2", {"last_serial": 2}, "serial:2"),
+        # Older data, e.g. from a cache
+        ("serial:2", {"last_serial": 1}, "serial:1"),
+        ("serial:2", {}, "serial:2"),
+        ('etag:"abc"', {"last_serial": 1}, 'etag:"abc"'),
+        (None, {"last_serial": 1}, None),
+    ]
+)
+def test_fetched_inputs(upstream, pypi_pkg_data, expected):
+    inputs = {"upstream": upstream, "pyp2spec": "1.0"}
+    assert fetched_inputs(inputs, pypi_pkg_data) == {"upstream": expected, "pyp2spec": "1.0"}
+
+
+def test_template_fingerprint(tmp_path):
+    template = tmp_path / "custom.spec"
+    template.write_text("Name: {{ python_name }}\n")
+    default = template_fingerprint()
+    custom = template_fingerprint(str(template))
+    assert default != custom
+    template.write_text("Name: {{ python_name }}\nVersion: 1\n")
+    assert template_fingerprint(str(template)) != custom
+
+
+def test_manifest_roundtrip(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    manifest = Manifest.load(path)
+    assert manifest.packages == {}
+    manifest.update("foo", {"upstream": "serial:1"}, "hash", version="1.0", config="foo.conf", spec="foo.spec")
+    manifest.store()
+    assert Manifest.load(path).packages == manifest.packages
+
+
+@pytest.mark.parametrize("contents", ["not json", f'{{"format": {MANIFEST_FORMAT + 1}, "packages": {{}}}}'])
+def test_invalid_manifest_is_ignored(tmp_path, contents):
+    path = tmp_path / "manifest.json"
+    path.write_text(contents)
+    assert Manifest.load(str(path)).packages == {}
+
+
+def test_freshness(tmp_path):
+    config, spec = tmp_path / "foo.conf", tmp_path / "foo.spec"
+    inputs = {"upstream": "serial:1", "options": "a"}
+    manifest = Manifest(str(tmp_path / "manifest.json"))
+    manifest.update("foo", inputs, "hash", version="1.0", config=str(config), spec=str(spec))
+
+    # The outputs were removed
+    assert not manifest.is_fresh("foo", inputs)
+    config.touch()
+    spec.touch()
+    assert manifest.is_fresh("foo", inputs)
+    assert manifest.result("foo") == {"status": "unchanged", "version": "1.0", "config": str(config), "spec": str(spec)}
+
+    assert not manifest.is_fresh("foo", {**inputs, "options": "b"})
+    assert not manifest.is_fresh("bar", inputs)
+    # Without the upstream serial the freshness can't be told
+    assert not manifest.is_fresh("foo", {**inputs, "upstream": None})
+
+    new_serial = {**inputs, "upstream": "serial:2"}
+    assert not manifest.is_fresh("foo", new_serial)
+    assert manifest.is_unchanged("foo", new_serial, "hash")
+    assert not manifest.is_unchanged("foo", new_serial, "other hash")
+    assert not manifest.is_unchanged("foo", {**new_serial, "options": "b"}, "hash")
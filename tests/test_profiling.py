@@ -0,0 +1,96 @@
+"""Test the opt-in timing of the stages and counting of the HTTP requests."""
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from pyp2spec import profiling
+from pyp2spec.conf2spec import main as conf2spec_main
+from pyp2spec.http_cache import HTTPCache
+from pyp2spec.profiling import Profiler, timed
+from pyp2spec.sessions import create_session
+
+
+@timed("double")
+def double(x):
+    return 2 * x
+
+
+def test_timed_without_profiling():
+    assert profiling.PROFILER is None
+    assert double(2) == 4
+
+
+def test_timed_records_every_call(tmp_path):
+    with profiling.profiling(str(tmp_path / "report.json")) as profiler:
+        assert [double(x) for x in range(10)] == list(range(0, 20, 2))
+        with pytest.raises(TypeError):
+            double(None)
+    assert profiling.PROFILER is None
+    assert profiler.report()["stages"]["double"]["calls"] == 11
+
+
+def test_report_percentiles():
+    profiler = Profiler()
+    for duration in range(1, 101):
+        profiler.record("stage", duration)
+    profiler.count("requests", 3)
+    report = profiler.report()
+    assert report["stages"]["stage"] == {
+        "calls": 100, "total": 5050, "min": 1, "p50": 50, "p90": 90, "p99": 99, "max": 100,
+    }
+    assert report["counters"] == {"requests": 3}
+
+
+def test_report_to_stderr(capsys):
+    with profiling.profiling("-"):
+        double(1)
+    assert json.loads(capsys.readouterr().err)["stages"]["double"]["calls"] == 1
+
+
+def test_http_counters(fake_pypi, tmp_path):
+    fake_pypi.add("/pypi/foo/1.0/json", "x" * 100)
+    fake_pypi.add("/pypi/foo/json", "y" * 50, headers={"ETag": '"1"'})
+    session = create_session(cache=HTTPCache(tmp_path, ttl=0))
+
+    with profiling.profiling(str(tmp_path / "report.json")) as profiler:
+        for _ in range(3):
+            session.get(f"{fake_pypi.url}/pypi/foo/1.0/json")
+            session.get(f"{fake_pypi.url}/pypi/foo/json")
+        session.get(f"{fake_pypi.url}/pypi/bar/json")
+    assert profiler.report()["counters"] == {
+        # The versioned data are immutable, the project data are revalidated
+        "bytes": 150,
+        "cache_hits": 2,
+        "cache_misses": 2,
+        "cache_revalidations": 2,
+        "requests": 5,
+    }
+
+
+def test_conf2spec_profile(tmp_path):
+    report = tmp_path / "report.json"
+    result = CliRunner().invoke(conf2spec_main, [
+        "tests/test_configs/default_python-click.conf",
+        "--spec-output", str(tmp_path / "python-click.spec"),
+        "--profile", str(report),
+    ])
+    assert result.exit_code == 0
+    data = json.loads(report.read_text())
+    assert set(data["stages"]) == {"fill_in_template", "write_files"}
+    assert data["counters"] == {"files_written": 1}
+    assert data["wall_time"] >= data["stages"]["fill_in_template"]["total"]
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_batch_profile(cassettes_session, tmp_path, processes):
+    from pyp2spec.batch import run_batch
+
+    packages = [{"package": "click", "version": "8.1.7"}, {"package": "aionotion", "version": "2.0.3"}]
+    with profiling.profiling(str(tmp_path / "report.json")):
+        run_batch(packages, {"output_dir": str(tmp_path), "processes": processes}, session=cassettes_session)
+    stages = json.loads((tmp_path / "report.json").read_text())["stages"]
+    for stage in ("fetch_package_data", "load_from_pypi", "load_core_metadata_from_pypi",
+                  "resolve_license_expression", "generate_package", "fill_in_template"):
+        assert stages[stage]["calls"] == 2
+    assert stages["write_files"]["calls"] == 4
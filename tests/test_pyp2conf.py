@@ -2,7 +2,11 @@
 The data is downloaded from the PyPI and stored in betamax cassettes
 to prevent loading from the internet on each request.
 """
+import os
+import sys
+
 import pytest
+import tomli_w
 
 try:
     import tomllib
@@ -10,7 +14,11 @@ except ImportError:
     import tomli as tomllib
 
 from pyp2spec.pyp2conf import create_config_contents, prepare_package_info, check_compliance, gather_package_info
+from pyp2spec.pyp2conf import config_contents, create_config_variants, dump_config
 from pyp2spec.pypi_loaders import PackageNotFoundError
+from pyp2spec.pyp2spec import create_variants
+from pyp2spec.utils import Pyp2specError
+from pyp2spec.variants import Variant, VariantError
 
 
 def test_non_existent_package(betamax_session):
@@ -443,3 +451,92 @@ def test_gather_package_info_core_metadata():
     assert result.url == "https://example.com"
     assert result.archive_name == "example-7.0-tar.gz"
     assert result.archful is True
+
+
+def test_latest_version_needs_two_requests(cassettes_session):
+    create_config_contents({"package": "sphinx"}, session=cassettes_session)
+    assert cassettes_session.get_adapter("https://pypi.org").requests == [
+        "https://pypi.org/pypi/sphinx/json",
+        "https://files.pythonhosted.org/packages/26/60/1ddff83a56d33aaf6f10ec8ce84b4c007d9368b21008876fceda7e7381ef/sphinx-8.1.3-py3-none-any.whl.metadata",
+    ]
+
+
+def test_variants_share_the_downloaded_data(cassettes_session):
+    variants = [Variant(), Variant(python_alt_version="3.12"), Variant(automode=True)]
+    all_contents = create_config_variants({"package": "sphinx"}, variants, session=cassettes_session)
+    # Downloaded once for all the variants
+    assert len(cassettes_session.get_adapter("https://pypi.org").requests) == 2
+
+    for variant, contents in zip(variants, all_contents):
+        assert contents == create_config_contents(variant.apply({"package": "sphinx"}), session=cassettes_session)
+    assert [contents["python_name"] for contents in all_contents] == ["python-sphinx", "python3.12-sphinx", "python-sphinx"]
+    assert "automode" not in all_contents[0] and all_contents[2]["automode"] is True
+
+
+@pytest.mark.parametrize(
+    ("variant", "expected"), [
+        ("default", Variant()),
+        ("python-alt-version=3.12", Variant(python_alt_version="3.12")),
+        ("python-alt-version=3.12, declarative-buildsystem", Variant("3.12", declarative_buildsystem=True)),
+        ("automode", Variant(automode=True)),
+    ]
+)
+def test_parse_variant(variant, expected):
+    assert Variant.parse(variant) == expected
+
+
+@pytest.mark.parametrize(
+    "variant", ["python-alt-version", "automode=1", "foo", "automode,declarative-buildsystem"]
+)
+def test_parse_invalid_variant(variant):
+    with pytest.raises(VariantError):
+        Variant.parse(variant)
+
+
+@pytest.mark.parametrize(
+    "option", [{"python_alt_version": "3.12"}, {"automode": True}, {"declarative_buildsystem": True}]
+)
+def test_variant_options_are_not_overridden(option):
+    with pytest.raises(Pyp2specError, match="can't be combined with --variant"):
+        create_variants({"package": "sphinx", "variant": ("default", "automode"), **option})
+
+
+@pytest.mark.parametrize("conf", sorted(os.listdir("tests/test_configs")))
+def test_dump_config_is_the_same_as_tomli_w(conf):
+    with open(f"tests/test_configs/{conf}", "rb") as config_file:
+        contents = tomllib.load(config_file)
+    assert dump_config(contents) == tomli_w.dumps(contents, multiline_strings=True)
+
+
+@pytest.mark.parametrize(
+    "value", [
+        'Quotes " and backslashes \\ and tabs \t',
+        "Control characters \x00\x1b\x7f\b\f\r and ünïcödé",
+        "Multiline\r\nsummary\nwith \"\"\" quotes",
+        [],
+        ["docs", 'quoted "extra"'],
+        True,
+        42,
+    ]
+)
+def test_dump_config_values(value):
+    contents = {"pypi_name": "foo", "value": value}
+    assert dump_config(contents) == tomli_w.dumps(contents, multiline_strings=True)
+    expected = value.replace("\r\n", "\n") if isinstance(value, str) else value
+    assert tomllib.loads(dump_config(contents))["value"] == expected
+
+
+def test_dump_config_falls_back_to_tomli_w():
+    contents = {"pypi_name": "foo", "dotted.key": "value", "table": {"a": 1}}
+    assert dump_config(contents) == tomli_w.dumps(contents, multiline_strings=True)
+
+
+@pytest.mark.skipif(sys.version_info < (3, 10), reason="slotted dataclasses need Python 3.10")
+def test_package_info_is_slotted():
+    pkg_info = prepare_package_info({"name": "foo", "version": "1.0"})
+    assert not hasattr(pkg_info, "__dict__")
+    # The fields set later are not in the contents until they're set
+    assert "python_name" not in config_contents(pkg_info)
+    pkg_info.python_name = "python-foo"
+    assert config_contents(pkg_info)["python_name"] == "python-foo"
+    assert list(config_contents(pkg_info)) == sorted(config_contents(pkg_info))
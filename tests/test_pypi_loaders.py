@@ -5,9 +5,11 @@ to prevent loading from the internet on each request.
 
 import pytest
 
+from pyp2spec import pypi_loaders
 from pyp2spec.pypi_loaders import load_from_pypi, load_core_metadata_from_pypi
-from pyp2spec.pypi_loaders import PackageNotFoundError, CompatibleVersionNotFoundError
-from pyp2spec.pypi_loaders import _find_available_versions, _find_compatible_version
+from pyp2spec.pypi_loaders import PackageNotFoundError, CompatibleVersionNotFoundError, SimpleAPIError
+from pyp2spec.pypi_loaders import _find_compatible_version
+from pyp2spec.pypi_loaders import _get_simple_project_versions
 
 
 def test_load_from_pypi_no_version_given(betamax_session):
@@ -26,6 +28,22 @@ def test_load_from_pypi_package_not_found(betamax_session):
         load_from_pypi(package, session=betamax_session)
 
 
+@pytest.mark.parametrize(
+    ("package", "version", "compat", "expected_requests"), [
+        # the latest version is described by the project data
+        ("Sphinx", None, None, ["https://pypi.org/pypi/Sphinx/json"]),
+        ("Sphinx", "7.3.7", None, ["https://pypi.org/pypi/Sphinx/7.3.7/json"]),
+        # older compatible version has to be loaded separately
+        ("pytest", None, "7", ["https://pypi.org/pypi/pytest/json", "https://pypi.org/pypi/pytest/7.4.4/json"]),
+    ]
+)
+def test_load_from_pypi_number_of_requests(cassettes_session, package, version, compat, expected_requests):
+    result = load_from_pypi(package, version=version, compat=compat, session=cassettes_session)
+    assert cassettes_session.get_adapter("https://pypi.org").requests == expected_requests
+    assert "releases" not in result
+    assert result["urls"]
+
+
 def test_load_core_metadata(betamax_session):
     pypi_pkg_data = load_from_pypi("Sphinx", session=betamax_session)
     result = load_core_metadata_from_pypi(pypi_pkg_data, betamax_session)
@@ -34,29 +52,126 @@ def test_load_core_metadata(betamax_session):
     assert result["provides_extra"] == ["docs", "lint", "test"]
 
 
-
-{"2.0.0":["..."],"2.0.1":["..."],"3.0.0":["..."],"6.0.1":["..."],"2.1.0":["..."],"2.1.1":["..."]}
-def test_find_available_versions():
-    releases = {
-        "2.0.0":["..."],"2.0.1":["..."],"3.0.0":["..."],
-        "6.0.1":["..."],"2.1.0":["..."],"2.1.1":["..."]
-    }
-    expected = ["2.0.0", "2.0.1", "3.0.0", "6.0.1", "2.1.0", "2.1.1"]
-    assert _find_available_versions(releases) == expected
-
-
 @pytest.mark.parametrize(
     ("compat", "available_versions", "expected"), [
         ("7", ["6.0.0", "7.0.0", "7.9.1"], "7.9.1"),
         ("7.4", ["7.4.2", "6.0.0", "7.4.3", "7.0.0", "7.0.1"], "7.4.3"),
         ("7.2", ["7.4.2", "7.2.3", "7.4.3", "6.0.0", "7.0.1"], "7.2.3"),
         ("7.4.2", ["7.4.2", "7.2.3", "7.4.3", "6.0.0", "7.0.1"], "7.4.2"),
+        ("7.1", ["7.1.2", "7.10.0", "7.1.10", "7.11"], "7.1.10"),  # 7.1 doesn't match 7.10
+        ("7.1", ["7.1", "7.1.post1", "7.1.0"], "7.1.post1"),
+        ("2", ["2.0", "1!1.0", "legacy-version"], "2.0"),
+        ("1!1", ["2.0", "1!1.0", "1!1.1", "1!2.0"], "1!1.1"),
     ]
 )
 def test_find_compatible_version(compat, available_versions, expected):
     assert _find_compatible_version(compat, available_versions) == expected
 
 
-def test_no_compatible_version_available():
+@pytest.mark.parametrize("compat", ["9", "7.0.1", "seven"])
+def test_no_compatible_version_available(compat):
     with pytest.raises(CompatibleVersionNotFoundError):
-        _find_compatible_version("9", ["6.0.0", "7.0.0", "7.9.1"])
+        _find_compatible_version(compat, ["6.0.0", "7.0.0", "7.9.1"])
+
+
+def test_simple_api_versions(fake_pypi):
+    fake_pypi.add(
+        "/simple/foo-bar/",
+        {"meta": {"api-version": "1.1"}, "name": "foo-bar", "versions": ["1.0", "1.1"], "files": []},
+        headers={"Content-Type": "application/vnd.pypi.simple.v1+json"},
+    )
+    versions = _get_simple_project_versions("Foo_Bar", index_url=fake_pypi.url)
+    assert versions == ["1.0", "1.1"]
+    assert fake_pypi.requests[0][2]["Accept"] == "application/vnd.pypi.simple.v1+json"
+
+
+@pytest.mark.parametrize(
+    ("body", "headers"), [
+        ("<html></html>", {"Content-Type": "text/html"}),
+        # PEP 691 response without the PEP 700 `versions` key
+        ({"meta": {"api-version": "1.0"}, "name": "foo", "files": []},
+            {"Content-Type": "application/vnd.pypi.simple.v1+json"}),
+    ]
+)
+def test_simple_api_not_supported(fake_pypi, body, headers):
+    fake_pypi.add("/simple/foo/", body, headers=headers)
+    with pytest.raises(SimpleAPIError):
+        _get_simple_project_versions("foo", index_url=fake_pypi.url)
+
+
+def test_simple_api_package_not_found(fake_pypi):
+    with pytest.raises(PackageNotFoundError):
+        _get_simple_project_versions("foo", index_url=fake_pypi.url)
+
+
+def test_load_from_pypi_compat_with_simple_api(cassettes_session, monkeypatch):
+    monkeypatch.setattr(
+        pypi_loaders, "_get_simple_project_versions",
+        lambda package, **kwargs: ["6.0.0", "7.4.4", "7.0.0", "8.0.0"]
+    )
+    result = load_from_pypi("pytest", compat="7", version_source="simple", session=cassettes_session)
+    assert result["info"]["version"] == "7.4.4"
+    assert cassettes_session.get_adapter("https://pypi.org").requests == ["https://pypi.org/pypi/pytest/7.4.4/json"]
+
+
+def test_load_from_pypi_compat_falls_back_to_json_api(cassettes_session, monkeypatch):
+    def simple_api_not_supported(package, **kwargs):
+        raise SimpleAPIError("not supported")
+
+    monkeypatch.setattr(pypi_loaders, "_get_simple_project_versions", simple_api_not_supported)
+    result = load_from_pypi("pytest", compat="7", version_source="simple", session=cassettes_session)
+    assert result["info"]["version"] == "7.4.4"
+    assert cassettes_session.get_adapter("https://pypi.org").requests == [
+        "https://pypi.org/pypi/pytest/json", "https://pypi.org/pypi/pytest/7.4.4/json"
+    ]
+
+
+def _project_data(version, releases, url):
+    return {
+        "info": {"name": "foo", "version": version},
+        "releases": {release: [] for release in releases},
+        "urls": [{
+            "packagetype": "bdist_wheel",
+            "filename": f"foo-{version}-py3-none-any.whl",
+            "url": url,
+            "core-metadata": {"sha256": "abc"},
+        }],
+    }
+
+
+@pytest.mark.parametrize("index_url", ["{url}", "{url}/"])
+def test_load_from_pypi_custom_index(fake_pypi, index_url):
+    fake_pypi.add("/pypi/foo/json", _project_data("2.0", ["1.0", "2.0"], "/packages/foo-2.0-py3-none-any.whl"))
+    result = load_from_pypi("foo", index_url=index_url.format(url=fake_pypi.url))
+    assert result["info"]["version"] == "2.0"
+    # The relative file URLs point to the mirror
+    assert result["urls"][0]["url"] == f"{fake_pypi.url}/packages/foo-2.0-py3-none-any.whl"
+    assert [r[1] for r in fake_pypi.requests] == ["/pypi/foo/json"]
+
+
+def test_load_from_pypi_custom_index_compat(fake_pypi):
+    fake_pypi.add("/pypi/foo/json", _project_data("2.0", ["1.0", "1.1", "2.0"], "x.whl"))
+    fake_pypi.add("/pypi/foo/1.1/json", _project_data("1.1", [], "../../../packages/foo-1.1-py3-none-any.whl"))
+    result = load_from_pypi("foo", compat="1", index_url=fake_pypi.url)
+    assert result["info"]["version"] == "1.1"
+    assert result["urls"][0]["url"] == f"{fake_pypi.url}/packages/foo-1.1-py3-none-any.whl"
+
+
+def test_load_from_pypi_custom_index_simple_api(fake_pypi):
+    fake_pypi.add(
+        "/simple/foo/",
+        {"meta": {"api-version": "1.1"}, "name": "foo", "versions": ["1.0", "1.1", "2.0"], "files": []},
+        headers={"Content-Type": "application/vnd.pypi.simple.v1+json"},
+    )
+    fake_pypi.add("/pypi/foo/1.1/json", _project_data("1.1", [], "/packages/foo-1.1-py3-none-any.whl"))
+    result = load_from_pypi("foo", compat="1", version_source="simple", index_url=fake_pypi.url)
+    assert result["info"]["version"] == "1.1"
+    assert [r[1] for r in fake_pypi.requests] == ["/simple/foo/", "/pypi/foo/1.1/json"]
+
+
+def test_load_core_metadata_from_custom_index(fake_pypi):
+    fake_pypi.add("/pypi/foo/json", _project_data("2.0", ["2.0"], "/packages/foo-2.0-py3-none-any.whl"))
+    fake_pypi.add("/packages/foo-2.0-py3-none-any.whl.metadata", "Metadata-Version: 2.1\nName: foo\nVersion: 2.0\n")
+    core_metadata = load_core_metadata_from_pypi(load_from_pypi("foo", index_url=fake_pypi.url))
+    assert core_metadata["name"] == "foo"
+    assert fake_pypi.requests[-1][1] == "/packages/foo-2.0-py3-none-any.whl.metadata"
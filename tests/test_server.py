@@ -0,0 +1,144 @@
+"""Test the long-running server generating config and spec files.
+The data are replayed from the recorded betamax cassettes.
+"""
+import json
+import socket
+import threading
+from pathlib import Path
+
+import pytest
+import requests
+
+try:
+    import tomllib
+except ImportError:
+    import tomli as tomllib
+
+from pyp2spec.server import RequestError, ServerError, SpecGenerator, create_server, parse_request_options
+
+
+def serve(server):
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    return thread
+
+
+@pytest.fixture
+def server_url(cassettes_session):
+    server = create_server(SpecGenerator({}, cassettes_session), port=0)
+    serve(server)
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_parse_request_options():
+    options = parse_request_options(
+        b'{"package": "pytest", "compat": "7", "fedora-compliant": true, "automode": false}'
+    )
+    assert options["package"] == "pytest"
+    assert options["compat"] == "7"
+    assert options["fedora_compliant"] is True
+    assert options["automode"] is False
+    assert options["version"] is None
+
+
+def test_package_is_not_parsed_as_option():
+    assert parse_request_options(b'{"package": "--help"}')["package"] == "--help"
+
+
+@pytest.mark.parametrize(
+    "body", [
+        b"not json",
+        b'["click"]',
+        b'{"version": "1.0"}',
+        b'{"package": "click", "spec-output": "/etc/passwd"}',
+        b'{"package": "click", "automode": "yes"}',
+        b'{"package": "click", "version-source": "nonsense"}',
+        b'{"package": "click", "automode": true, "declarative-buildsystem": true}',
+    ]
+)
+def test_invalid_request_options(body):
+    with pytest.raises(RequestError):
+        parse_request_options(body)
+
+
+def test_generate(server_url):
+    response = requests.post(f"{server_url}/generate", json={"package": "click", "version": "8.1.7"})
+    assert response.status_code == 200
+    result = response.json()
+    with open("tests/test_configs/default_python-click.conf", "rb") as config_file:
+        assert result["config"] == tomllib.load(config_file)
+    # The file regression fixture adds the trailing newline
+    assert result["spec"] == Path("tests/expected_specfiles/python-click.spec").read_text().rstrip("\n")
+
+    # The next requests are served by the same warm process
+    response = requests.post(f"{server_url}/generate", json={"package": "pytest", "compat": "7.2", "version": "7.2.1"})
+    assert response.json()["config"]["compat"] == "7.2"
+
+
+@pytest.mark.parametrize(
+    ("body", "status"), [
+        ({"package": "click", "unknown": 1}, 400),
+        ({"package": "definitely-nonexisting-package-name"}, 422),
+    ]
+)
+def test_generate_errors(server_url, body, status):
+    response = requests.post(f"{server_url}/generate", json=body)
+    assert response.status_code == status
+    assert response.json()["error"]
+
+
+def test_unexpected_error(server_url, monkeypatch):
+    def fail(self, request_options):
+        raise KeyError("boom")
+
+    monkeypatch.setattr(SpecGenerator, "generate", fail)
+    response = requests.post(f"{server_url}/generate", json={"package": "click"})
+    assert response.status_code == 500
+    assert "boom" in response.json()["error"]
+    # The server keeps serving
+    assert requests.get(f"{server_url}/health").json() == {"status": "ok"}
+
+
+def test_unknown_endpoint(server_url):
+    assert requests.get(f"{server_url}/health").json() == {"status": "ok"}
+    assert requests.post(f"{server_url}/nope", json={}).status_code == 404
+
+
+def test_unix_socket(cassettes_session, tmp_path):
+    socket_path = str(tmp_path / "pyp2spec.sock")
+    server = create_server(SpecGenerator({}, cassettes_session), socket_path=socket_path)
+    serve(server)
+    body = json.dumps({"package": "click", "version": "8.1.7"}).encode()
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(socket_path)
+            client.sendall(
+                b"POST /generate HTTP/1.0\r\nContent-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body
+            )
+            response = b""
+            while (chunk := client.recv(65536)):
+                response += chunk
+    finally:
+        server.shutdown()
+        server.server_close()
+    headers, _, payload = response.partition(b"\r\n\r\n")
+    assert headers.startswith(b"HTTP/1.0 200")
+    assert json.loads(payload)["config"]["pypi_version"] == "8.1.7"
+
+
+def test_unix_socket_path_is_not_a_socket(cassettes_session, tmp_path):
+    path = tmp_path / "important.txt"
+    path.write_text("data")
+    with pytest.raises(ServerError):
+        create_server(SpecGenerator({}, cassettes_session), socket_path=str(path))
+    assert path.read_text() == "data"
+
+
+def test_stale_unix_socket_is_replaced(cassettes_session, tmp_path):
+    socket_path = str(tmp_path / "pyp2spec.sock")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale:
+        stale.bind(socket_path)
+    server = create_server(SpecGenerator({}, cassettes_session), socket_path=socket_path)
+    server.server_close()
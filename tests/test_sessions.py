@@ -0,0 +1,67 @@
+import threading
+
+import pytest
+
+from pyp2spec.pypi_loaders import PackageNotFoundError, _get_from_url, load_from_pypi
+from pyp2spec.sessions import CachingAdapter, create_session, get_session
+
+
+def test_shared_session_is_reused():
+    assert get_session() is get_session()
+    assert get_session() is not get_session(pool_size=1)
+
+
+def test_shared_session_with_cache(tmp_path):
+    session = get_session(cache_dir=str(tmp_path))
+    assert isinstance(session.get_adapter("https://pypi.org"), CachingAdapter)
+    assert session.get_adapter("https://pypi.org") is session.get_adapter("https://files.pythonhosted.org")
+
+
+def test_pool_size_is_configured():
+    adapter = create_session(pool_size=3, pool_block=True).get_adapter("https://pypi.org")
+    assert adapter._pool_maxsize == 3
+    assert adapter._pool_block
+
+
+@pytest.mark.parametrize("status", [429, 500, 503])
+def test_failed_requests_are_retried(fake_pypi, status):
+    fake_pypi.add_json("/pypi/foo/json", {"info": {"version": "1.0"}})
+    fake_pypi.fail("/pypi/foo/json", status, times=2)
+    session = create_session(retries=2, backoff_factor=0)
+
+    response = _get_from_url(fake_pypi.url + "/pypi/foo/json", "error", session=session)
+    assert response.json() == {"info": {"version": "1.0"}}
+    assert fake_pypi.count() == 3
+
+
+def test_retries_are_exhausted(fake_pypi):
+    fake_pypi.add_json("/pypi/foo/json", {"info": {"version": "1.0"}})
+    fake_pypi.fail("/pypi/foo/json", 503, times=5)
+    session = create_session(retries=1, backoff_factor=0)
+
+    with pytest.raises(PackageNotFoundError):
+        _get_from_url(fake_pypi.url + "/pypi/foo/json", "error", session=session)
+    assert fake_pypi.count() == 2
+
+
+def test_not_found_is_not_retried(fake_pypi):
+    session = create_session(retries=3, backoff_factor=0)
+
+    with pytest.raises(PackageNotFoundError):
+        _get_from_url(fake_pypi.url + "/pypi/foo/json", "error", session=session)
+    assert fake_pypi.count() == 1
+
+
+def test_failed_streamed_requests_release_the_connections(fake_pypi):
+    # Each leaked connection would block a slot of the pool for good
+    session = create_session(pool_size=2, pool_block=True)
+
+    def load_missing():
+        for i in range(4):
+            with pytest.raises(PackageNotFoundError):
+                load_from_pypi(f"missing{i}", compat="1", index_url=fake_pypi.url, session=session)
+
+    thread = threading.Thread(target=load_missing, daemon=True)
+    thread.start()
+    thread.join(timeout=10)
+    assert not thread.is_alive()
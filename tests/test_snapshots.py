@@ -0,0 +1,87 @@
+"""Test generating the files offline from the snapshots of PyPI data.
+The snapshots are recorded from the betamax cassettes.
+"""
+import pytest
+
+try:
+    import tomllib
+except ImportError:
+    import tomli as tomllib
+
+from pyp2spec.archives import read_wheel_metadata
+from pyp2spec.pyp2conf import create_config_contents
+from pyp2spec.pypi_loaders import PackageNotFoundError, _get_from_url
+from pyp2spec.sessions import create_session
+from pyp2spec.snapshots import SnapshotError, open_snapshot, record_snapshot, url_to_path, write_snapshot
+
+from test_archives import METADATA, make_wheel
+
+
+@pytest.mark.parametrize(
+    ("url", "path"), [
+        ("https://pypi.org/pypi/click/json", "pypi/click/json"),
+        ("https://pypi.org/pypi/click/8.1.7/json", "pypi/click/8.1.7/json"),
+        ("https://files.pythonhosted.org/packages/00/aa/click-8.1.7-py3-none-any.whl.metadata",
+            "packages/00/aa/click-8.1.7-py3-none-any.whl.metadata"),
+        ("https://pypi.org/simple/click/", "simple/click/index.v1_json"),
+        ("https://example.com/a%20b.json?job=json", "a b.json"),
+    ]
+)
+def test_url_to_path(url, path):
+    assert url_to_path(url) == path
+
+
+def test_url_to_path_outside_of_snapshot():
+    with pytest.raises(SnapshotError):
+        url_to_path("https://pypi.org/pypi/%2E%2E/%2E%2E/etc/passwd")
+
+
+@pytest.fixture
+def recorded_files(cassettes_session):
+    packages = [
+        {"package": "click", "version": "8.1.7"},
+        {"package": "pytest", "compat": "7.2", "version": "7.2.1"},
+        {"package": "definitely-nonexisting-package-name"},
+    ]
+    files, failed = record_snapshot(packages, cassettes_session)
+    assert failed == ["definitely-nonexisting-package-name"]
+    assert "pypi/click/8.1.7/json" in files
+    return files
+
+
+@pytest.mark.parametrize("name", ["snapshot", "snapshot.zip", "snapshot.sqlite"])
+def test_generate_from_snapshot(recorded_files, tmp_path, name):
+    write_snapshot(tmp_path / name, recorded_files)
+    session = create_session(snapshot=str(tmp_path / name))
+
+    contents = create_config_contents({"package": "click", "version": "8.1.7"}, session=session)
+    with open("tests/test_configs/default_python-click.conf", "rb") as config_file:
+        assert contents == tomllib.load(config_file)
+    contents = create_config_contents({"package": "pytest", "compat": "7.2", "version": "7.2.1"}, session=session)
+    assert contents["pypi_version"] == "7.2.1"
+
+    # Whatever is not in the snapshot is not found, there's no network access
+    with pytest.raises(PackageNotFoundError):
+        _get_from_url("https://pypi.org/pypi/numpy/json", "not found", session=session)
+
+
+def test_snapshot_is_extended(tmp_path):
+    write_snapshot(tmp_path / "snapshot.zip", {"pypi/foo/json": b"{}"})
+    write_snapshot(tmp_path / "snapshot.zip", {"pypi/bar/json": b"[]"})
+    snapshot = open_snapshot(tmp_path / "snapshot.zip")
+    assert snapshot.read("pypi/foo/json") == b"{}"
+    assert snapshot.read("pypi/bar/json") == b"[]"
+    assert snapshot.read("pypi/baz/json") is None
+
+
+def test_wheel_metadata_read_from_snapshot(tmp_path):
+    write_snapshot(tmp_path / "snapshot.sqlite", {"packages/foo-1.0-py3-none-any.whl": make_wheel()})
+    session = create_session(snapshot=str(tmp_path / "snapshot.sqlite"))
+    url = "https://files.pythonhosted.org/packages/foo-1.0-py3-none-any.whl"
+    assert read_wheel_metadata(url, session) == METADATA
+
+
+def test_invalid_snapshot(tmp_path):
+    (tmp_path / "snapshot.bin").write_bytes(b"garbage")
+    with pytest.raises(SnapshotError):
+        open_snapshot(tmp_path / "snapshot.bin")
@@ -0,0 +1,46 @@
+"""Test that the command line tools start quickly.
+The slow to import dependencies must only be imported when they're needed.
+"""
+import subprocess
+import sys
+
+import pytest
+
+
+# The time spent importing modules for `--help`, in microseconds.
+# It takes ~30 ms for conf2spec and ~60 ms for pyp2spec on a recent laptop,
+# the budget leaves a lot of room for slow CI machines.
+STARTUP_BUDGET = 300_000
+HEAVY_MODULES = ("jinja2", "requests", "license_expression", "packaging.metadata", "tomli_w")
+
+
+def import_times(module):
+    """Return the list of (module name, cumulative import time, is top-level)
+    for the imports made by `python -m <module> --help`."""
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", module, "--help"],
+        capture_output=True, text=True, check=True,
+    )
+    times = []
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # Nested imports are indented
+        times.append((name.strip(), int(cumulative), not name[1:].startswith(" ")))
+    return times
+
+
+@pytest.mark.parametrize("module", ["pyp2spec.conf2spec", "pyp2spec.pyp2spec"])
+def test_help_doesnt_import_heavy_modules(module):
+    imported = {name for name, _, _ in import_times(module)}
+    assert not imported & set(HEAVY_MODULES)
+
+
+@pytest.mark.parametrize("module", ["pyp2spec.conf2spec", "pyp2spec.pyp2spec"])
+def test_help_startup_budget(module):
+    # site is the interpreter startup, not ours to optimize
+    total = sum(time for name, time, top_level in import_times(module) if top_level and name != "site")
+    assert total < STARTUP_BUDGET
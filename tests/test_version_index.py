@@ -0,0 +1,27 @@
+from pyp2spec import version_index
+from pyp2spec.http_cache import HTTPCache
+from pyp2spec.version_index import VersionIndex, get_version_index
+
+
+def test_index_is_sorted_by_release():
+    index = VersionIndex.from_versions(["1.10", "1.2rc1", "1.2", "1!0.1", "0.9", "not-a-version"])
+    assert [entry[3] for entry in index.entries] == ["0.9", "1.2rc1", "1.2", "1.10", "1!0.1"]
+
+
+def test_index_is_reused_in_process():
+    versions = ["1.0", "1.1", "2.0"]
+    assert get_version_index(versions) is get_version_index(list(versions))
+
+
+def test_index_is_persisted_in_cache(tmp_path, monkeypatch):
+    versions = ["1.0", "1.1", "2.0", "1.1.post1"]
+    cache = HTTPCache(tmp_path)
+    index = get_version_index(versions, cache)
+
+    # A new process, the index is loaded from the disk without parsing the versions
+    monkeypatch.setattr(version_index, "VERSION_INDEXES", version_index.OrderedDict())
+    monkeypatch.setattr(VersionIndex, "from_versions", None)
+    loaded = get_version_index(versions, HTTPCache(tmp_path))
+    assert loaded is not index
+    assert loaded.entries == index.entries
+    assert loaded.find_compatible("1") == "1.1.post1"